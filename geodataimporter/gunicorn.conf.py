@@ -0,0 +1,34 @@
+"""
+Configuração do gunicorn (modo produção do startup.sh).
+
+Tudo é ajustável por variável de ambiente; veja .env.example.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:8000")
+
+# SERVIDOR=asgi usa os workers do uvicorn sobre geodataimporter.asgi
+if os.getenv("SERVIDOR", "dev").strip().lower() == "asgi":
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    worker_class = "gthread"
+    threads = int(os.getenv("WEB_THREADS", "4"))
+
+workers = int(os.getenv("WEB_WORKERS", str(multiprocessing.cpu_count() * 2 + 1)))
+
+# Uploads grandes e exportações podem levar minutos
+timeout = int(os.getenv("WEB_TIMEOUT", "600"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+
+# Carrega o Django uma vez no master e compartilha via fork (o GDAL só é
+# importado pelos workers quando uma rota de upload/exportação o usa)
+preload_app = os.getenv("WEB_PRELOAD", "1") == "1"
+
+# Recicla workers periodicamente para conter o crescimento de memória do GDAL
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("WEB_MAX_REQUESTS_JITTER", "100"))
+
+accesslog = "-"
+errorlog = "-"
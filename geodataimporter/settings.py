@@ -25,6 +25,30 @@ DATABASES = {
     }
 }
 
+# Réplica somente leitura opcional para as leituras da API (importservice.roteamento)
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'USER': os.getenv('DB_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.getenv('DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'OPTIONS': {'connect_timeout': int(os.getenv('DB_REPLICA_TIMEOUT', '2'))},
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['importservice.roteamento.RoteadorReplica']
+
+# Cache compartilhado entre os workers (respostas das listagens, chaveadas pela
+# geração do catálogo); a tabela é criada por createcachetable no startup.sh
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'importservice_cache',
+        'TIMEOUT': int(os.getenv('CACHE_RESPOSTAS_TTL', '3600')),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_RESPOSTAS_MAX', '5000'))},
+    }
+}
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -61,6 +85,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "importservice.roteamento.LeituraReplicaMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
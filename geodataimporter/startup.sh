@@ -6,14 +6,36 @@ if [ ! -f "$CONTAINER_ALREADY_STARTED" ]; then
     touch "$CONTAINER_ALREADY_STARTED"
     echo "-- First container startup --"
     # YOUR_FIRST_TIME_SETUP_COMMANDS_HERE
-    python manage.py makemigrations
-    python manage.py migrate
     #python manage.py collectstatic
 else
     echo "-- Not first container startup --"
     # YOUR_REGULAR_STARTUP_COMMANDS_HERE (if any)
 
 fi
-python manage.py runserver 0.0.0.0:8000
+# Modelos do Django a cada início (idempotente): tabelas e colunas novas chegam às instalações existentes
+python manage.py makemigrations
+python manage.py migrate
+# Tabelas de geometria: migrações versionadas (só aplica o que faltar)
+python manage.py migrar_esquema
+# Cache compartilhado das respostas (idempotente)
+python manage.py createcachetable
+# Importações da fila e expurgos de remoção num processo próprio: os workers web são reciclados
+# (WEB_MAX_REQUESTS) e derrubados no deploy. O laço reinicia o worker se ele cair.
+export PROCESSAMENTO_FILA="${PROCESSAMENTO_FILA:-worker}"
+if [ "$PROCESSAMENTO_FILA" = "worker" ]; then
+    (while true; do python manage.py processar_fila --continuo; sleep 5; done) &
+fi
+# SERVIDOR: dev (runserver, processo único) | wsgi | asgi (gunicorn multi-processo)
+case "${SERVIDOR:-dev}" in
+    wsgi)
+        gunicorn -c geodataimporter/gunicorn.conf.py geodataimporter.wsgi:application
+        ;;
+    asgi)
+        gunicorn -c geodataimporter/gunicorn.conf.py geodataimporter.asgi:application
+        ;;
+    *)
+        python manage.py runserver 0.0.0.0:8000
+        ;;
+esac
 # Keep the container running (e.g., if it's a server)
 exec "$@"
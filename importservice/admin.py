@@ -3,7 +3,9 @@ from importservice.models import (
     RepresentacaoGrafica,
     HistoricoImportacaoExclusao,
     ProdutoGeoespacial,
-    ProductIndex
+    ProductIndex,
+    RemocaoProduto,
+    FilaImportacao
 )
 
 # -----------------------------
@@ -31,7 +33,7 @@ class HistoricoImportacaoExclusaoAdmin(admin.ModelAdmin):
 # -----------------------------
 @admin.register(ProdutoGeoespacial)
 class ProdutoGeoespacialAdmin(admin.ModelAdmin):
-    list_display = ['metadata_id', 'nome_arquivo', 'data_do_produto', 'data_importacao', 'esquema', 'escala']
+    list_display = ['metadata_id', 'nome_arquivo', 'data_do_produto', 'data_importacao', 'esquema', 'escala', 'quantidade_feicoes']
     list_filter = ['esquema', 'escala', 'data_importacao']
     search_fields = ['metadata_id', 'nome_arquivo', 'esquema']
     ordering = ['-data_importacao']
@@ -45,3 +47,23 @@ class ProductIndexAdmin(admin.ModelAdmin):
     list_filter = ['date', 'scale']
     search_fields = ['metadataid', 'file_path']
     ordering = ['-date']
+
+# -----------------------------
+# Remocao Produto Admin
+# -----------------------------
+@admin.register(RemocaoProduto)
+class RemocaoProdutoAdmin(admin.ModelAdmin):
+    list_display = ['metadata_id', 'classe', 'status', 'removidas', 'total', 'solicitado_em', 'concluido_em']
+    list_filter = ['status', 'solicitado_em']
+    search_fields = ['metadata_id', 'classe']
+    ordering = ['-solicitado_em']
+
+# -----------------------------
+# Fila Importacao Admin
+# -----------------------------
+@admin.register(FilaImportacao)
+class FilaImportacaoAdmin(admin.ModelAdmin):
+    list_display = ['nome', 'metadata_id', 'status', 'bytes', 'solicitado_em', 'iniciado_em', 'concluido_em', 'worker']
+    list_filter = ['status', 'solicitado_em']
+    search_fields = ['nome', 'metadata_id']
+    ordering = ['-solicitado_em']
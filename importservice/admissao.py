@@ -0,0 +1,340 @@
+"""
+Controle de admissão das importações enviadas pela API.
+
+Cada arquivo aceito vira uma linha de FilaImportacao. Quem decide o que começa
+é despachar(), serializado entre todos os processos (workers do gunicorn,
+uvicorn, comandos) por um advisory lock de transação: inicia os itens mais
+antigos enquanto houver menos de ADMISSAO_MAX_IMPORTACOES em andamento e a soma
+dos bytes em andamento couber em ADMISSAO_MAX_BYTES (um arquivo maior que o
+limite só começa sozinho). Com ADMISSAO_MAX_FILA itens aguardando, novos
+uploads são recusados (429 com Retry-After).
+
+Cada importação em andamento segura, numa conexão própria, um advisory lock de
+sessão com o id do item. Se o processo morrer, o lock cai junto com a conexão
+e o próximo despachar() devolve o item à fila.
+
+Os comandos que importam no próprio processo (import_folder, observar_pasta)
+ocupam uma vaga com vaga_local(): um item 'importando' com o mesmo lock, que
+conta nos limites como os itens despachados.
+
+Com PROCESSAMENTO_FILA=worker (o startup.sh), as importações rodam só no
+processo dedicado de manage.py processar_fila --continuo, que despacha a cada
+poucos segundos; os workers web apenas enfileiram.
+"""
+import heapq
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from . import banco, remocao
+from .models import FilaImportacao, HistoricoImportacaoExclusao, ProdutoGeoespacial, RemocaoProduto
+
+ADMISSAO_MAX_IMPORTACOES = int(os.getenv("ADMISSAO_MAX_IMPORTACOES", "2"))
+ADMISSAO_MAX_BYTES = int(os.getenv("ADMISSAO_MAX_BYTES", str(2 * 1024 ** 3)))
+ADMISSAO_MAX_FILA = int(os.getenv("ADMISSAO_MAX_FILA", "20"))
+# Vazão (bytes/s por importação) das estimativas enquanto o histórico não tem importações medidas
+ADMISSAO_VAZAO_PADRAO = float(os.getenv("ADMISSAO_VAZAO_PADRAO", str(5 * 1024 ** 2)))
+
+STATUS_ATIVOS = ['aguardando', 'importando']
+
+CHAVE_ADMISSAO = "importacao_admissao"  # lock do despacho (pg_advisory_xact_lock)
+CHAVE_ITEM = "importacao_fila"          # lock de cada item em andamento (classe do lock de dois inteiros)
+
+
+class FilaCheia(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Fila de importação cheia ({ADMISSAO_MAX_FILA} arquivos aguardando).")
+        self.retry_after = retry_after
+
+
+def _fila():
+    # Sempre no primário: com a réplica, posição e status viriam atrasados
+    return FilaImportacao.objects.using("default")
+
+
+def _travar_despacho():
+    with connection.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [CHAVE_ADMISSAO])
+
+
+# ------------------------ ESTIMATIVAS ------------------------
+def vazao():
+    """Bytes/s por importação, média das últimas importações medidas no histórico."""
+    recentes = list(
+        HistoricoImportacaoExclusao.objects.using("default")
+        .filter(acao='adicionado', bytes__gt=0, duracao_s__gt=0)
+        .order_by('-data_evento', '-id')
+        .values_list('bytes', 'duracao_s')[:20]
+    )
+    total_s = sum(duracao for _, duracao in recentes)
+    return sum(tamanho for tamanho, _ in recentes) / total_s if total_s else ADMISSAO_VAZAO_PADRAO
+
+
+def estimativas():
+    """
+    {id: (posição, segundos até começar)} dos itens aguardando. Simula as vagas:
+    cada importação em andamento libera a sua quando termina de processar seus
+    bytes na vazão do histórico, e cada item da fila ocupa a primeira que vagar.
+    """
+    bytes_s = vazao()
+    agora = timezone.now()
+    vagas = []
+    for iniciado_em, tamanho in _fila().filter(status='importando').values_list('iniciado_em', 'bytes'):
+        decorrido = (agora - iniciado_em).total_seconds() if iniciado_em else 0
+        vagas.append(max(0.0, tamanho / bytes_s - decorrido))
+    vagas += [0.0] * max(0, ADMISSAO_MAX_IMPORTACOES - len(vagas))
+    heapq.heapify(vagas)
+
+    resultado = {}
+    aguardando = _fila().filter(status='aguardando').order_by('solicitado_em', 'id').values_list('id', 'bytes')
+    for posicao, (item_id, tamanho) in enumerate(aguardando, start=1):
+        inicio = heapq.heappop(vagas)
+        resultado[item_id] = (posicao, round(inicio))
+        heapq.heappush(vagas, inicio + tamanho / bytes_s)
+    return resultado
+
+
+def tempo_de_espera():
+    """Segundos até o primeiro da fila começar (e abrir lugar para mais um): o Retry-After."""
+    primeiro = min((eta for _, eta in estimativas().values()), default=0)
+    return max(5, primeiro)
+
+
+# ------------------------ ADMISSÃO ------------------------
+def _cheia(quantidade):
+    """True se, descontadas as vagas livres, a fila passaria de ADMISSAO_MAX_FILA com mais 'quantidade' itens."""
+    importando = _fila().filter(status='importando').count()
+    aguardando = _fila().filter(status='aguardando').count()
+    livres = max(0, ADMISSAO_MAX_IMPORTACOES - importando)
+    return aguardando + quantidade - livres > ADMISSAO_MAX_FILA
+
+
+def verificar_capacidade(quantidade):
+    """
+    Checagem do upload antes de gravar os arquivos: levanta FilaCheia se
+    'quantidade' arquivos não caberiam. Sem lock; enfileirar() confere de novo.
+    """
+    if _cheia(quantidade):
+        raise FilaCheia(tempo_de_espera())
+
+
+def enfileirar(arquivos, usuario=None):
+    """
+    Coloca na fila os arquivos ([{nome, arquivo, xml, metadata_id, modo, bytes}])
+    e despacha. Admite todos ou nenhum: levanta FilaCheia se, descontadas as
+    vagas livres, a fila passaria de ADMISSAO_MAX_FILA.
+    """
+    with transaction.atomic(using="default"):
+        _travar_despacho()
+        cheia = _cheia(len(arquivos))
+        if not cheia:
+            itens = [_fila().create(usuario=usuario, **dados) for dados in arquivos]
+    if cheia:
+        raise FilaCheia(tempo_de_espera())
+    if banco.processamento_em_thread():
+        despachar()
+    return itens
+
+
+def _orfao(item_id):
+    """True se ninguém segura o lock do item (o processo que o importava morreu)."""
+    with connection.cursor() as cur:
+        cur.execute("SELECT pg_try_advisory_lock(hashtext(%s), %s)", [CHAVE_ITEM, item_id])
+        livre = cur.fetchone()[0]
+        if livre:
+            cur.execute("SELECT pg_advisory_unlock(hashtext(%s), %s)", [CHAVE_ITEM, item_id])
+    return livre
+
+
+def _travar_item(item_id):
+    """Conexão dedicada segurando o lock do item até a importação terminar."""
+    conn = psycopg2.connect(**banco.CONFIG_BANCO)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(hashtext(%s), %s)", (CHAVE_ITEM, item_id))
+    return conn
+
+
+def _em_andamento():
+    """Itens 'importando' ainda vivos; os de processos que morreram voltam à fila. Sob _travar_despacho()."""
+    em_andamento = []
+    for item in _fila().filter(status='importando'):
+        if _orfao(item.pk):
+            if not item.arquivo:
+                # Vaga de um comando (vaga_local) que caiu: não há o que reimportar pela fila
+                _fila().filter(pk=item.pk).update(status='erro', erro="Processo interrompido.", concluido_em=timezone.now())
+                continue
+            banco.safe_print(f"⚠️ Importação de '{item.nome}' ({item.worker}) interrompida; voltando à fila.")
+            _fila().filter(pk=item.pk).update(status='aguardando', iniciado_em=None, worker=None)
+        else:
+            em_andamento.append(item)
+    return em_andamento
+
+
+def _cabe(ocupadas, bytes_ocupados, tamanho):
+    """Os limites de admissão: um arquivo maior que ADMISSAO_MAX_BYTES só começa sozinho."""
+    if ocupadas >= ADMISSAO_MAX_IMPORTACOES:
+        return False
+    return not ocupadas or bytes_ocupados + tamanho <= ADMISSAO_MAX_BYTES
+
+
+def despachar():
+    """
+    Devolve à fila os itens de processos que morreram e inicia, em threads deste
+    processo, os próximos que cabem nos limites (ordem de chegada estrita: um
+    arquivo grande à frente não é ultrapassado). Devolve quantos iniciou.
+    """
+    iniciar = []
+    try:
+        with transaction.atomic(using="default"):
+            _travar_despacho()
+            em_andamento = _em_andamento()
+            ocupadas = len(em_andamento)
+            bytes_ocupados = sum(item.bytes for item in em_andamento)
+            for item in _fila().filter(status='aguardando').order_by('solicitado_em', 'id'):
+                if not _cabe(ocupadas, bytes_ocupados, item.bytes):
+                    break
+                # O lock do item é tomado antes do status mudar: nenhum despacho o vê como órfão
+                iniciar.append((item.pk, _travar_item(item.pk)))
+                _fila().filter(pk=item.pk).update(
+                    status='importando', iniciado_em=timezone.now(), worker=banco.identificador_processo()
+                )
+                ocupadas += 1
+                bytes_ocupados += item.bytes
+    except Exception:
+        for _, trava in iniciar:
+            trava.close()
+        raise
+
+    for item_id, trava in iniciar:
+        threading.Thread(
+            target=_importacao_thread, args=(item_id, trava),
+            name=f"importacao-{item_id}", daemon=True
+        ).start()
+    return len(iniciar)
+
+
+@contextmanager
+def vaga_local(caminho, modo=None, intervalo=5.0):
+    """
+    Vaga de admissão para quem importa no próprio processo (import_folder,
+    observar_pasta): espera os mesmos limites de despachar(), sem passar à
+    frente de quem já aguardava, e ocupa a vaga com um item 'importando' (com o
+    lock do item) até o fim do bloco. O item fica sem 'arquivo': se o processo
+    cair, não volta à fila. Quem importa preenche item.metadata_id e
+    item.quantidade_feicoes, gravados ao sair.
+    """
+    tamanho = os.path.getsize(caminho)
+    chegada = timezone.now()
+    avisado = False
+    while True:
+        trava = None
+        try:
+            with transaction.atomic(using="default"):
+                _travar_despacho()
+                em_andamento = _em_andamento()
+                adiante = _fila().filter(status='aguardando', solicitado_em__lt=chegada).exists()
+                if not adiante and _cabe(len(em_andamento), sum(i.bytes for i in em_andamento), tamanho):
+                    item = _fila().create(
+                        nome=os.path.basename(caminho)[:256], arquivo="", metadata_id="", modo=modo,
+                        bytes=tamanho, status='importando', iniciado_em=timezone.now(),
+                        worker=banco.identificador_processo()
+                    )
+                    trava = _travar_item(item.pk)
+        except Exception:
+            if trava:
+                trava.close()
+            raise
+        if trava:
+            break
+        if not avisado:
+            banco.safe_print(f"⏳ {os.path.basename(caminho)}: aguardando vaga na fila de importação.")
+            avisado = True
+        time.sleep(intervalo)
+
+    try:
+        yield item
+    except BaseException as e:
+        _fila().filter(pk=item.pk).update(
+            status='erro', erro=str(e) or type(e).__name__, metadata_id=item.metadata_id,
+            concluido_em=timezone.now()
+        )
+        raise
+    else:
+        _fila().filter(pk=item.pk).update(
+            status='concluido', metadata_id=item.metadata_id,
+            quantidade_feicoes=item.quantidade_feicoes, concluido_em=timezone.now()
+        )
+    finally:
+        trava.close()  # libera a vaga para os outros processos
+
+
+# ------------------------ IMPORTAÇÃO ------------------------
+def _importacao_thread(item_id, trava):
+    try:
+        importar(item_id)
+    except Exception:
+        pass  # já registrado no item (status 'erro')
+    finally:
+        trava.close()  # libera a vaga para os outros processos
+        try:
+            despachar()
+        except Exception as e:
+            banco.safe_print(f"❌ Erro ao despachar a fila de importação: {e}")
+        close_old_connections()
+
+
+def importar(item_id):
+    """Importa um item da fila e grava o histórico, como a importação direta fazia."""
+    from . import ogr_importer  # GDAL só é carregado por quem importa
+
+    item = _fila().get(pk=item_id)
+
+    # As condições checadas no upload podem ter mudado enquanto o item esperava
+    aviso = None
+    existe = ProdutoGeoespacial.objects.using("default").filter(metadata_id=item.metadata_id).exists()
+    removendo = RemocaoProduto.objects.using("default").filter(
+        metadata_id=item.metadata_id, status__in=remocao.STATUS_ATIVOS
+    ).exists()
+    if removendo:
+        aviso = f"Remoção do metadata_id '{item.metadata_id}' em andamento. Envie novamente ao final."
+    elif existe and item.modo != "diferencial":
+        aviso = f"Arquivo com metadata_id '{item.metadata_id}' já existe no banco. Importação ignorada."
+    if aviso:
+        _fila().filter(pk=item_id).update(status='ignorado', erro=aviso, concluido_em=timezone.now())
+        return
+
+    estatisticas = {}
+    try:
+        feicoes = ogr_importer.importar_para_tabela(
+            item.arquivo,
+            banco.TABELA_GEOMETRIAS,
+            xml_locator=tuple(item.xml) if item.xml else None,
+            modo=item.modo,
+            estatisticas=estatisticas
+        )
+    except Exception as e:
+        banco.safe_print(f"Erro ao importar {item.nome}: {e}")
+        _fila().filter(pk=item_id).update(status='erro', erro=str(e), concluido_em=timezone.now())
+        raise
+
+    _fila().filter(pk=item_id).update(
+        status='concluido', quantidade_feicoes=feicoes, concluido_em=timezone.now()
+    )
+
+    # A importação já foi confirmada: uma falha no histórico não a marca como erro
+    try:
+        HistoricoImportacaoExclusao.objects.create(
+            classe=None,
+            acao='adicionado',
+            usuario_id=item.usuario_id,
+            detalhes=f"Arquivo {item.nome} {'reimportado (diferencial)' if existe else 'importado'} com sucesso.",
+            **estatisticas
+        )
+    except Exception as e:
+        banco.safe_print(f"❌ Erro ao gravar o histórico da importação de {item.nome}: {e}")
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ImportserviceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'importservice'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,470 @@
+"""
+Configuração do banco e helpers SQL sem dependência do GDAL.
+
+As views baratas (listagens, consultas, histórico) e a remoção em segundo plano
+usam só este módulo; o ogr_importer (que carrega osgeo) é importado sob demanda
+nas rotas de upload e exportação.
+"""
+import hashlib
+import os
+import re
+import socket
+import time
+import unicodedata
+from dotenv import load_dotenv
+import psycopg2
+
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+# Configurações do banco
+CONFIG_BASE = {
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "host": os.getenv("DB_HOST"),
+    "port": os.getenv("DB_PORT"),
+}
+CONFIG_BANCO = {**CONFIG_BASE, "dbname": os.getenv("DB_NAME")}
+# Réplica somente leitura (opcional): com DB_REPLICA_HOST as leituras da API vão
+# para ela; os campos não informados repetem os do primário
+CONFIG_REPLICA = None
+if os.getenv("DB_REPLICA_HOST"):
+    CONFIG_REPLICA = {
+        "user": os.getenv("DB_REPLICA_USER", CONFIG_BASE["user"]),
+        "password": os.getenv("DB_REPLICA_PASSWORD", CONFIG_BASE["password"]),
+        "host": os.getenv("DB_REPLICA_HOST"),
+        "port": os.getenv("DB_REPLICA_PORT", CONFIG_BASE["port"]),
+        "dbname": os.getenv("DB_REPLICA_NAME", CONFIG_BANCO["dbname"]),
+    }
+# Timeout de conexão à réplica (s) e por quanto tempo ela fica fora após uma falha
+REPLICA_TIMEOUT = int(os.getenv("DB_REPLICA_TIMEOUT", "2"))
+REPLICA_ESPERA = float(os.getenv("DB_REPLICA_ESPERA", "30"))
+# Onde rodam as importações da fila e os expurgos: 'worker' (processo dedicado,
+# manage.py processar_fila --continuo, iniciado pelo startup.sh) ou 'thread'
+# (threads do próprio processo web; só para desenvolvimento com runserver)
+PROCESSAMENTO_FILA = os.getenv("PROCESSAMENTO_FILA", "thread").strip().lower()
+TABELA_GEOMETRIAS = "importacao_geometrias"
+TABELA_GLOBAL = TABELA_GEOMETRIAS  # nome usado pelas views e testes
+# Armazenamento normalizado; TABELA_GEOMETRIAS é a view de compatibilidade sobre estas
+TABELA_FEICOES = "importacao_feicoes"
+TABELA_PRODUTOS = "importacao_produtos"
+TABELA_CLASSES = "importacao_classes"
+TABELA_CATALOGO = "importservice_produtogeoespacial"
+TABELA_REMOCOES = "importservice_remocaoproduto"
+TABELA_GRUPOS = "importacao_grupos"
+TABELA_GERACAO = "importservice_geracaocatalogo"
+TABELA_ESTATISTICAS = "importacao_estatisticas"
+TABELA_REMAPEAMENTOS = "importservice_remapeamentogrupo"
+
+FORMATOS_EXPORTACAO = {
+    # formato: (driver OGR, extensão, um arquivo por classe)
+    "gpkg": ("GPKG", ".gpkg", False),
+    "fgb": ("FlatGeobuf", ".fgb", True),
+}
+
+def safe_print(msg):
+    print(msg, flush=True)
+
+def processamento_em_thread():
+    """True quando o processo web inicia ele mesmo as importações e os expurgos."""
+    return PROCESSAMENTO_FILA != "worker"
+
+def identificador_processo():
+    """'host:pid' do processo que executa a importação/remoção (gravado no histórico)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+_replica_fora_ate = 0.0
+
+def replica_disponivel():
+    """Réplica configurada e sem falha de conexão nos últimos REPLICA_ESPERA segundos."""
+    return CONFIG_REPLICA is not None and time.monotonic() >= _replica_fora_ate
+
+def marcar_replica_indisponivel(erro):
+    global _replica_fora_ate
+    _replica_fora_ate = time.monotonic() + REPLICA_ESPERA
+    safe_print(f"⚠️ Réplica de leitura indisponível ({erro}); usando o primário por {REPLICA_ESPERA:.0f}s.")
+
+def conectar_leitura():
+    """
+    Conexão somente leitura para as consultas da API e exportações: a réplica
+    quando configurada e no ar, senão o primário.
+    """
+    if replica_disponivel():
+        try:
+            conn = psycopg2.connect(**CONFIG_REPLICA, connect_timeout=REPLICA_TIMEOUT)
+            conn.set_session(readonly=True)
+            return conn
+        except psycopg2.OperationalError as e:
+            marcar_replica_indisponivel(e)
+    conn = psycopg2.connect(**CONFIG_BANCO)
+    conn.set_session(readonly=True)
+    return conn
+
+def filtro_visivel(alias="g", coluna_classe=None):
+    """
+    Condição SQL que esconde feições de produtos (ou classes) com remoção pendente.
+    Enquanto o expurgo em lotes não termina, o registro em importservice_remocaoproduto
+    funciona como lápide para as listagens, consultas e camadas do QGIS.
+    'coluna_classe' substitui '<alias>.classe' quando a classe vem de outra tabela.
+    """
+    coluna_classe = coluna_classe or f"{alias}.classe"
+    return f"""NOT EXISTS (
+        SELECT 1 FROM {TABELA_REMOCOES} r
+        WHERE r.metadata_id = {alias}.metadata_id
+          AND (r.classe IS NULL OR r.classe = {coluna_classe})
+          AND r.status IN ('pendente', 'removendo', 'erro')
+    )"""
+
+def remover_do_catalogo(cur, metadata_id, classe=None, removidas=0):
+    """
+    Atualiza o catálogo após remover o produto inteiro ou apenas uma classe. Na
+    remoção de classe (chamada depois de apagadas as feições dela), a área mapeada
+    e o bbox são recalculados a partir das feições das classes restantes.
+    """
+    if classe is None:
+        cur.execute(f"DELETE FROM {TABELA_CATALOGO} WHERE metadata_id = %s", (metadata_id,))
+        cur.execute("DELETE FROM importservice_productindex WHERE metadataid::text = %s", (metadata_id,))
+        return
+    cur.execute(f"""
+        UPDATE {TABELA_CATALOGO} c
+        SET contagem_classes = c.contagem_classes - %s,
+            quantidade_feicoes = GREATEST(c.quantidade_feicoes - %s, 0),
+            area_mapeada = e.area,
+            bbox = CASE WHEN e.area IS NULL THEN NULL
+                        ELSE jsonb_build_array(ST_XMin(e.area), ST_YMin(e.area), ST_XMax(e.area), ST_YMax(e.area)) END
+        FROM (
+            SELECT ST_Transform(ST_MakeEnvelope(ST_XMin(x.ext), ST_YMin(x.ext), ST_XMax(x.ext), ST_YMax(x.ext), 3857), 4326) AS area
+            FROM (
+                SELECT ST_Extent(f.wkb_geometry) AS ext
+                FROM {TABELA_FEICOES} f
+                JOIN {TABELA_PRODUTOS} p ON p.id = f.produto_id
+                WHERE p.metadata_id = %s
+            ) x
+        ) e
+        WHERE c.metadata_id = %s;
+    """, (classe, removidas, metadata_id, metadata_id))
+
+def remover_chave_produto(cur, metadata_id):
+    """Apaga a linha do produto em TABELA_PRODUTOS quando não restam feições dele."""
+    cur.execute(f"""
+        DELETE FROM {TABELA_PRODUTOS} p
+        WHERE p.metadata_id = %s
+          AND NOT EXISTS (SELECT 1 FROM {TABELA_FEICOES} f WHERE f.produto_id = p.id)
+    """, (metadata_id,))
+
+def incrementar_geracao(cur):
+    """
+    Avança a geração do catálogo dentro da transação do chamador (psycopg2 ou
+    cursor do Django): quem lê a geração nova já enxerga os dados alterados.
+    """
+    cur.execute(f"""
+        INSERT INTO {TABELA_GERACAO} (id, geracao, alterado_em) VALUES (1, 1, now())
+        ON CONFLICT (id) DO UPDATE
+        SET geracao = {TABELA_GERACAO}.geracao + 1, alterado_em = now();
+    """)
+
+# ------------------------ GRUPOS DE REPRESENTAÇÃO ------------------------
+def _escopo_feicoes(metadata_ids=None, classes=None, alias="f"):
+    """Filtro SQL (sobre 'f', TABELA_FEICOES, ou outra tabela com produto_id/classe_id) limitando a produtos e/ou classes."""
+    sql, params = "", []
+    if metadata_ids is not None:
+        sql += f" AND {alias}.produto_id IN (SELECT id FROM {TABELA_PRODUTOS} WHERE metadata_id = ANY(%s))"
+        params.append(list(metadata_ids))
+    if classes is not None:
+        sql += f" AND {alias}.classe_id IN (SELECT id FROM {TABELA_CLASSES} WHERE lower(nome) = ANY(%s))"
+        params.append([c.lower() for c in classes])
+    return sql, params
+
+def mapear_grupos(cur, metadata_ids=None, classes=None):
+    """
+    Preenche graphic_representation_group a partir de importservice_representacaografica,
+    só nas feições dos produtos/classes informados (None = todas). O grupo de
+    cada classe × produto é resolvido de uma vez (classe+esquema, senão só a
+    classe, senão 'OUTRO') e só as feições cujo grupo muda são reescritas.
+    """
+    escopo, params = _escopo_feicoes(metadata_ids, classes)
+    cur.execute(f"""
+        WITH rep AS (
+          SELECT lower(trim(classe))   AS classe_norm,
+                 lower(trim(esquema))  AS esquema_norm,
+                 trim(coalesce(grupo_representacao,'OUTRO')) AS grupo
+          FROM importservice_representacaografica
+        ),
+        pares AS (
+          SELECT DISTINCT f.classe_id, f.produto_id FROM {TABELA_FEICOES} f WHERE true{escopo}
+        ),
+        alvo AS (
+          SELECT pr.classe_id, pr.produto_id, coalesce(
+                   -- 1) Join por classe+esquema (ambos normalizados em lower)
+                   nullif(nullif((SELECT min(r.grupo) FROM rep r
+                                  WHERE r.classe_norm = lower(c.nome) AND r.esquema_norm = lower(p.esquema)), ''), 'OUTRO'),
+                   -- 2) Fallback: onde não casou, usar só a classe (independente de esquema)
+                   nullif((SELECT min(r.grupo) FROM rep r WHERE r.classe_norm = lower(c.nome)), ''),
+                   -- 3) Garante valor
+                   'OUTRO') AS grupo
+          FROM pares pr
+          JOIN {TABELA_CLASSES} c ON c.id = pr.classe_id
+          JOIN {TABELA_PRODUTOS} p ON p.id = pr.produto_id
+        )
+        UPDATE {TABELA_FEICOES} f
+        SET graphic_representation_group = a.grupo
+        FROM alvo a
+        WHERE f.classe_id = a.classe_id
+          AND f.produto_id = a.produto_id
+          AND f.graphic_representation_group IS DISTINCT FROM a.grupo;
+    """, params)
+
+def aplicar_mapeamento_via_sql(table_name, metadata_ids=None):
+    try:
+        conn = psycopg2.connect(**CONFIG_BANCO)
+        cur = conn.cursor()
+
+        # Índice para acelerar o join (as feições já são indexadas por classe_id)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_importservice_rep_classe_esquema ON importservice_representacaografica (classe, esquema);")
+
+        mapear_grupos(cur, metadata_ids=metadata_ids)
+        atualizar_resumo_grupos(cur, metadata_ids)
+
+        conn.commit()
+        cur.close(); conn.close()
+        safe_print("✅ Esquema gravado como 'EDGV X.Y.Z' e grupos atualizados via SQL.")
+    except Exception as e:
+        print(f"❌ Erro ao atualizar grupos via SQL: {e}")
+
+def _nome_particao_grupo(grupo):
+    """'Vegetação' -> 'importacao_grupos_vegetacao' (limitado a 63 caracteres)."""
+    ascii_ = unicodedata.normalize("NFKD", grupo).encode("ascii", "ignore").decode()
+    sufixo = re.sub(r"[^a-z0-9]+", "_", ascii_.lower()).strip("_") or "sem_nome"
+    return f"{TABELA_GRUPOS}_{sufixo}"[:63]
+
+def criar_view_grupo(cur, particao):
+    """
+    View '<partição>_visiveis' que o QGIS usa como camada do grupo: lê só a
+    partição e esconde as feições com lápide, que ficam no resumo até o
+    expurgo apagá-las em lotes.
+    """
+    nome = f"{particao}_visiveis"
+    if len(nome) > 63:
+        nome = f"{particao[:45]}_{hashlib.md5(particao.encode()).hexdigest()[:8]}_visiveis"
+    cur.execute(f"""
+        CREATE OR REPLACE VIEW {nome} AS
+        SELECT s.* FROM {particao} s
+        WHERE {filtro_visivel("s")};
+    """)
+
+def _limites_particoes_grupos(cur):
+    cur.execute("""
+        SELECT pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s);
+    """, (TABELA_GRUPOS,))
+    return " ".join(r[0] for r in cur.fetchall())
+
+def _garantir_particoes_grupos(cur, grupos):
+    literais = {g: "'" + g.replace("'", "''") + "'" for g in grupos}
+    limites = _limites_particoes_grupos(cur)
+    faltando = [g for g in grupos if f"({literais[g]})" not in limites]
+    if not faltando:
+        return
+
+    # Serializa a criação entre importações concorrentes e confere de novo
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (TABELA_GRUPOS,))
+    limites = _limites_particoes_grupos(cur)
+    for grupo in faltando:
+        if f"({literais[grupo]})" in limites:
+            continue
+        nome = _nome_particao_grupo(grupo)
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (nome,))
+        if cur.fetchone()[0]:  # outro grupo com o mesmo nome normalizado
+            nome = f"{nome[:54]}_{hashlib.md5(grupo.encode()).hexdigest()[:8]}"
+        cur.execute(f"CREATE TABLE {nome} PARTITION OF {TABELA_GRUPOS} FOR VALUES IN ({literais[grupo]});")
+        criar_view_grupo(cur, nome)
+        safe_print(f"🗂️ Partição '{nome}' criada para o grupo '{grupo}'.")
+
+def atualizar_resumo_grupos(cur, metadata_ids=None):
+    """
+    Sincroniza o resumo por grupo (TABELA_GRUPOS) só para os metadata_ids
+    informados: apaga as linhas que deixaram de existir (ou de ser visíveis, ou
+    mudaram de grupo) e insere as que faltam; linhas inalteradas ficam
+    intactas. None recalcula tudo. Devolve o número de linhas inseridas.
+    """
+    if metadata_ids is not None:
+        metadata_ids = list(metadata_ids)
+        if not metadata_ids:
+            return 0
+        cur.execute(f"""
+            DELETE FROM {TABELA_GRUPOS} s
+            WHERE s.metadata_id = ANY(%s)
+              AND NOT EXISTS (
+                SELECT 1 FROM {TABELA_GEOMETRIAS} g
+                WHERE g.ogc_fid = s.ogc_fid
+                  AND g.graphic_representation_group = s.graphic_representation_group
+                  AND {filtro_visivel("g")}
+              );
+        """, (metadata_ids,))
+        escopo = f""" AND g.metadata_id = ANY(%s)
+          AND NOT EXISTS (
+            SELECT 1 FROM {TABELA_GRUPOS} s
+            WHERE s.ogc_fid = g.ogc_fid AND s.graphic_representation_group = g.graphic_representation_group
+          )"""
+        params = [metadata_ids]
+    else:
+        cur.execute(f"TRUNCATE {TABELA_GRUPOS};")
+        escopo, params = "", []
+
+    cur.execute(f"""
+        SELECT DISTINCT g.graphic_representation_group FROM {TABELA_GEOMETRIAS} g
+        WHERE g.graphic_representation_group IS NOT NULL{escopo};
+    """, params)
+    _garantir_particoes_grupos(cur, [r[0] for r in cur.fetchall()])
+
+    cur.execute(f"""
+        INSERT INTO {TABELA_GRUPOS}
+            (ogc_fid, graphic_representation_group, metadata_id, classe, tipo_geometria, wkb_geometry)
+        SELECT g.ogc_fid, g.graphic_representation_group, g.metadata_id, g.classe, g.tipo_geometria, g.wkb_geometry
+        FROM {TABELA_GEOMETRIAS} g
+        WHERE g.graphic_representation_group IS NOT NULL
+          AND {filtro_visivel("g")}{escopo};
+    """, params)
+    return cur.rowcount
+
+def remapear_classes(cur, classes):
+    """
+    Após mudança em RepresentacaoGrafica: remapeia só as feições dessas classes
+    (no lugar, sem limpar a coluna) e atualiza o resumo apenas dos produtos que
+    as contêm. Devolve os metadata_ids afetados.
+    """
+    escopo, params = _escopo_feicoes(classes=classes)
+    cur.execute(f"""
+        SELECT DISTINCT p.metadata_id FROM {TABELA_FEICOES} f
+        JOIN {TABELA_PRODUTOS} p ON p.id = f.produto_id
+        WHERE true{escopo};
+    """, params)
+    metadata_ids = [r[0] for r in cur.fetchall()]
+    if metadata_ids:
+        mapear_grupos(cur, classes=classes)
+        atualizar_resumo_grupos(cur, metadata_ids)
+        incrementar_geracao(cur)
+    return metadata_ids
+
+def atualizar_grupos_das_classes(classes):
+    """remapear_classes em conexão própria (após o commit de quem alterou as representações)."""
+    conn = psycopg2.connect(**CONFIG_BANCO)
+    try:
+        cur = conn.cursor()
+        metadata_ids = remapear_classes(cur, classes)
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    return metadata_ids
+
+def remapear_pendentes():
+    """
+    Worker (PROCESSAMENTO_FILA=worker): remapeia de uma vez as classes
+    registradas em TABELA_REMAPEAMENTOS e apaga os pedidos atendidos na mesma
+    transação. Pedidos feitos durante o remapeamento ficam para a próxima
+    passada. Devolve as classes remapeadas.
+    """
+    conn = psycopg2.connect(**CONFIG_BANCO)
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SELECT id, classe FROM {TABELA_REMAPEAMENTOS} ORDER BY id FOR UPDATE SKIP LOCKED;")
+        pedidos = cur.fetchall()
+        classes = sorted({classe for _, classe in pedidos})
+        if pedidos:
+            remapear_classes(cur, classes)
+            cur.execute(f"DELETE FROM {TABELA_REMAPEAMENTOS} WHERE id = ANY(%s);", ([i for i, _ in pedidos],))
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    if classes:
+        safe_print(f"🎨 Grupos remapeados para {len(classes)} classes.")
+    return classes
+
+# ------------------------ ESTATÍSTICAS ------------------------
+def atualizar_estatisticas(cur, metadata_ids=None, classes=None):
+    """
+    Recalcula TABELA_ESTATISTICAS (quantidade, vértices, bbox EPSG:4326 e bytes
+    por produto × classe × tipo de geometria) só para os produtos/classes
+    informados, agregando as feições deles pelo índice de produto_id. Sem
+    escopo, reconstrói a tabela inteira. Linhas de escopos que ficaram vazios
+    (remoções) simplesmente somem.
+    """
+    escopo, params = _escopo_feicoes(metadata_ids, classes)
+    escopo_estatisticas, _ = _escopo_feicoes(metadata_ids, classes, alias="e")
+    cur.execute(f"DELETE FROM {TABELA_ESTATISTICAS} e WHERE true{escopo_estatisticas};", params)
+    cur.execute(f"""
+        INSERT INTO {TABELA_ESTATISTICAS}
+            (produto_id, classe_id, tipo_geometria, quantidade, vertices, bytes, xmin, ymin, xmax, ymax)
+        SELECT a.produto_id, a.classe_id, a.tipo_geometria, a.quantidade, a.vertices, a.bytes,
+               ST_XMin(a.bbox), ST_YMin(a.bbox), ST_XMax(a.bbox), ST_YMax(a.bbox)
+        FROM (
+            SELECT f.produto_id, f.classe_id, f.tipo_geometria,
+                   count(*) AS quantidade,
+                   coalesce(sum(ST_NPoints(f.wkb_geometry)), 0) AS vertices,
+                   coalesce(sum(pg_column_size(f.wkb_geometry)), 0) AS bytes,
+                   ST_Transform(ST_SetSRID(ST_Extent(f.wkb_geometry)::geometry, 3857), 4326) AS bbox
+            FROM {TABELA_FEICOES} f
+            WHERE true{escopo}
+            GROUP BY f.produto_id, f.classe_id, f.tipo_geometria
+        ) a;
+    """, params)
+    return cur.rowcount
+
+# ------------------------ ORDENAÇÃO ESPACIAL ------------------------
+FUNCAO_HILBERT = "importacao_hilbert"
+ORDENACOES_ESPACIAIS = ("hilbert", "geohash")
+_COLUNAS_FEICAO = "ogc_fid, tipo_geometria, produto_id, classe_id, graphic_representation_group, json, hash, wkb_geometry"
+
+def chave_espacial_sql(ordenacao, coluna="wkb_geometry"):
+    """
+    Expressão SQL da chave de ordenação pelo centro do bbox em EPSG:3857:
+    posição na curva de Hilbert (grade 2^16 x 2^16 sobre o mundo) ou geohash.
+    Geometrias vazias (quantização que colapsou) ficam com chave NULL, no fim.
+    """
+    if ordenacao == "hilbert":
+        return f"{FUNCAO_HILBERT}({coluna})"
+    if ordenacao == "geohash":
+        return (f"CASE WHEN ST_IsEmpty({coluna}) THEN NULL "
+                f"ELSE ST_GeoHash(ST_Transform(ST_Centroid(ST_Envelope({coluna})), 4326), 12) END")
+    raise ValueError(f"Ordenação espacial inválida: {ordenacao}")
+
+def reagrupar_produto(cur, metadata_id, ordenacao="hilbert"):
+    """
+    Regrava as feições do produto na ordem da chave espacial (mantendo ogc_fid),
+    para que feições vizinhas no mapa fiquem nas mesmas páginas. O sort acima
+    de work_mem é externo (em disco) no próprio PostgreSQL. As páginas antigas
+    só são reaproveitadas depois do VACUUM. Devolve as feições regravadas.
+    """
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (metadata_id,))
+    cur.execute(f"""
+        WITH antigas AS (
+            DELETE FROM {TABELA_FEICOES}
+            WHERE produto_id = (SELECT id FROM {TABELA_PRODUTOS} WHERE metadata_id = %s)
+            RETURNING {_COLUNAS_FEICAO}
+        )
+        INSERT INTO {TABELA_FEICOES} ({_COLUNAS_FEICAO})
+        SELECT {_COLUNAS_FEICAO} FROM antigas
+        ORDER BY {chave_espacial_sql(ordenacao)}, ogc_fid;
+    """, (metadata_id,))
+    return cur.rowcount
+
+def correlacao_espacial(cur, metadata_ids=None):
+    """
+    Por produto e partição: feições, páginas ocupadas e correlação entre a
+    página física (ctid) e a chave de Hilbert. Perto de 1 = feições vizinhas
+    no mapa gravadas em sequência; perto de 0 = espalhadas pelo heap.
+    """
+    escopo, params = _escopo_feicoes(metadata_ids)
+    cur.execute(f"""
+        SELECT p.metadata_id, f.tableoid::regclass::text AS particao, count(*) AS feicoes,
+               count(DISTINCT (f.ctid::text::point)[0]) AS paginas,
+               corr((f.ctid::text::point)[0], {FUNCAO_HILBERT}(f.wkb_geometry)) AS correlacao
+        FROM {TABELA_FEICOES} f
+        JOIN {TABELA_PRODUTOS} p ON p.id = f.produto_id
+        WHERE true{escopo}
+        GROUP BY p.metadata_id, f.tableoid
+        ORDER BY p.metadata_id, particao;
+    """, params)
+    return cur.fetchall()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from importservice.models import RemocaoProduto
+from importservice import remocao
+
+
+class Command(BaseCommand):
+    help = "Retoma o expurgo em lotes das remoções pendentes (por exemplo, após reiniciar o servidor)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=remocao.REMOCAO_LOTE, help="Feições por DELETE")
+        parser.add_argument("--pausa", type=float, default=remocao.REMOCAO_PAUSA, help="Pausa entre lotes (s)")
+
+    def handle(self, *args, **options):
+        pendentes = RemocaoProduto.objects.filter(status__in=remocao.STATUS_ATIVOS).order_by("solicitado_em")
+        count = 0
+        for item in pendentes:
+            self.stdout.write(f"Expurgando {item.metadata_id} ({item.classe or 'todas classes'})...")
+            try:
+                if remocao.expurgar(item.pk, lote=options["lote"], pausa=options["pausa"]) is None:
+                    self.stdout.write(f"{item.metadata_id} já está sendo expurgado por outro processo.")
+                    continue
+                count += 1
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"Falha em {item.metadata_id}: {e}"))
+
+        self.stdout.write(self.style.SUCCESS(f"Expurgo concluído! {count} remoções finalizadas."))
@@ -0,0 +1,93 @@
+import json
+import os
+import re
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from importservice import admissao, ogr_importer, perfil
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa todos os GPKG/ZIP de uma pasta, opcionalmente com perfilamento por arquivo "
+        "(cProfile, tracemalloc e amostragem de pilhas), gravando os artefatos e um resumo da execução"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("pasta", nargs="?", default=ogr_importer.PASTA_ARQUIVOS,
+                            help="Pasta com os arquivos (padrão: PASTA_ARQUIVOS)")
+        parser.add_argument("--perfil", action="append", choices=perfil.PERFIS_DISPONIVEIS, default=[],
+                            help="Coletor a ativar; repita para vários")
+        parser.add_argument("--saida", default=None,
+                            help="Pasta dos artefatos (padrão: perfis/<data-hora>)")
+        parser.add_argument("--intervalo", type=float, default=5.0,
+                            help="Intervalo da amostragem de pilhas (ms)")
+        parser.add_argument("--top", type=int, default=30, help="Linhas nos relatórios de funções/alocações")
+        parser.add_argument("--modo", choices=["substituir", "diferencial"], default=None,
+                            help="Reimportação de produtos existentes (padrão: IMPORTACAO_MODO)")
+
+    def handle(self, *args, **options):
+        pasta = options["pasta"]
+        if not pasta or not os.path.isdir(pasta):
+            raise CommandError(f"Pasta inválida: {pasta}")
+
+        ogr_importer.garantir_esquema()
+
+        arquivos = []
+        for root, dirs, files in os.walk(pasta):
+            for file in sorted(files):
+                if file.lower().endswith(("zip", "gpkg")):
+                    arquivos.append(os.path.join(root, file))
+
+        saida = options["saida"] or os.path.join("perfis", datetime.now().strftime("%Y%m%d-%H%M%S"))
+        os.makedirs(saida, exist_ok=True)
+
+        execucao = {
+            "inicio": datetime.now().isoformat(timespec="seconds"),
+            "pasta": os.path.abspath(pasta),
+            "perfis": options["perfil"],
+            "arquivos": [],
+        }
+
+        for indice, caminho in enumerate(arquivos, start=1):
+            self.stdout.write(f"[{indice}/{len(arquivos)}] {caminho}")
+            prefixo = f"{indice:04d}_{re.sub(r'[^A-Za-z0-9._-]+', '_', os.path.basename(caminho))}"
+            registro = {"arquivo": caminho, "bytes": os.path.getsize(caminho)}
+
+            estatisticas = {}
+
+            def importar():
+                xml_associado = ogr_importer.find_xml_for_file(caminho)
+                return ogr_importer.importar_para_tabela(
+                    caminho, ogr_importer.TABELA_GEOMETRIAS, xml_associado, modo=options["modo"],
+                    estatisticas=estatisticas
+                )
+
+            try:
+                # Ocupa uma vaga da fila de admissão, como os uploads (a espera fica fora do perfil)
+                with admissao.vaga_local(caminho, modo=options["modo"]) as item:
+                    feicoes, resumo = perfil.perfilar(
+                        importar, saida, prefixo, perfis=options["perfil"],
+                        intervalo=options["intervalo"] / 1000.0, top=options["top"]
+                    )
+                    item.quantidade_feicoes = feicoes
+                    item.metadata_id = estatisticas.get("metadata_id", "")
+                registro.update(resumo, status="sucesso", feicoes=feicoes or 0)
+                if resumo["duracao_s"]:
+                    registro["feicoes_por_s"] = round((feicoes or 0) / resumo["duracao_s"], 1)
+            except Exception as e:
+                registro.update(status="erro", erro=str(e))
+                self.stdout.write(self.style.ERROR(f"Falha em {caminho}: {e}"))
+            execucao["arquivos"].append(registro)
+
+        execucao["fim"] = datetime.now().isoformat(timespec="seconds")
+        execucao["feicoes"] = sum(a.get("feicoes", 0) for a in execucao["arquivos"])
+        execucao["duracao_s"] = round(sum(a.get("duracao_s", 0) for a in execucao["arquivos"]), 3)
+        caminho_resumo = os.path.join(saida, "resumo.json")
+        with open(caminho_resumo, "w", encoding="utf-8") as f:
+            json.dump(execucao, f, ensure_ascii=False, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Importação concluída! {execucao['feicoes']} feições de {len(arquivos)} arquivos. "
+            f"Resumo em {caminho_resumo}"
+        ))
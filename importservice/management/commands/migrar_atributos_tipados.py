@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from importservice import ogr_importer
+
+
+class Command(BaseCommand):
+    help = "Converte em lotes os atributos gravados como texto (modo legado) para tipos JSON nativos"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=5000, help="Feições por lote (uma transação por lote)")
+
+    def handle(self, *args, **options):
+        alteradas = ogr_importer.migrar_atributos_tipados(lote=options["lote"])
+        self.stdout.write(self.style.SUCCESS(f"Migração concluída! {alteradas} feições convertidas."))
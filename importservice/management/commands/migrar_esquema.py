@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from importservice import ogr_importer
+
+
+class Command(BaseCommand):
+    help = "Aplica as migrações versionadas das tabelas de geometria (executar no deploy/startup)"
+
+    def handle(self, *args, **options):
+        versao = ogr_importer.aplicar_migracoes()
+        self.stdout.write(self.style.SUCCESS(f"Esquema de geometrias na versão {versao}."))
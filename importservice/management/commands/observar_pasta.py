@@ -0,0 +1,79 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from importservice import admissao, ogr_importer, observador
+from importservice.models import HistoricoImportacaoExclusao
+
+
+class Command(BaseCommand):
+    help = (
+        "Observa continuamente uma pasta (inotify, ou varredura por mtime dos diretórios) e importa "
+        "cada GPKG/ZIP novo ou alterado assim que o arquivo para de mudar"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("pasta", nargs="?", default=ogr_importer.PASTA_ARQUIVOS,
+                            help="Pasta observada (padrão: PASTA_ARQUIVOS)")
+        parser.add_argument("--estabilidade", type=float, default=observador.OBSERVADOR_ESTABILIDADE,
+                            help="Segundos sem mudança de tamanho/mtime antes de importar")
+        parser.add_argument("--intervalo", type=float, default=observador.OBSERVADOR_INTERVALO,
+                            help="Intervalo entre verificações (s)")
+        parser.add_argument("--existentes", action="store_true",
+                            help="Importa também os arquivos que já estão na pasta ao iniciar")
+        parser.add_argument("--varredura", action="store_true",
+                            help="Não usa inotify (ex.: volumes de rede, onde os eventos não chegam)")
+        parser.add_argument("--modo", choices=["substituir", "diferencial"], default=None,
+                            help="Reimportação de produtos existentes (padrão: IMPORTACAO_MODO)")
+
+    def handle(self, *args, **options):
+        pasta = options["pasta"]
+        if not pasta or not os.path.isdir(pasta):
+            raise CommandError(f"Pasta inválida: {pasta}")
+
+        ogr_importer.garantir_esquema()
+
+        def importar(caminho, xml_lateral):
+            close_old_connections()  # processo longo: descarta conexões do Django que caíram
+            # Mesma prioridade de find_xml_for_file, sem sondar o disco: XML dentro do ZIP, depois o lateral
+            xml = xml_lateral
+            if caminho.lower().endswith(".zip"):
+                manifesto = ogr_importer.obter_manifesto(caminho)
+                if manifesto.xml_membro:
+                    xml = ("zip", caminho, manifesto.xml_membro)
+
+            estatisticas = {}
+            try:
+                # Ocupa uma vaga da fila de admissão, como os uploads
+                with admissao.vaga_local(caminho, modo=options["modo"]) as item:
+                    feicoes = ogr_importer.importar_para_tabela(
+                        caminho, ogr_importer.TABELA_GEOMETRIAS, xml, modo=options["modo"],
+                        estatisticas=estatisticas
+                    )
+                    item.quantidade_feicoes = feicoes
+                    item.metadata_id = estatisticas.get("metadata_id", "")
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"Falha em {caminho}: {e}"))
+                return
+            if feicoes is None:
+                return
+
+            # O metadata_id vem do importador (estatisticas), sem reabrir o XML
+            HistoricoImportacaoExclusao.objects.create(
+                classe=None,
+                acao='adicionado',
+                detalhes=f"Arquivo {os.path.basename(caminho)} importado pela observação de pasta.",
+                **estatisticas
+            )
+            self.stdout.write(self.style.SUCCESS(f"{caminho}: {feicoes} feições importadas."))
+
+        try:
+            observador.Observador(
+                pasta, importar,
+                estabilidade=options["estabilidade"],
+                intervalo=options["intervalo"],
+                importar_existentes=options["existentes"],
+                varredura=options["varredura"],
+            ).executar()
+        except KeyboardInterrupt:
+            self.stdout.write("Observação encerrada.")
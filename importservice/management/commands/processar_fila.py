@@ -0,0 +1,44 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from importservice import admissao, banco, remocao
+
+
+class Command(BaseCommand):
+    help = (
+        "Processa a fila de importação e os expurgos de remoção fora dos workers web: devolve à fila "
+        "as importações de processos que caíram, importa os itens aguardando respeitando os limites de "
+        "admissão, retoma as remoções pendentes ou interrompidas e remapeia os grupos das classes "
+        "cuja representação gráfica mudou"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--continuo", action="store_true",
+                            help="Continua processando até ser interrompido (worker do startup.sh)")
+        parser.add_argument("--intervalo", type=float, default=5.0,
+                            help="Intervalo entre despachos (s)")
+
+    def handle(self, *args, **options):
+        iniciadas = 0
+        try:
+            while True:
+                close_old_connections()  # processo longo: descarta conexões do Django que caíram
+                try:
+                    iniciadas += admissao.despachar()
+                    remocao.retomar_expurgos()
+                    banco.remapear_pendentes()
+                except Exception as e:
+                    if not options["continuo"]:
+                        raise
+                    self.stdout.write(self.style.ERROR(f"Falha ao processar a fila: {e}"))
+                ativas = [t for t in threading.enumerate() if t.name.startswith(("importacao-", "expurgo-"))]
+                if not ativas and not options["continuo"]:
+                    break
+                time.sleep(options["intervalo"])
+        except KeyboardInterrupt:
+            self.stdout.write("Processamento da fila interrompido.")
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"Fila processada! {iniciadas} importações iniciadas por este processo."))
@@ -0,0 +1,69 @@
+import time
+
+import psycopg2
+from django.core.management.base import BaseCommand
+from importservice import banco
+
+
+class Command(BaseCommand):
+    help = (
+        "Regrava as feições de produtos já importados em ordem espacial (Hilbert ou geohash) "
+        "e informa a correlação entre a ordem física e a chave de Hilbert"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("metadata_ids", nargs="*", help="Produtos a reagrupar (padrão: todos)")
+        parser.add_argument("--ordenacao", choices=banco.ORDENACOES_ESPACIAIS, default="hilbert")
+        parser.add_argument("--relatorio", action="store_true",
+                            help="Só mostra a correlação atual, sem regravar")
+        parser.add_argument("--sem-vacuum", action="store_true",
+                            help="Não executa VACUUM ANALYZE ao final")
+
+    def _relatorio(self, cur, metadata_ids):
+        linhas = banco.correlacao_espacial(cur, metadata_ids)
+        self.stdout.write(f"{'metadata_id':40} {'partição':28} {'feições':>9} {'páginas':>8} {'correlação':>10}")
+        for metadata_id, particao, feicoes, paginas, correlacao in linhas:
+            valor = f"{correlacao:.3f}" if correlacao is not None else "-"
+            self.stdout.write(f"{metadata_id[:40]:40} {particao[:28]:28} {feicoes:>9} {paginas:>8} {valor:>10}")
+
+    def handle(self, *args, **options):
+        metadata_ids = options["metadata_ids"] or None
+        conn = psycopg2.connect(**banco.CONFIG_BANCO)
+        try:
+            cur = conn.cursor()
+            if options["relatorio"]:
+                self._relatorio(cur, metadata_ids)
+                return
+
+            if metadata_ids is None:
+                cur.execute(f"SELECT metadata_id FROM {banco.TABELA_PRODUTOS} ORDER BY metadata_id;")
+                metadata_ids = [r[0] for r in cur.fetchall()]
+
+            total = 0
+            for indice, metadata_id in enumerate(metadata_ids, start=1):
+                inicio = time.perf_counter()
+                try:
+                    # Uma transação por produto: o lock do produto fica preso só durante a regravação dele
+                    regravadas = banco.reagrupar_produto(cur, metadata_id, options["ordenacao"])
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    self.stdout.write(self.style.ERROR(f"Falha em {metadata_id}: {e}"))
+                    continue
+                total += regravadas
+                self.stdout.write(f"[{indice}/{len(metadata_ids)}] {metadata_id}: {regravadas} feições "
+                                  f"em {time.perf_counter() - inicio:.1f}s")
+
+            if not options["sem_vacuum"]:
+                conn.autocommit = True  # VACUUM não roda dentro de transação
+                cur.execute(f"VACUUM (ANALYZE) {banco.TABELA_FEICOES};")
+                conn.autocommit = False
+
+            self._relatorio(cur, metadata_ids)
+            cur.close()
+        finally:
+            conn.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Reagrupamento concluído! {total} feições de {len(metadata_ids)} produtos ({options['ordenacao']})."
+        ))
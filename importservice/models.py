@@ -37,11 +37,112 @@ class HistoricoImportacaoExclusao(models.Model):
         on_delete=models.SET_NULL
     )
     detalhes = models.TextField(null=True, blank=True)
+    # Desempenho do evento (preenchidos pelo importador e pelo expurgo)
+    quantidade_feicoes = models.BigIntegerField(null=True, blank=True)
+    bytes = models.BigIntegerField(null=True, blank=True)  # tamanho do arquivo importado
+    duracao_s = models.FloatField(null=True, blank=True)
+    feicoes_por_s = models.FloatField(null=True, blank=True)
+    tempos_etapas = models.JSONField(null=True, blank=True)  # {etapa: segundos}
+    worker = models.CharField(max_length=128, null=True, blank=True)  # host:pid
+
+    class Meta:
+        indexes = [
+            # Paginação por chave (data_evento, id) decrescente
+            models.Index(fields=['-data_evento', '-id'], name='historico_data_evento_idx'),
+        ]
 
     def __str__(self):
         return f"{self.acao.capitalize()} {self.metadata_id} ({self.classe or 'todas classes'}) em {self.data_evento.strftime('%d/%m/%Y %H:%M:%S')}"
 
 
+# ========================================
+# Remoções em andamento (lápides)
+# ========================================
+class RemocaoProduto(models.Model):
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('removendo', 'Removendo'),
+        ('concluido', 'Concluído'),
+        ('erro', 'Erro'),
+    ]
+
+    metadata_id = models.CharField(max_length=256, db_index=True)
+    classe = models.CharField(max_length=256, null=True, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='pendente')
+    total = models.BigIntegerField(default=0)
+    removidas = models.BigIntegerField(default=0)
+    solicitado_em = models.DateTimeField(auto_now_add=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL
+    )
+    erro = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Remoção {self.metadata_id} ({self.classe or 'todas classes'}) - {self.status}: {self.removidas}/{self.total}"
+
+
+# ========================================
+# Fila de importações (controle de admissão)
+# ========================================
+class FilaImportacao(models.Model):
+    STATUS_CHOICES = [
+        ('aguardando', 'Aguardando'),
+        ('importando', 'Importando'),
+        ('concluido', 'Concluído'),
+        ('ignorado', 'Ignorado'),
+        ('erro', 'Erro'),
+    ]
+
+    nome = models.CharField(max_length=256)
+    arquivo = models.CharField(max_length=1024)  # caminho salvo em MEDIA_ROOT/uploads
+    xml = models.JSONField(null=True, blank=True)  # localizador do XML (find_xml_for_file)
+    metadata_id = models.CharField(max_length=256, db_index=True)
+    modo = models.CharField(max_length=16, null=True, blank=True)
+    bytes = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='aguardando')
+    solicitado_em = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL
+    )
+    worker = models.CharField(max_length=128, null=True, blank=True)  # host:pid que está importando
+    quantidade_feicoes = models.BigIntegerField(null=True, blank=True)
+    erro = models.TextField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Ordem de chegada dos itens de cada status (despacho e posição na fila)
+            models.Index(fields=['status', 'solicitado_em', 'id'], name='fila_status_chegada_idx'),
+        ]
+
+    def __str__(self):
+        return f"Importação {self.nome} ({self.metadata_id}) - {self.status}"
+
+
+# ========================================
+# Remapeamentos de grupo pendentes (worker)
+# ========================================
+class RemapeamentoGrupo(models.Model):
+    """
+    Classe cuja representação gráfica mudou, gravada na mesma transação da
+    alteração; o processar_fila remapeia as classes pendentes de uma vez
+    (banco.remapear_pendentes).
+    """
+    classe = models.CharField(max_length=256)
+    solicitado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Remapear {self.classe} ({self.solicitado_em})"
+
+
 # ========================================
 # Produtos geoespaciais
 # ========================================
@@ -53,11 +154,33 @@ class ProdutoGeoespacial(models.Model):
     esquema = models.CharField(max_length=256, null=True, blank=True)
     escala = models.CharField(max_length=64, null=True, blank=True)
     area_mapeada = geomodels.PolygonField(null=True, blank=True, srid=4326)
+    # Catálogo: gravados pelo importador na mesma transação das feições
+    quantidade_feicoes = models.BigIntegerField(default=0)
+    contagem_classes = models.JSONField(default=dict, blank=True)  # {classe: quantidade}
+    bbox = models.JSONField(null=True, blank=True)  # [minx, miny, maxx, maxy] em EPSG:4326
+    # Quantização por escala (PRECISAO_MODO=escala): grade em unidades EPSG:3857 e WKB economizado
+    precisao_grade = models.FloatField(null=True, blank=True)
+    bytes_economizados = models.BigIntegerField(default=0)
 
     def __str__(self):
         return f"{self.metadata_id} ({self.data_do_produto})"
 
 
+# ========================================
+# Geração do catálogo
+# ========================================
+class GeracaoCatalogo(models.Model):
+    """
+    Linha única (id=1) incrementada a cada importação, remoção ou edição de
+    representação; as listagens usam o número como ETag e chave de cache.
+    """
+    geracao = models.BigIntegerField(default=0)
+    alterado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Geração {self.geracao} ({self.alterado_em})"
+
+
 # ========================================
 # Representação gráfica das classes
 # ========================================
@@ -0,0 +1,278 @@
+"""
+Observação contínua de PASTA_ARQUIVOS para importar entregas novas sem varrer
+a árvore inteira a cada rodada.
+
+Mantém em memória o índice dos pacotes (GPKG/ZIP) e dos XMLs laterais. As
+mudanças chegam pelo inotify (via ctypes, sem dependência extra) ou, onde ele
+não existe, por uma varredura que só relista os diretórios cujo mtime mudou.
+Um arquivo só é entregue ao callback depois de estável: nenhum evento e
+tamanho/mtime iguais durante OBSERVADOR_ESTABILIDADE segundos (rajadas de
+escrita apenas reiniciam a espera).
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+from .banco import safe_print
+
+OBSERVADOR_ESTABILIDADE = float(os.getenv("OBSERVADOR_ESTABILIDADE", "5"))
+OBSERVADOR_INTERVALO = float(os.getenv("OBSERVADOR_INTERVALO", "1"))
+
+EXTENSOES_PACOTE = (".zip", ".gpkg")
+
+# Constantes de <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_MASCARA = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENTO = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class _Inotify:
+    """inotify via libc. ler() devolve [(caminho, tipo)], tipo: alterado | removido | diretorio | transbordo."""
+
+    nome = "inotify"
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._adicionar = libc.inotify_add_watch
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            erro = ctypes.get_errno()
+            raise OSError(erro, os.strerror(erro))
+        self.diretorios = {}  # wd -> caminho
+
+    def observar(self, diretorio):
+        wd = self._adicionar(self.fd, os.fsencode(diretorio), _MASCARA)
+        if wd < 0:
+            erro = ctypes.get_errno()
+            raise OSError(erro, f"inotify_add_watch({diretorio}): {os.strerror(erro)}")
+        self.diretorios[wd] = diretorio
+
+    def ler(self, timeout):
+        prontos, _, _ = select.select([self.fd], [], [], timeout)
+        if not prontos:
+            return []
+        try:
+            dados = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        eventos, i = [], 0
+        while i < len(dados):
+            wd, mascara, _, tamanho = _EVENTO.unpack_from(dados, i)
+            nome = dados[i + _EVENTO.size:i + _EVENTO.size + tamanho].rstrip(b"\0")
+            i += _EVENTO.size + tamanho
+            if mascara & IN_Q_OVERFLOW:
+                eventos.append((None, "transbordo"))
+                continue
+            if mascara & IN_IGNORED:
+                self.diretorios.pop(wd, None)
+                continue
+            base = self.diretorios.get(wd)
+            if base is None or not nome:
+                continue
+            caminho = os.path.join(base, os.fsdecode(nome))
+            if mascara & (IN_DELETE | IN_MOVED_FROM):
+                eventos.append((caminho, "removido"))
+            elif mascara & IN_ISDIR:
+                if mascara & (IN_CREATE | IN_MOVED_TO):
+                    eventos.append((caminho, "diretorio"))
+            else:
+                eventos.append((caminho, "alterado"))
+        return eventos
+
+    def fechar(self):
+        os.close(self.fd)
+
+
+class _Varredura:
+    """
+    Alternativa sem inotify: a cada intervalo faz um stat por diretório e só
+    relista os que mudaram de mtime (entrada criada, removida ou renomeada).
+    Arquivos sobrescritos no lugar não mudam o diretório e não são percebidos.
+    """
+
+    nome = "varredura"
+
+    def __init__(self):
+        self.diretorios = {}  # caminho -> (mtime_ns, nomes)
+
+    def _listar(self, diretorio):
+        return os.stat(diretorio).st_mtime_ns, set(os.listdir(diretorio))
+
+    def observar(self, diretorio):
+        self.diretorios[diretorio] = self._listar(diretorio)
+
+    def ler(self, timeout):
+        time.sleep(timeout)
+        eventos = []
+        for diretorio, (mtime, nomes) in list(self.diretorios.items()):
+            try:
+                if os.stat(diretorio).st_mtime_ns == mtime:
+                    continue
+                self.diretorios[diretorio] = atual = self._listar(diretorio)
+            except FileNotFoundError:
+                del self.diretorios[diretorio]
+                continue
+            for nome in sorted(nomes - atual[1]):
+                eventos.append((os.path.join(diretorio, nome), "removido"))
+            for nome in sorted(atual[1] - nomes):
+                caminho = os.path.join(diretorio, nome)
+                eventos.append((caminho, "diretorio" if os.path.isdir(caminho) else "alterado"))
+        return eventos
+
+    def fechar(self):
+        pass
+
+
+class Observador:
+    """
+    Chama ao_estabilizar(caminho, xml_lateral) para cada pacote novo ou alterado
+    depois que ele para de mudar. xml_lateral é o XML de mesmo nome-base ao lado
+    do pacote (ou None), tirado do índice em memória.
+    """
+
+    def __init__(self, pasta, ao_estabilizar, estabilidade=OBSERVADOR_ESTABILIDADE,
+                 intervalo=OBSERVADOR_INTERVALO, importar_existentes=False, varredura=False):
+        self.pasta = os.path.abspath(pasta)
+        self.ao_estabilizar = ao_estabilizar
+        self.estabilidade = estabilidade
+        self.intervalo = intervalo
+        self.importar_existentes = importar_existentes
+        self.varredura = varredura
+        self.pacotes = {}    # caminho -> (tamanho, mtime_ns) já importado (ou já presente ao iniciar)
+        self.pendentes = {}  # caminho -> [(tamanho, mtime_ns) ou None, instante do último evento]
+        self.xmls = {}       # caminho sem extensão -> caminho do XML
+        self.backend = None
+
+    # ---- índice ----
+    def _indexar_diretorio(self, diretorio, novos):
+        """Observa o diretório antes de listá-lo (nada criado no meio se perde) e desce nos filhos."""
+        self.backend.observar(diretorio)
+        with os.scandir(diretorio) as entradas:
+            for entrada in entradas:
+                if entrada.is_dir(follow_symlinks=False):
+                    self._indexar_diretorio(entrada.path, novos)
+                elif entrada.is_file():
+                    self._registrar(entrada.path, novos, entrada)
+
+    def _registrar(self, caminho, novo, entrada=None):
+        base, ext = os.path.splitext(caminho)
+        ext = ext.lower()
+        if ext == ".xml":
+            self.xmls[base] = caminho
+            for pendente in self.pendentes:
+                if os.path.splitext(pendente)[0] == base:
+                    self.pendentes[pendente][1] = time.monotonic()  # pacote ainda chegando com o XML
+        elif ext in EXTENSOES_PACOTE:
+            if novo:
+                self._tocar(caminho)
+            elif entrada is not None:
+                st = entrada.stat()
+                self.pacotes.setdefault(caminho, (st.st_size, st.st_mtime_ns))
+
+    def _esquecer(self, caminho):
+        base, ext = os.path.splitext(caminho)
+        if ext.lower() == ".xml":
+            if self.xmls.get(base) == caminho:
+                del self.xmls[base]
+            return
+        self.pendentes.pop(caminho, None)
+        self.pacotes.pop(caminho, None)
+        prefixo = caminho + os.sep  # diretório removido: some tudo que estava abaixo
+        for indice in (self.pendentes, self.pacotes):
+            for chave in [c for c in indice if c.startswith(prefixo)]:
+                del indice[chave]
+        for base_xml in [b for b, x in self.xmls.items() if x.startswith(prefixo)]:
+            del self.xmls[base_xml]
+
+    def xml_lateral(self, caminho):
+        xml = self.xmls.get(os.path.splitext(caminho)[0])
+        return ("fs", xml) if xml else None
+
+    # ---- estabilidade ----
+    def _tocar(self, caminho):
+        pendente = self.pendentes.get(caminho)
+        if pendente is None:
+            self.pendentes[caminho] = [None, time.monotonic()]
+        else:
+            pendente[1] = time.monotonic()
+
+    def _verificar_pendentes(self):
+        agora = time.monotonic()
+        for caminho, pendente in list(self.pendentes.items()):
+            assinatura_anterior, ultimo_evento = pendente
+            if agora - ultimo_evento < self.estabilidade:
+                continue
+            try:
+                st = os.stat(caminho)
+            except FileNotFoundError:
+                del self.pendentes[caminho]
+                continue
+            assinatura = (st.st_size, st.st_mtime_ns)
+            if assinatura != assinatura_anterior or not st.st_size:
+                pendente[:] = [assinatura, agora]  # ainda mudando: espera mais uma janela
+                continue
+            del self.pendentes[caminho]
+            if self.pacotes.get(caminho) == assinatura:
+                continue  # evento sem mudança de conteúdo (ex.: touch de atributos)
+            self.pacotes[caminho] = assinatura
+            try:
+                self.ao_estabilizar(caminho, self.xml_lateral(caminho))
+            except Exception as e:
+                safe_print(f"❌ Erro ao processar '{caminho}': {e}")
+
+    # ---- laço principal ----
+    def _criar_backend(self):
+        if not self.varredura:
+            try:
+                return _Inotify()
+            except (OSError, AttributeError) as e:
+                safe_print(f"⚠️ inotify indisponível ({e}); usando varredura por mtime dos diretórios.")
+        return _Varredura()
+
+    def _tratar(self, caminho, tipo):
+        if tipo == "transbordo":
+            # Fila do kernel estourou: eventos perdidos. Reindexa uma vez; só os pacotes com
+            # tamanho/mtime diferentes do índice são importados
+            safe_print("⚠️ Fila do inotify transbordou; reindexando a pasta.")
+            self.backend.fechar()
+            self.backend = self._criar_backend()
+            self._indexar_diretorio(self.pasta, novos=True)
+        elif tipo == "removido":
+            self._esquecer(caminho)
+        elif tipo == "diretorio":
+            try:
+                self._indexar_diretorio(caminho, novos=True)
+            except FileNotFoundError:
+                pass
+        else:
+            self._registrar(caminho, novo=True)
+
+    def executar(self, parar=None):
+        """Roda até parar (threading.Event) ser acionado ou KeyboardInterrupt."""
+        self.backend = self._criar_backend()
+        try:
+            self._indexar_diretorio(self.pasta, novos=self.importar_existentes)
+            safe_print(f"👀 Observando '{self.pasta}' ({self.backend.nome}): "
+                       f"{len(self.pacotes) + len(self.pendentes)} pacotes e {len(self.xmls)} XMLs indexados.")
+            while parar is None or not parar.is_set():
+                for caminho, tipo in self.backend.ler(self.intervalo):
+                    self._tratar(caminho, tipo)
+                self._verificar_pendentes()
+        finally:
+            self.backend.fechar()
@@ -1,27 +1,73 @@
 import os
 import re
+import ast
+import hashlib
 import json
+import math
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
 import zipfile
+from collections import OrderedDict
 import xml.etree.ElementTree as ET
 from osgeo import ogr, osr
-from dotenv import load_dotenv
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extras import Json, execute_values
+
+try:
+    from .banco import (
+        CONFIG_BASE, CONFIG_BANCO, TABELA_GEOMETRIAS, TABELA_FEICOES,
+        TABELA_PRODUTOS, TABELA_CLASSES, TABELA_CATALOGO, TABELA_REMOCOES,
+        FORMATOS_EXPORTACAO, safe_print, filtro_visivel,
+        aplicar_mapeamento_via_sql, mapear_grupos, atualizar_resumo_grupos, TABELA_GRUPOS, criar_view_grupo,
+        identificador_processo, incrementar_geracao, TABELA_ESTATISTICAS, atualizar_estatisticas,
+        FUNCAO_HILBERT, ORDENACOES_ESPACIAIS, chave_espacial_sql, conectar_leitura,
+    )
+except ImportError:  # executado como script (python importservice/ogr_importer.py)
+    from banco import (
+        CONFIG_BASE, CONFIG_BANCO, TABELA_GEOMETRIAS, TABELA_FEICOES,
+        TABELA_PRODUTOS, TABELA_CLASSES, TABELA_CATALOGO, TABELA_REMOCOES,
+        FORMATOS_EXPORTACAO, safe_print, filtro_visivel,
+        aplicar_mapeamento_via_sql, mapear_grupos, atualizar_resumo_grupos, TABELA_GRUPOS, criar_view_grupo,
+        identificador_processo, incrementar_geracao, TABELA_ESTATISTICAS, atualizar_estatisticas,
+        FUNCAO_HILBERT, ORDENACOES_ESPACIAIS, chave_espacial_sql, conectar_leitura,
+    )
+
+TABELA_GLOBAL = TABELA_GEOMETRIAS  # nome usado pelos testes
 
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 ogr.UseExceptions()
 
-# Configurações do banco
-CONFIG_BASE = {
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "host": os.getenv("DB_HOST"),
-    "port": os.getenv("DB_PORT"),
-}
-CONFIG_BANCO = {**CONFIG_BASE, "dbname": os.getenv("DB_NAME")}
-TABELA_GEOMETRIAS = "importacao_geometrias"
+IMPORTACAO_LOTE = int(os.getenv("IMPORTACAO_LOTE", "1000"))
+# Reimportação de um produto existente: 'substituir' (apaga tudo e insere de novo)
+# ou 'diferencial' (só insere/apaga as feições cujo hash mudou)
+IMPORTACAO_MODO = os.getenv("IMPORTACAO_MODO", "substituir").strip().lower()
+# Ordem de gravação das feições de cada produto: 'nenhuma' (ordem das camadas),
+# 'hilbert' ou 'geohash' (pelo centro do bbox; vizinhas no mapa ficam nas mesmas páginas)
+ORDENACAO_ESPACIAL = os.getenv("ORDENACAO_ESPACIAL", "nenhuma").strip().lower()
+# Lotes prontos aguardando o escritor; limita a memória quando o banco é o gargalo
+IMPORTACAO_FILA = int(os.getenv("IMPORTACAO_FILA", "4"))
+# Serialização dos atributos no JSONB: 'tipado' (tipos JSON nativos) ou 'texto' (str(v), legado)
+MODO_ATRIBUTOS = os.getenv("MODO_ATRIBUTOS", "tipado").strip().lower()
 PASTA_ARQUIVOS = os.getenv("PASTA_ARQUIVOS")
 
+# Quantização das coordenadas pela escala do produto: 'completa' (sem quantização) ou 'escala'
+PRECISAO_MODO = os.getenv("PRECISAO_MODO", "completa").strip().lower()
+# Tabela escala:grade em metros no terreno (padrão: 0,05 mm na escala da carta)
+PRECISAO_TOLERANCIAS = os.getenv(
+    "PRECISAO_TOLERANCIAS",
+    "1000:0.05,2000:0.1,5000:0.25,10000:0.5,25000:1.25,50000:2.5,100000:5,250000:12.5,1000000:50",
+)
+
+# Extração de shapefiles do ZIP para tmpfs: 'nunca', 'auto' ou 'sempre'
+ZIP_EXTRACAO = os.getenv("ZIP_EXTRACAO", "nunca").strip().lower()
+PASTA_TMPFS = os.getenv("PASTA_TMPFS", "/dev/shm")
+ZIP_EXTRACAO_MIN_BYTES = int(os.getenv("ZIP_EXTRACAO_MIN_BYTES", str(64 * 1024 * 1024)))
+EXTENSOES_SHAPEFILE = (".shp", ".shx", ".dbf", ".prj", ".cpg", ".qix", ".sbn", ".sbx")
+
 def _pick_edgv_version(text: str):
     """Retorna '2.1.3' ou '3.0' se aparecer no texto."""
     if not text:
@@ -29,6 +75,171 @@ def _pick_edgv_version(text: str):
     m = re.search(r'(2[\._-]?1[\._-]?3|3\.0)', text, flags=re.IGNORECASE)
     return m.group(1).replace('_','.') if m else None
 
+def _pontuar_xml(nome):
+    """Ordena candidatos a XML de metadados: nomes típicos primeiro, depois os mais curtos."""
+    nlow = nome.lower()
+    return (
+        0 if re.search(r'metad|metadata|metadado|ident|edgv|catalog|feature', nlow) else 1,
+        len(nome)
+    )
+
+class ManifestoArquivo:
+    """
+    Inventário de um arquivo de entrada montado com uma única leitura do índice do ZIP.
+
+    Guarda a lista de membros, os shapefiles, o XML de metadados escolhido (já lido
+    em memória) e, no modo de extração, a pasta temporária com os shapefiles
+    descompactados (criada só quando abrir_datasources pede a leitura).
+    É compartilhado por find_xml_for_file, _parse_xml_from_locator e
+    abrir_datasources através de obter_manifesto().
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.ext = os.path.splitext(caminho)[1].lower()
+        self.vsi = os.path.abspath(caminho).replace("\\", "/")
+        self.membros = []
+        self.shps = []
+        self.xml_membro = None
+        self.xml_bytes = None
+        self.pasta_extraida = None
+        self._trava = threading.Lock()
+        self._usos = 0  # leituras em andamento da pasta extraída (reservar/liberar)
+        self._descartado = False
+
+        if self.ext != ".zip":
+            return
+
+        with zipfile.ZipFile(caminho, "r") as zf:
+            self.membros = [m for m in zf.infolist() if not m.is_dir()]
+            nomes = [m.filename for m in self.membros]
+            self.shps = [n for n in nomes if n.lower().endswith(".shp")]
+
+            xmls = sorted((n for n in nomes if n.lower().endswith(".xml")), key=_pontuar_xml)
+            if xmls:
+                self.xml_membro = xmls[0]
+                self.xml_bytes = zf.read(self.xml_membro)
+
+    def _membros_shapefile(self):
+        bases = {os.path.splitext(n)[0].lower() for n in self.shps}
+        return [
+            m for m in self.membros
+            if os.path.splitext(m.filename)[0].lower() in bases
+            and os.path.splitext(m.filename)[1].lower() in EXTENSOES_SHAPEFILE
+        ]
+
+    def _deve_extrair(self):
+        """
+        Leituras aleatórias de membros comprimidos via /vsizip/ descompactam o fluxo
+        repetidamente; membros 'stored' são lidos direto e não ganham nada com a cópia.
+        No modo 'auto' só extrai se houver shapefiles comprimidos grandes e espaço no tmpfs.
+        """
+        if ZIP_EXTRACAO not in ("auto", "sempre") or not self.shps:
+            return False
+        membros = self._membros_shapefile()
+        total = sum(m.file_size for m in membros)
+        try:
+            livre = shutil.disk_usage(PASTA_TMPFS).free
+        except OSError:
+            safe_print(f"⚠️ Pasta temporária '{PASTA_TMPFS}' indisponível; lendo via /vsizip/.")
+            return False
+        if total * 1.1 > livre:
+            safe_print(f"⚠️ Espaço insuficiente em '{PASTA_TMPFS}' para extrair {total} bytes; lendo via /vsizip/.")
+            return False
+        if ZIP_EXTRACAO == "sempre":
+            return True
+        comprimidos = sum(m.file_size for m in membros if m.compress_type != zipfile.ZIP_STORED)
+        return comprimidos >= ZIP_EXTRACAO_MIN_BYTES
+
+    def preparar_leitura(self):
+        """Extrai os shapefiles para o tmpfs, se o modo de extração indicar que compensa."""
+        with self._trava:  # importações simultâneas do mesmo arquivo extraem uma vez só
+            if self.pasta_extraida or not self._deve_extrair():
+                return
+            pasta = tempfile.mkdtemp(prefix="geodataimporter_", dir=PASTA_TMPFS)
+            try:
+                with zipfile.ZipFile(self.caminho, "r") as zf:
+                    for m in self._membros_shapefile():
+                        zf.extract(m, pasta)
+            except Exception:
+                shutil.rmtree(pasta, ignore_errors=True)
+                raise
+            self.pasta_extraida = pasta
+        safe_print(f"📤 Shapefiles extraídos para '{pasta}'.")
+
+    def uri_shapefile(self, membro):
+        if self.pasta_extraida:
+            return os.path.join(self.pasta_extraida, membro).replace("\\", "/")
+        return f"/vsizip/{self.vsi}/{membro}"
+
+    def reservar(self):
+        """Marca uma leitura em andamento: a pasta extraída não é apagada até liberar()."""
+        with self._trava:
+            self._usos += 1
+
+    def liberar(self):
+        with self._trava:
+            self._usos -= 1
+            apagar = self._descartado and not self._usos
+        if apagar:
+            self._apagar_extracao()
+
+    def _apagar_extracao(self):
+        with self._trava:
+            pasta, self.pasta_extraida = self.pasta_extraida, None
+        if pasta:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    def limpar(self):
+        """
+        Descarta o manifesto do cache. A pasta de extração (se houver) é removida
+        agora ou, se outra importação ainda lê dela, quando essa a liberar.
+        """
+        chave = os.path.abspath(self.caminho)
+        with _MANIFESTOS_TRAVA:
+            item = _MANIFESTOS.get(chave)
+            if item and item[1] is self:
+                del _MANIFESTOS[chave]
+        with self._trava:
+            self._descartado = True
+            apagar = not self._usos
+        if apagar:
+            self._apagar_extracao()
+
+_MANIFESTOS = OrderedDict()
+_MANIFESTOS_MAX = 32
+_MANIFESTOS_TRAVA = threading.Lock()  # importações da fila rodam em threads
+
+def obter_manifesto(caminho):
+    """Retorna o manifesto do arquivo, reaproveitando o já montado enquanto o arquivo não mudar."""
+    chave = os.path.abspath(caminho)
+    st = os.stat(caminho)
+    assinatura = (st.st_size, st.st_mtime_ns)
+
+    with _MANIFESTOS_TRAVA:
+        item = _MANIFESTOS.get(chave)
+        if item and item[0] == assinatura:
+            _MANIFESTOS.move_to_end(chave)
+            return item[1]
+
+    # Lê o índice do ZIP fora da trava; se outra thread montou antes, usa o dela
+    manifesto = ManifestoArquivo(caminho)
+    descartados = []
+    with _MANIFESTOS_TRAVA:
+        item = _MANIFESTOS.get(chave)
+        if item and item[0] == assinatura:
+            _MANIFESTOS.move_to_end(chave)
+            return item[1]
+        if item:
+            descartados.append(item[1])
+        _MANIFESTOS[chave] = (assinatura, manifesto)
+        while len(_MANIFESTOS) > _MANIFESTOS_MAX:
+            _, (_, antigo) = _MANIFESTOS.popitem(last=False)
+            descartados.append(antigo)
+    for antigo in descartados:
+        antigo.limpar()
+    return manifesto
+
 def _parse_xml_from_locator(xml_locator):
     """Abre o XML a partir do localizador retornado por find_xml_for_file."""
     if not xml_locator:
@@ -38,6 +249,9 @@ def _parse_xml_from_locator(xml_locator):
         return ET.parse(xml_locator[1])
     if kind == "zip":
         zip_path, member = xml_locator[1], xml_locator[2]
+        manifesto = obter_manifesto(zip_path)
+        if manifesto.xml_membro == member and manifesto.xml_bytes is not None:
+            return ET.ElementTree(ET.fromstring(manifesto.xml_bytes))
         with zipfile.ZipFile(zip_path, "r") as zf:
             with zf.open(member) as fh:
                 return ET.parse(fh)
@@ -126,100 +340,455 @@ def ativar_postgis(nome_banco):
     except Exception as e:
         print(f"Erro ao ativar PostGIS: {e}")
 
-def safe_print(msg):
-    print(msg, flush=True)
-
-def verificar_ou_criar_tabela(table_name, conn_str, srid=3857):
-    ds = ogr.Open(conn_str, update=1)
-    if ds is None:
-        raise RuntimeError("❌ Não foi possível conectar ao banco.")
-
-    if ds.GetLayerByName(table_name):
-        print(f"🧾 Tabela '{table_name}' já existe.")
-    else:
-        print(f"📐 Criando tabela '{table_name}'...")
+def _ddl_tabelas_normalizadas(cur, srid):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABELA_PRODUTOS} (
+            id serial PRIMARY KEY,
+            metadata_id varchar NOT NULL UNIQUE,
+            escala varchar,
+            esquema varchar,
+            data_do_produto date
+        );
+        CREATE TABLE IF NOT EXISTS {TABELA_CLASSES} (
+            id smallserial PRIMARY KEY,
+            nome varchar NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS {TABELA_FEICOES} (
+            ogc_fid serial PRIMARY KEY,
+            produto_id integer NOT NULL REFERENCES {TABELA_PRODUTOS} (id),
+            classe_id smallint NOT NULL REFERENCES {TABELA_CLASSES} (id),
+            graphic_representation_group varchar,
+            json jsonb,
+            wkb_geometry geometry(Geometry, {srid})
+        );
+    """)
+
+def _ddl_view_compatibilidade(cur, table_name):
+    """View com os nomes de colunas da antiga tabela única (usada pelo QGIS e pela API)."""
+    cur.execute(f"""
+        CREATE OR REPLACE VIEW {table_name} AS
+        SELECT f.ogc_fid, f.wkb_geometry, f.json,
+               c.nome AS classe, p.metadata_id, p.escala, p.data_do_produto, p.esquema,
+               f.graphic_representation_group, f.produto_id, f.classe_id
+        FROM {TABELA_FEICOES} f
+        JOIN {TABELA_PRODUTOS} p ON p.id = f.produto_id
+        JOIN {TABELA_CLASSES} c ON c.id = f.classe_id;
+    """)
+
+def _migrar_tabela_unica(cur, table_name):
+    """
+    Converte a antiga tabela única (metadados do produto e classe repetidos em
+    varchar(2048) por feição) para o layout normalizado, preservando ogc_fid.
+    """
+    legado = f"{table_name}_legado"
+    safe_print(f"🔧 Normalizando '{table_name}' (produtos e classes em tabelas próprias)...")
+    cur.execute(f"DROP VIEW IF EXISTS {table_name}_visiveis;")
+    cur.execute(f"ALTER TABLE {table_name} RENAME TO {legado};")
+    _ddl_tabelas_normalizadas(cur, 3857)
+    cur.execute(f"""
+        INSERT INTO {TABELA_PRODUTOS} (metadata_id, escala, esquema, data_do_produto)
+        SELECT DISTINCT ON (coalesce(metadata_id, '')) coalesce(metadata_id, ''), escala, esquema, data_do_produto
+        FROM {legado}
+        ORDER BY coalesce(metadata_id, '')
+        ON CONFLICT (metadata_id) DO NOTHING;
+
+        INSERT INTO {TABELA_CLASSES} (nome)
+        SELECT DISTINCT coalesce(classe, '') FROM {legado}
+        ON CONFLICT (nome) DO NOTHING;
+
+        INSERT INTO {TABELA_FEICOES} (ogc_fid, produto_id, classe_id, graphic_representation_group, json, wkb_geometry)
+        SELECT l.ogc_fid, p.id, c.id, l.graphic_representation_group, l.json::jsonb, l.wkb_geometry
+        FROM {legado} l
+        JOIN {TABELA_PRODUTOS} p ON p.metadata_id = coalesce(l.metadata_id, '')
+        JOIN {TABELA_CLASSES} c ON c.nome = coalesce(l.classe, '');
+
+        SELECT setval(pg_get_serial_sequence('{TABELA_FEICOES}', 'ogc_fid'),
+                      coalesce((SELECT max(ogc_fid) FROM {TABELA_FEICOES}), 0) + 1, false);
+
+        DROP TABLE {legado};
+    """)
+    safe_print(f"✅ '{table_name}' normalizada.")
+
+# ------------------------ MIGRAÇÕES DE ESQUEMA ------------------------
+# O esquema das tabelas de geometria é versionado e aplicado uma vez, no deploy
+# (manage.py migrar_esquema, chamado pelo startup.sh). O caminho de upload só
+# confere, com cache, se o banco já está na versão esperada.
+TABELA_VERSAO_ESQUEMA = "importacao_esquema_versao"
+_CHAVE_LOCK_ESQUEMA = "importacao_esquema"
+
+def _migracao_layout_normalizado(cur):
+    cur.execute("""
+        SELECT c.relkind FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema() AND c.relname = %s;
+    """, (TABELA_GEOMETRIAS,))
+    row = cur.fetchone()
+    if row and row[0] == "r":
+        _migrar_tabela_unica(cur, TABELA_GEOMETRIAS)
+    _ddl_tabelas_normalizadas(cur, 3857)
+    _ddl_view_compatibilidade(cur, TABELA_GEOMETRIAS)
+
+def _migracao_indices(cur):
+    # Filtros por classe e produto (e remoções em lote) usam as chaves inteiras
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABELA_FEICOES}_classe ON {TABELA_FEICOES} (classe_id);")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABELA_FEICOES}_produto ON {TABELA_FEICOES} (produto_id, classe_id);")
+
+    # Consultas espaciais (&&, ST_Intersects)
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABELA_FEICOES}_geom ON {TABELA_FEICOES} USING gist (wkb_geometry);")
+
+    # Consultas por atributo: @> (contém), @? e @@ (jsonpath)
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABELA_FEICOES}_json_path ON {TABELA_FEICOES} USING gin (json jsonb_path_ops);")
+
+def _migracao_view_visiveis(cur):
+    # View que o QGIS deve usar para não desenhar produtos em remoção
+    cur.execute(f"""
+        CREATE OR REPLACE VIEW {TABELA_GEOMETRIAS}_visiveis AS
+        SELECT g.* FROM {TABELA_GEOMETRIAS} g
+        WHERE {filtro_visivel("g")};
+    """)
+
+# Partição de importacao_feicoes por tipo de geometria: tipo -> GeometryType() aceito.
+# 'outros' (partição DEFAULT) recebe coleções e geometrias com M.
+TIPOS_GEOMETRIA = {
+    "ponto": "MULTIPOINT",
+    "linha": "MULTILINESTRING",
+    "area": "MULTIPOLYGON",
+}
 
-        srs = osr.SpatialReference()
-        srs.ImportFromEPSG(srid)
+def _migracao_particao_tipo_geometria(cur):
+    """
+    Recria importacao_feicoes particionada por tipo_geometria (LIST). Cada
+    partição tem CHECK de GeometryType (o PostGIS o expõe em geometry_columns,
+    então o QGIS já abre a camada tipada), índices GiST próprios e estatísticas
+    próprias. ogc_fid continua vindo da mesma sequência.
+    """
+    nova, antiga = f"{TABELA_FEICOES}_nova", f"{TABELA_FEICOES}_antiga"
+    cur.execute(f"DROP VIEW IF EXISTS {TABELA_GEOMETRIAS}_visiveis;")
+    cur.execute(f"DROP VIEW IF EXISTS {TABELA_GEOMETRIAS};")
+    cur.execute(f"ALTER TABLE {TABELA_FEICOES} RENAME TO {antiga};")
+    cur.execute(f"""
+        CREATE TABLE {nova} (
+            ogc_fid integer NOT NULL DEFAULT nextval('{TABELA_FEICOES}_ogc_fid_seq'),
+            tipo_geometria varchar(8) NOT NULL,
+            produto_id integer NOT NULL REFERENCES {TABELA_PRODUTOS} (id),
+            classe_id smallint NOT NULL REFERENCES {TABELA_CLASSES} (id),
+            graphic_representation_group varchar,
+            json jsonb,
+            wkb_geometry geometry(Geometry, 3857),
+            PRIMARY KEY (ogc_fid, tipo_geometria)
+        ) PARTITION BY LIST (tipo_geometria);
+    """)
+    for tipo, geometry_type in TIPOS_GEOMETRIA.items():
+        cur.execute(f"""
+            CREATE TABLE {TABELA_FEICOES}_{tipo} PARTITION OF {nova}
+                (CONSTRAINT enforce_geotype_{tipo} CHECK (GeometryType(wkb_geometry) = '{geometry_type}'))
+                FOR VALUES IN ('{tipo}');
+        """)
+    cur.execute(f"CREATE TABLE {TABELA_FEICOES}_outros PARTITION OF {nova} DEFAULT;")
+
+    casos = " ".join(f"WHEN '{g}' THEN '{t}'" for t, g in TIPOS_GEOMETRIA.items())
+    cur.execute(f"""
+        INSERT INTO {nova} (ogc_fid, tipo_geometria, produto_id, classe_id, graphic_representation_group, json, wkb_geometry)
+        SELECT ogc_fid, CASE GeometryType(wkb_geometry) {casos} ELSE 'outros' END,
+               produto_id, classe_id, graphic_representation_group, json, wkb_geometry
+        FROM {antiga};
+    """)
+    cur.execute(f"ALTER SEQUENCE {TABELA_FEICOES}_ogc_fid_seq OWNED BY {nova}.ogc_fid;")
+    cur.execute(f"DROP TABLE {antiga};")
+    cur.execute(f"ALTER TABLE {nova} RENAME TO {TABELA_FEICOES};")
+
+    # Criados no pai, propagam um índice por partição
+    _migracao_indices(cur)
+
+    cur.execute(f"""
+        CREATE VIEW {TABELA_GEOMETRIAS} AS
+        SELECT f.ogc_fid, f.wkb_geometry, f.json,
+               c.nome AS classe, p.metadata_id, p.escala, p.data_do_produto, p.esquema,
+               f.graphic_representation_group, f.produto_id, f.classe_id, f.tipo_geometria
+        FROM {TABELA_FEICOES} f
+        JOIN {TABELA_PRODUTOS} p ON p.id = f.produto_id
+        JOIN {TABELA_CLASSES} c ON c.id = f.classe_id;
+    """)
+    _migracao_view_visiveis(cur)
+
+    # Uma camada por tipo para o QGIS, já sem produtos em remoção
+    for tipo in TIPOS_GEOMETRIA:
+        cur.execute(f"""
+            CREATE OR REPLACE VIEW {TABELA_GEOMETRIAS}_{tipo} AS
+            SELECT f.ogc_fid, f.wkb_geometry, f.json,
+                   c.nome AS classe, p.metadata_id, p.escala, p.data_do_produto, p.esquema,
+                   f.graphic_representation_group
+            FROM {TABELA_FEICOES}_{tipo} f
+            JOIN {TABELA_PRODUTOS} p ON p.id = f.produto_id
+            JOIN {TABELA_CLASSES} c ON c.id = f.classe_id
+            WHERE {filtro_visivel("p", "c.nome")};
+        """)
+    cur.execute(f"ANALYZE {TABELA_FEICOES};")
 
-        layer = ds.CreateLayer(
-            table_name, srs,
-            geom_type=ogr.wkbUnknown,
-            options=['GEOMETRY_NAME=wkb_geometry', 'DIM=2']
+def _migracao_resumo_grupos(cur):
+    """
+    Tabela de resumo particionada por graphic_representation_group: o QGIS
+    desenha cada grupo lendo a sua partição (importacao_grupos_<grupo>), com
+    índice GiST próprio, em vez de filtrar a tabela inteira. As partições são
+    criadas sob demanda e o conteúdo é mantido por atualizar_resumo_grupos.
+    """
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABELA_GRUPOS} (
+            ogc_fid integer NOT NULL,
+            graphic_representation_group varchar NOT NULL,
+            metadata_id varchar NOT NULL,
+            classe varchar,
+            tipo_geometria varchar(8),
+            wkb_geometry geometry(Geometry, 3857),
+            PRIMARY KEY (ogc_fid, graphic_representation_group)
+        ) PARTITION BY LIST (graphic_representation_group);
+    """)
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABELA_GRUPOS}_geom ON {TABELA_GRUPOS} USING gist (wkb_geometry);")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABELA_GRUPOS}_metadata_id ON {TABELA_GRUPOS} (metadata_id);")
+    # Carga inicial; as atualizações seguintes são por metadata_id
+    mapear_grupos(cur)
+    atualizar_resumo_grupos(cur)
+
+def _migracao_hash_feicao(cur):
+    # Feições importadas antes desta versão ficam sem hash e são substituídas no
+    # primeiro reimport diferencial do produto
+    cur.execute(f"ALTER TABLE {TABELA_FEICOES} ADD COLUMN IF NOT EXISTS hash uuid;")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABELA_FEICOES}_produto_hash ON {TABELA_FEICOES} (produto_id, hash);")
+
+def _migracao_estatisticas(cur):
+    """
+    Estatísticas por produto × classe × tipo de geometria, mantidas por produto
+    pelo importador e pelo expurgo (atualizar_estatisticas) e lidas sozinhas
+    por /api/produtos/resumo/.
+    """
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABELA_ESTATISTICAS} (
+            produto_id integer NOT NULL REFERENCES {TABELA_PRODUTOS} (id) ON DELETE CASCADE,
+            classe_id smallint NOT NULL REFERENCES {TABELA_CLASSES} (id),
+            tipo_geometria varchar(8) NOT NULL,
+            quantidade bigint NOT NULL DEFAULT 0,
+            vertices bigint NOT NULL DEFAULT 0,
+            bytes bigint NOT NULL DEFAULT 0,
+            xmin double precision,
+            ymin double precision,
+            xmax double precision,
+            ymax double precision,
+            PRIMARY KEY (produto_id, classe_id, tipo_geometria)
+        );
+    """)
+    # Carga inicial; as atualizações seguintes são por metadata_id
+    atualizar_estatisticas(cur)
+
+def _migracao_funcao_hilbert(cur):
+    """
+    Chave de Hilbert do centro do bbox (EPSG:3857) numa grade de 2^16 x 2^16
+    sobre a extensão do mundo, para ordenar a gravação das feições
+    (ORDENACAO_ESPACIAL=hilbert e manage.py reagrupar_espacial).
+    """
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION {FUNCAO_HILBERT}(g geometry) RETURNS bigint AS $$
+        DECLARE
+            n constant bigint := 65536;
+            limite constant float8 := 20037508.342789244;
+            x bigint; y bigint; t bigint;
+            s bigint := n / 2;
+            d bigint := 0;
+            rx integer; ry integer;
+        BEGIN
+            IF g IS NULL OR ST_IsEmpty(g) THEN
+                RETURN NULL;
+            END IF;
+            x := least(greatest(floor(((ST_XMin(g) + ST_XMax(g)) / 2 + limite) / (2 * limite) * n), 0), n - 1);
+            y := least(greatest(floor(((ST_YMin(g) + ST_YMax(g)) / 2 + limite) / (2 * limite) * n), 0), n - 1);
+            WHILE s > 0 LOOP
+                rx := CASE WHEN (x & s) > 0 THEN 1 ELSE 0 END;
+                ry := CASE WHEN (y & s) > 0 THEN 1 ELSE 0 END;
+                d := d + s * s * ((3 * rx) # ry);
+                IF ry = 0 THEN
+                    IF rx = 1 THEN
+                        x := n - 1 - x;
+                        y := n - 1 - y;
+                    END IF;
+                    t := x; x := y; y := t;
+                END IF;
+                s := s / 2;
+            END LOOP;
+            RETURN d;
+        END;
+        $$ LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE;
+    """)
+
+def _migracao_catalogo_legado(cur):
+    """
+    Preenche o catálogo (importservice_produtogeoespacial) com os produtos
+    importados antes de ele ser a fonte de verdade da existência: uma linha por
+    metadata_id, com contagens por classe, área mapeada e bbox agregados das
+    feições. Produtos já catalogados não são tocados.
+    """
+    cur.execute(f"""
+        WITH por_classe AS (
+            SELECT f.produto_id, c.nome AS classe, count(*) AS quantidade,
+                   ST_Extent(f.wkb_geometry) AS extensao
+            FROM {TABELA_FEICOES} f
+            JOIN {TABELA_CLASSES} c ON c.id = f.classe_id
+            GROUP BY f.produto_id, c.nome
+        ),
+        por_produto AS (
+            SELECT produto_id, sum(quantidade)::bigint AS quantidade,
+                   jsonb_object_agg(classe, quantidade) AS contagem_classes,
+                   ST_Extent(extensao::geometry) AS extensao
+            FROM por_classe
+            GROUP BY produto_id
+        ),
+        areas AS (
+            SELECT pp.*, ST_Transform(ST_MakeEnvelope(
+                       ST_XMin(pp.extensao), ST_YMin(pp.extensao),
+                       ST_XMax(pp.extensao), ST_YMax(pp.extensao), 3857), 4326) AS area
+            FROM por_produto pp
         )
-        if layer is None:
-            raise RuntimeError("❌ Falha ao criar a camada.")
-
-        campos = [
-            ("json", ogr.OFTString),     
-            ("classe", ogr.OFTString),
-            ("metadata_id", ogr.OFTString),
-            ("escala", ogr.OFTString),
-            ("data_do_produto", ogr.OFTDate),
-            ("esquema", ogr.OFTString),
-            ("graphic_representation_group", ogr.OFTString)
-        ]
-
-        for nome, tipo in campos:
-            campo = ogr.FieldDefn(nome, tipo)
-            campo.SetWidth(2048)
-            layer.CreateField(campo)
-
-        print(f"✅ Tabela '{table_name}' criada com sucesso.")
-
-    ds = None
-    
+        INSERT INTO {TABELA_CATALOGO}
+            (metadata_id, nome_arquivo, data_do_produto, data_importacao, esquema, escala,
+             area_mapeada, quantidade_feicoes, contagem_classes, bytes_economizados, bbox)
+        SELECT p.metadata_id, left(p.metadata_id, 256), p.data_do_produto, now(), p.esquema, p.escala,
+               a.area, a.quantidade, a.contagem_classes, 0,
+               jsonb_build_array(ST_XMin(a.area), ST_YMin(a.area), ST_XMax(a.area), ST_YMax(a.area))
+        FROM areas a
+        JOIN {TABELA_PRODUTOS} p ON p.id = a.produto_id
+        ON CONFLICT (metadata_id) DO NOTHING;
+    """)
+    if cur.rowcount:
+        safe_print(f"📚 {cur.rowcount} produtos legados incluídos no catálogo.")
+        incrementar_geracao(cur)
+
+def _migracao_views_grupos(cur):
+    """
+    View '_visiveis' por partição do resumo por grupo, que passa a ser a camada
+    do QGIS: a lápide esconde as feições nela, e o resumo deixa de ser limpo
+    na requisição de remoção (o expurgo apaga as linhas em lotes). Partições
+    criadas depois ganham a view em _garantir_particoes_grupos.
+    """
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s);
+    """, (TABELA_GRUPOS,))
+    for (particao,) in cur.fetchall():
+        criar_view_grupo(cur, particao)
+
+# (versão, descrição, função(cursor)). Só acrescente ao final; nunca altere uma versão já publicada.
+MIGRACOES = [
+    (1, "tabelas normalizadas de feições, produtos e classes", _migracao_layout_normalizado),
+    (2, "índices de classe, produto, geometria e json", _migracao_indices),
+    (3, "view de feições visíveis", _migracao_view_visiveis),
+    (4, "feições particionadas por tipo de geometria", _migracao_particao_tipo_geometria),
+    (5, "resumo por grupo de representação", _migracao_resumo_grupos),
+    (6, "hash por feição para reimportação diferencial", _migracao_hash_feicao),
+    (7, "estatísticas por produto, classe e tipo de geometria", _migracao_estatisticas),
+    (8, "função de chave de Hilbert para ordenação espacial", _migracao_funcao_hilbert),
+    (9, "catálogo dos produtos importados antes do catálogo", _migracao_catalogo_legado),
+    (10, "views de feições visíveis por grupo de representação", _migracao_views_grupos),
+]
+VERSAO_ESQUEMA = MIGRACOES[-1][0]
+
+_esquema_pronto = False
+
+def versao_esquema(cur):
+    """Versão aplicada no banco (0 se a tabela de controle ainda não existe)."""
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (TABELA_VERSAO_ESQUEMA,))
+    if not cur.fetchone()[0]:
+        return 0
+    cur.execute(f"SELECT coalesce(max(versao), 0) FROM {TABELA_VERSAO_ESQUEMA};")
+    return cur.fetchone()[0]
+
+def aplicar_migracoes():
+    """
+    Aplica, em ordem, as migrações ainda não registradas, cada uma na sua
+    transação. Um advisory lock garante que só um processo migra por vez.
+    Devolve a versão final.
+    """
+    global _esquema_pronto
+    conn = psycopg2.connect(**CONFIG_BANCO)
     try:
-        conn_pg = psycopg2.connect(**CONFIG_BANCO)
-        cur = conn_pg.cursor()
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_lock(hashtext(%s))", (_CHAVE_LOCK_ESQUEMA,))
         cur.execute(f"""
-            ALTER TABLE {table_name}
-            ALTER COLUMN json TYPE JSONB
-            USING json::jsonb;
+            CREATE TABLE IF NOT EXISTS {TABELA_VERSAO_ESQUEMA} (
+                versao integer PRIMARY KEY,
+                descricao varchar,
+                aplicada_em timestamptz NOT NULL DEFAULT now()
+            );
         """)
-        conn_pg.commit()
+        conn.commit()
+
+        atual = versao_esquema(cur)
+        for versao, descricao, migracao in MIGRACOES:
+            if versao <= atual:
+                continue
+            safe_print(f"🔧 Migração {versao}: {descricao}...")
+            try:
+                migracao(cur)
+                cur.execute(f"INSERT INTO {TABELA_VERSAO_ESQUEMA} (versao, descricao) VALUES (%s, %s);",
+                            (versao, descricao))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            atual = versao
+
+        cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (_CHAVE_LOCK_ESQUEMA,))
+        conn.commit()
         cur.close()
-        conn_pg.close()
-        print("🧬 Campo 'json' convertido para JSONB com sucesso.")
-    except Exception as e:
-        print(f"❌ Erro ao converter campo para JSONB: {e}")
+    finally:
+        conn.close()
 
-    criar_indices_pos_importacao(table_name)
+    _esquema_pronto = atual >= VERSAO_ESQUEMA
+    safe_print(f"✅ Esquema de geometrias na versão {atual}.")
+    return atual
 
-def criar_indices_pos_importacao(table_name):
+def garantir_esquema():
+    """
+    Verificação barata para o caminho de requisição: consulta a versão uma vez
+    por processo e depois só usa o cache. Não executa DDL.
+    """
+    global _esquema_pronto
+    if _esquema_pronto:
+        return
+    conn = psycopg2.connect(**CONFIG_BANCO)
     try:
-        conn = psycopg2.connect(**CONFIG_BANCO)
-        cursor = conn.cursor()
-
-        cursor.execute(f"""
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM pg_indexes WHERE tablename = %s AND indexname = %s
-                ) THEN
-                    EXECUTE 'CREATE INDEX idx_{table_name}_classe ON {table_name} (classe)';
-                END IF;
-            END$$;
-        """, (table_name, f"idx_{table_name}_classe"))
-
-        conn.commit()
-        cursor.close()
+        cur = conn.cursor()
+        atual = versao_esquema(cur)
+        cur.close()
+    finally:
         conn.close()
-        safe_print(f"✅ Índice da coluna 'classe' criado na tabela {table_name}.")
+    if atual < VERSAO_ESQUEMA:
+        raise RuntimeError(
+            f"Esquema de geometrias na versão {atual}, esperado {VERSAO_ESQUEMA}. "
+            "Execute 'python manage.py migrar_esquema'."
+        )
+    _esquema_pronto = True
 
-    except Exception as e:
-        print(f"❌ Erro ao criar índices na tabela {table_name}: {e}")
+def verificar_ou_criar_tabela(table_name=TABELA_GEOMETRIAS, conn_str=None, srid=3857):
+    """Mantida para scripts e testes: aplica as migrações pendentes do esquema."""
+    return aplicar_migracoes()
 
 def extract_metadata_from_xml(xml_locator):
+    return extrair_metadados(xml_locator)[:4]
+
+def extrair_metadados(xml_locator):
+    """
+    Como extract_metadata_from_xml, mais a latitude central (graus) do
+    EX_GeographicBoundingBox, ou None se o XML não a informa.
+    """
     escala = "Não informada"
     data_do_produto = None
     esquema = "EDGV"
     metadata_id = "Não informado"
+    latitude_central = None
 
     tree = _parse_xml_from_locator(xml_locator)
     if tree is None:
         safe_print("⚠️ XML não encontrado/legível; usando defaults.")
-        return escala, data_do_produto, esquema, metadata_id
+        return escala, data_do_produto, esquema, metadata_id, latitude_central
 
     try:
         ns = {'gmd': "http://www.isotc211.org/2005/gmd", 'gco': "http://www.isotc211.org/2005/gco"}
@@ -242,57 +811,113 @@ def extract_metadata_from_xml(xml_locator):
         esquema = extrair_edgv_com_versao_oficial_from_tree(tree)  # => 'EDGV 2.1.3' / 'EDGV 3.0' / 'EDGV'
         safe_print(f"📋 Esquema (XML): {esquema}")
 
+        sul = tree.find('.//gmd:EX_GeographicBoundingBox/gmd:southBoundLatitude/gco:Decimal', ns)
+        norte = tree.find('.//gmd:EX_GeographicBoundingBox/gmd:northBoundLatitude/gco:Decimal', ns)
+        if sul is not None and norte is not None and sul.text and norte.text:
+            latitude_central = (float(sul.text) + float(norte.text)) / 2
+
     except Exception as e:
         safe_print(f"❌ Erro ao extrair metadados do XML: {e}")
 
     safe_print(f"📦 Metadados -> Escala: {escala}, Data: {data_do_produto}, Esquema: {esquema}, Metadata ID: {metadata_id}")
-    return escala, data_do_produto, esquema, metadata_id
+    return escala, data_do_produto, esquema, metadata_id, latitude_central
+
+def _liberar_manifesto(caminho):
+    """Descarta o manifesto do arquivo e a eventual extração em tmpfs."""
+    with _MANIFESTOS_TRAVA:
+        item = _MANIFESTOS.get(os.path.abspath(caminho))
+    if item:
+        item[1].limpar()
 
 def abrir_datasources(caminho):
+    """
+    Gerador: abre um datasource por vez (cada shapefile do ZIP, ou o arquivo
+    inteiro) e só passa ao próximo depois que o anterior foi consumido, então
+    a memória não cresce com o número de camadas do arquivo.
+    """
     ext = os.path.splitext(caminho)[1].lower()
     vsi = os.path.abspath(caminho).replace("\\", "/")
-    
-    if ext == ".zip":
-        root = f"/vsizip/{vsi}"
-        datas = []
 
-        with zipfile.ZipFile(caminho, "r") as zf:
-            safe_print("📁 Conteúdo do ZIP:")
-            for name in zf.namelist():
-                safe_print(f" - {name}")
+    if ext == ".zip":
+        manifesto = obter_manifesto(caminho)
 
-            shp_files = [n for n in zf.namelist() if n.lower().endswith(".shp")]
+        safe_print(f"📁 ZIP com {len(manifesto.membros)} arquivos, {len(manifesto.shps)} shapefile(s).")
 
-        if not shp_files:
+        if not manifesto.shps:
             safe_print("⚠️ Nenhum arquivo .shp encontrado dentro do ZIP.")
-            return []
+            return
 
-        for shp in shp_files:
-            uri = f"/vsizip/{vsi}/{shp}"
+        manifesto.reservar()
+        try:
             try:
-                ds_shp = ogr.Open(uri)
+                manifesto.preparar_leitura()
+            except Exception as e:
+                safe_print(f"⚠️ Falha ao extrair para '{PASTA_TMPFS}' ({e}); lendo via /vsizip/.")
+
+            for shp in manifesto.shps:
+                uri = manifesto.uri_shapefile(shp)
+                try:
+                    ds_shp = ogr.Open(uri)
+                except Exception as e:
+                    safe_print(f"❌ Erro ao abrir '{shp}': {e}")
+                    continue
                 if ds_shp and ds_shp.GetLayerCount() > 0:
-                    datas.append(ds_shp)
                     safe_print(f"✅ Shapefile carregado: {shp}")
+                    yield ds_shp
                 else:
                     safe_print(f"⚠️ Ignorado: '{shp}' não contém camadas válidas.")
-            except Exception as e:
-                safe_print(f"❌ Erro ao abrir '{shp}': {e}")
-
-        return datas
+                ds_shp = None
+        finally:
+            manifesto.liberar()
 
     else:
         ds = ogr.Open(vsi)
-        return [ds] if ds and ds.GetLayerCount() > 0 else []
-
-def check_product_exists(ds, table_name, metadata_id):
-    layer = ds.ExecuteSQL(
-        f"SELECT 1 FROM {table_name} WHERE metadata_id = '{metadata_id}' LIMIT 1"
+        if ds and ds.GetLayerCount() > 0:
+            yield ds
+
+def check_product_exists(cur, metadata_id):
+    """Consulta o catálogo de produtos (índice único em metadata_id), não a tabela de geometrias."""
+    cur.execute(f"SELECT 1 FROM {TABELA_CATALOGO} WHERE metadata_id = %s", (metadata_id,))
+    return cur.fetchone() is not None
+
+def remocao_pendente(cur, metadata_id):
+    cur.execute(
+        f"SELECT 1 FROM {TABELA_REMOCOES} WHERE metadata_id = %s AND status IN ('pendente', 'removendo', 'erro') LIMIT 1",
+        (metadata_id,)
     )
-    return layer.GetFeatureCount() > 0 if layer else False
-
-def remove_all_geometries_with_metadataid(ds, table_name, metadata_id):
-    ds.ExecuteSQL(f"DELETE FROM {table_name} WHERE metadata_id = '{metadata_id}'")
+    return cur.fetchone() is not None
+
+def remove_all_geometries_with_metadataid(cur, table_name, metadata_id):
+    # table_name é a view de compatibilidade; as feições ficam em TABELA_FEICOES
+    cur.execute(f"""
+        DELETE FROM {TABELA_FEICOES}
+        WHERE produto_id = (SELECT id FROM {TABELA_PRODUTOS} WHERE metadata_id = %s)
+    """, (metadata_id,))
+    return cur.rowcount
+
+def obter_chave_produto(cur, metadata_id, escala, esquema, data_do_produto):
+    """Cria ou atualiza a linha do produto em TABELA_PRODUTOS e devolve sua chave inteira."""
+    cur.execute(f"""
+        INSERT INTO {TABELA_PRODUTOS} (metadata_id, escala, esquema, data_do_produto)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (metadata_id) DO UPDATE SET
+            escala = EXCLUDED.escala,
+            esquema = EXCLUDED.esquema,
+            data_do_produto = EXCLUDED.data_do_produto
+        RETURNING id;
+    """, (metadata_id, escala, esquema, data_do_produto))
+    return cur.fetchone()[0]
+
+def obter_chave_classe(cur, nome_classe, cache):
+    """Chave inteira da classe em TABELA_CLASSES (criada se nova); 'cache' evita ida ao banco por camada repetida."""
+    if nome_classe not in cache:
+        cur.execute(f"""
+            INSERT INTO {TABELA_CLASSES} (nome) VALUES (%s)
+            ON CONFLICT (nome) DO UPDATE SET nome = EXCLUDED.nome
+            RETURNING id;
+        """, (nome_classe,))
+        cache[nome_classe] = cur.fetchone()[0]
+    return cache[nome_classe]
 
 def _canon_esquema_label(texto: str, file_path: str = "") -> str:
     """Retorna 'EDGV 3.0', 'EDGV 2.1.3' ou 'EDGV' a partir do XML ou do nome do arquivo/pasta."""
@@ -308,10 +933,253 @@ def _canon_esquema_label(texto: str, file_path: str = "") -> str:
         return "EDGV 2.1.3"
     return "EDGV"
 
-def importar_para_tabela(file_path, table_name, xml_locator=None):
-    safe_print(f"\n📦 Importando: {os.path.basename(file_path)}")
+def _campos_camada(layer_defn):
+    """Lista (índice, nome, tipo, subtipo) dos campos da camada, calculada uma vez por camada."""
+    campos = []
+    for i in range(layer_defn.GetFieldCount()):
+        fd = layer_defn.GetFieldDefn(i)
+        campos.append((i, fd.GetName(), fd.GetType(), fd.GetSubType()))
+    return campos
+
+def _data_hora_iso(feat, i, tipo):
+    ano, mes, dia, hora, minuto, segundo, tz = feat.GetFieldAsDateTime(i)
+    if tipo == ogr.OFTDate:
+        return f"{ano:04d}-{mes:02d}-{dia:02d}"
+    seg = f"{segundo:06.3f}".rstrip("0").rstrip(".") if segundo % 1 else f"{int(segundo):02d}"
+    hms = f"{hora:02d}:{minuto:02d}:{seg}"
+    if tipo == ogr.OFTTime:
+        return hms
+    fuso = ""
+    if tz == 100:
+        fuso = "Z"
+    elif tz > 1:
+        minutos = (tz - 100) * 15
+        fuso = f"{'+' if minutos >= 0 else '-'}{abs(minutos) // 60:02d}:{abs(minutos) % 60:02d}"
+    return f"{ano:04d}-{mes:02d}-{dia:02d}T{hms}{fuso}"
+
+def atributos_tipados(feat, campos):
+    """
+    Converte os campos da feição para tipos JSON nativos conforme o tipo OGR:
+    Integer/Integer64 -> número (Boolean -> true/false), Real -> número (NaN/inf -> null),
+    Date/DateTime/Time -> texto ISO 8601, listas -> arrays, Binary -> hexadecimal.
+    """
+    atributos = {}
+    for i, nome, tipo, subtipo in campos:
+        if not feat.IsFieldSetAndNotNull(i):
+            atributos[nome] = None
+        elif tipo == ogr.OFTInteger:
+            v = feat.GetFieldAsInteger(i)
+            atributos[nome] = bool(v) if subtipo == ogr.OFSTBoolean else v
+        elif tipo == ogr.OFTInteger64:
+            atributos[nome] = feat.GetFieldAsInteger64(i)
+        elif tipo == ogr.OFTReal:
+            v = feat.GetFieldAsDouble(i)
+            atributos[nome] = v if math.isfinite(v) else None
+        elif tipo in (ogr.OFTDate, ogr.OFTDateTime, ogr.OFTTime):
+            atributos[nome] = _data_hora_iso(feat, i, tipo)
+        elif tipo == ogr.OFTIntegerList:
+            v = feat.GetFieldAsIntegerList(i)
+            atributos[nome] = [bool(x) for x in v] if subtipo == ogr.OFSTBoolean else list(v)
+        elif tipo == ogr.OFTInteger64List:
+            atributos[nome] = list(feat.GetFieldAsInteger64List(i))
+        elif tipo == ogr.OFTRealList:
+            atributos[nome] = [x if math.isfinite(x) else None for x in feat.GetFieldAsDoubleList(i)]
+        elif tipo == ogr.OFTStringList:
+            atributos[nome] = list(feat.GetFieldAsStringList(i))
+        elif tipo == ogr.OFTBinary:
+            atributos[nome] = feat.GetFieldAsBinary(i).hex()
+        else:
+            try:
+                atributos[nome] = feat.GetFieldAsString(i)
+            except UnicodeDecodeError:
+                atributos[nome] = feat.GetFieldAsBinary(i).decode("utf-8", errors="replace")
+    return atributos
+
+def atributos_texto(feat):
+    """Modo legado: todos os valores como texto (str(v))."""
+    props = json.loads(feat.ExportToJson())["properties"]
+    return {k: (str(v).encode("utf-8", errors="replace").decode("utf-8", errors="replace") if v is not None else None)
+            for k, v in props.items()}
+
+_TIPO_POR_OGR = {
+    ogr.wkbMultiPoint: "ponto",
+    ogr.wkbMultiLineString: "linha",
+    ogr.wkbMultiPolygon: "area",
+}
+
+def _tabela_tolerancias(texto):
+    """'25000:1.25,50000:2.5' -> [(25000, 1.25), (50000, 2.5)] ordenada pela escala."""
+    tabela = []
+    for item in texto.split(","):
+        if ":" in item:
+            escala, grade = item.split(":", 1)
+            tabela.append((int(escala.strip()), float(grade.strip())))
+    return sorted(tabela)
+
+def tolerancia_escala(escala, tabela=None):
+    """
+    Grade (m no terreno) para o denominador da escala do produto: usa a maior
+    escala da tabela que não ultrapassa a do produto, para nunca quantizar mais
+    grosso do que a escala justifica. None se a escala não for conhecida.
+    """
+    denominador = _escala_inteira(escala)
+    if denominador is None:
+        return None
+    tolerancia = None
+    for limite, grade in (tabela if tabela is not None else _tabela_tolerancias(PRECISAO_TOLERANCIAS)):
+        if limite <= denominador:
+            tolerancia = grade
+    return tolerancia
+
+def _grade_3857(tolerancia, y):
+    """Converte a grade em metros no terreno para unidades EPSG:3857 na latitude de y."""
+    return _grade_latitude(tolerancia, math.degrees(math.atan(math.sinh(y / 6378137.0))))
+
+def _grade_latitude(tolerancia, latitude):
+    """Grade em unidades EPSG:3857 para a latitude (graus) do centro do produto."""
+    return tolerancia / math.cos(math.radians(latitude))
+
+def _latitude_catalogo(cur, metadata_id):
+    """Latitude central do bbox do produto no catálogo (reimportações), ou None."""
+    cur.execute(f"SELECT bbox FROM {TABELA_CATALOGO} WHERE metadata_id = %s", (metadata_id,))
+    linha = cur.fetchone()
+    bbox = linha[0] if linha else None
+    return (bbox[1] + bbox[3]) / 2 if bbox else None
+
+def _tipo_geometria(geom):
+    """Partição de destino ('ponto', 'linha', 'area' ou 'outros') da geometria já convertida em Multi*."""
+    gt = geom.GetGeometryType()
+    if ogr.GT_HasM(gt):
+        return "outros"
+    return _TIPO_POR_OGR.get(ogr.GT_Flatten(gt), "outros")
+
+def hash_feicao(nome_classe, wkb, json_attr, grade=None):
+    """
+    Hash estável da feição (classe + WKB Multi* em 3857 + atributos com chaves
+    ordenadas). Com quantização, inclui a grade: a mesma WKB gravada em outra
+    grade é outra geometria no banco.
+    """
+    h = hashlib.md5(nome_classe.encode("utf-8"))
+    h.update(b"\0")
+    h.update(wkb)
+    h.update(b"\0")
+    h.update(json_attr.encode("utf-8"))
+    if grade is not None:
+        h.update(b"\0")
+        h.update(repr(grade).encode("ascii"))
+    return str(uuid.UUID(bytes=h.digest()))
+
+def aplicar_diferenca(cur, produto_id, tabela_novas, ordem_sql=None):
+    """
+    Compara as feições novas (tabela temporária) com as gravadas do produto,
+    pelo hash, e aplica só a diferença. Hashes repetidos são casados por
+    ocorrência (row_number), então duplicatas idênticas também contam.
+    'ordem_sql' (chave espacial) ordena as inseridas. Devolve (removidas, inseridas).
+    """
+    cur.execute(f"""
+        WITH antigas AS (
+            SELECT ogc_fid, tipo_geometria, hash,
+                   row_number() OVER (PARTITION BY hash ORDER BY ogc_fid) AS n
+            FROM {TABELA_FEICOES} WHERE produto_id = %s
+        ), novas AS (
+            SELECT hash, count(*) AS quantidade FROM {tabela_novas} GROUP BY hash
+        )
+        DELETE FROM {TABELA_FEICOES} f
+        USING antigas a
+        WHERE f.ogc_fid = a.ogc_fid AND f.tipo_geometria = a.tipo_geometria
+          AND (a.hash IS NULL OR NOT EXISTS (
+                SELECT 1 FROM novas s WHERE s.hash = a.hash AND s.quantidade >= a.n));
+    """, (produto_id,))
+    removidas = cur.rowcount
+
+    cur.execute(f"""
+        WITH restantes AS (
+            SELECT hash, count(*) AS quantidade FROM {TABELA_FEICOES}
+            WHERE produto_id = %s GROUP BY hash
+        )
+        INSERT INTO {TABELA_FEICOES} (json, produto_id, classe_id, tipo_geometria, hash, wkb_geometry)
+        SELECT s.json, s.produto_id, s.classe_id, s.tipo_geometria, s.hash, s.wkb_geometry
+        FROM (
+            SELECT t.*, row_number() OVER (PARTITION BY t.hash) AS n FROM {tabela_novas} t
+        ) s
+        LEFT JOIN restantes r ON r.hash = s.hash
+        WHERE s.n > coalesce(r.quantidade, 0)
+        {f"ORDER BY {ordem_sql}" if ordem_sql else ""};
+    """, (produto_id,))
+    return removidas, cur.rowcount
+
+def _camadas(primeiro, datasources):
+    """
+    Estágio de leitura: camadas do primeiro datasource e, em seguida, dos
+    demais, abertos sob demanda; cada um é solto assim que termina.
+    """
+    yield from primeiro
+    primeiro = None
+    for ds in datasources:
+        yield from ds
 
-    escala, data_do_produto, esquema, metadata_id = extract_metadata_from_xml(xml_locator)
+class _EscritorLotes(threading.Thread):
+    """
+    Estágio final do pipeline de importação: grava no banco os lotes recebidos
+    por uma fila limitada, enquanto a thread principal lê e transforma os
+    próximos. Com a fila cheia, o leitor espera (contrapressão). Após um erro,
+    só drena a fila até o fim, para o produtor nunca ficar bloqueado.
+    """
+    def __init__(self, gravar, tamanho_fila):
+        super().__init__(name="importacao-escritor", daemon=True)
+        self.fila = queue.Queue(maxsize=tamanho_fila)
+        self.gravar = gravar
+        self.bytes_gravados = 0
+        self.tempo_escrita = 0.0  # s gravando no banco
+        self.tempo_espera = 0.0   # s que o produtor ficou bloqueado com a fila cheia
+        self.erro = None
+
+    def run(self):
+        while True:
+            lote = self.fila.get()
+            if lote is None:
+                return
+            if self.erro is not None:
+                continue
+            inicio = time.perf_counter()
+            try:
+                self.bytes_gravados += self.gravar(lote)
+            except Exception as e:
+                self.erro = e
+            self.tempo_escrita += time.perf_counter() - inicio
+
+    def enviar(self, lote):
+        if self.erro is not None:
+            raise self.erro
+        inicio = time.perf_counter()
+        self.fila.put(lote)
+        self.tempo_espera += time.perf_counter() - inicio
+
+    def concluir(self):
+        self.fila.put(None)
+        self.join()
+        if self.erro is not None:
+            raise self.erro
+
+def importar_para_tabela(file_path, table_name, xml_locator=None, modo=None, estatisticas=None,
+                         ordenacao=None):
+    """
+    Importa o arquivo e devolve o número de feições. Se 'estatisticas' (dict)
+    for passado, recebe o metadata_id gravado, feições, bytes do arquivo,
+    duração, feições/s, tempos por etapa e o processo, no formato dos campos de
+    HistoricoImportacaoExclusao.
+    'ordenacao' (padrão ORDENACAO_ESPACIAL) grava as feições na ordem da chave
+    espacial, passando por uma tabela temporária.
+    """
+    safe_print(f"\n📦 Importando: {os.path.basename(file_path)}")
+    inicio_importacao = time.perf_counter()
+    etapas = {}
+    modo = (modo or IMPORTACAO_MODO).strip().lower()
+    ordenacao = (ordenacao or ORDENACAO_ESPACIAL).strip().lower()
+    if ordenacao not in ORDENACOES_ESPACIAIS:
+        ordenacao = None
+
+    escala, data_do_produto, esquema, metadata_id, latitude_central = extrair_metadados(xml_locator)
     esquema = _canon_esquema_label(esquema, file_path)
 
     if metadata_id == "Não informado":
@@ -319,71 +1187,300 @@ def importar_para_tabela(file_path, table_name, xml_locator=None):
         safe_print(f"🆔 Usando nome do arquivo como Metadata ID: {metadata_id}")
 
     datasources = abrir_datasources(file_path)
-    if not datasources:
-        safe_print(f"⚠️ Ignorando '{file_path}': sem vetores suportados.")
-        return
+    try:
+        primeiro = next(datasources, None)
+        if primeiro is None:
+            safe_print(f"⚠️ Ignorando '{file_path}': sem vetores suportados.")
+            return
 
-    conn_str = "PG: " + " ".join(f"{k}={v}" for k, v in CONFIG_BANCO.items())
-    ds_out = ogr.Open(conn_str, update=1)
-    if not ds_out:
-        raise RuntimeError("❌ Falha na conexão com banco de dados.")
-    layer_out = ds_out.GetLayerByName(table_name)
+        conn = psycopg2.connect(**CONFIG_BANCO)
+        try:
+            cur = conn.cursor()
+            # Serializa importações concorrentes do mesmo produto
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (metadata_id,))
+
+            if remocao_pendente(cur, metadata_id):
+                raise RuntimeError(f"Remoção do produto '{metadata_id}' em andamento; importe novamente ao final.")
+
+            # Reimportação diferencial: as feições vão para uma tabela temporária e só a
+            # diferença (por hash) chega a TABELA_FEICOES; linhas inalteradas ficam intactas.
+            # Com ordenação espacial também: a tabela temporária é copiada já ordenada.
+            diferencial = False
+            if check_product_exists(cur, metadata_id):
+                if modo == "diferencial":
+                    diferencial = True
+                    safe_print("🔀 Reimportação diferencial (comparando hashes das feições)…")
+                else:
+                    safe_print("🔁 Removendo feições antigas…")
+                    remove_all_geometries_with_metadataid(cur, table_name, metadata_id)
+
+            tabela_destino = TABELA_FEICOES
+            if diferencial or ordenacao:
+                tabela_destino = "importacao_novas_feicoes"
+                cur.execute(f"""
+                    CREATE TEMP TABLE {tabela_destino} (
+                        json jsonb, produto_id integer, classe_id smallint,
+                        tipo_geometria varchar(8), hash uuid, wkb_geometry geometry
+                    ) ON COMMIT DROP;
+                """)
+            ordem_sql = chave_espacial_sql(ordenacao) if ordenacao else None
+
+            # Metadados do produto e nome da classe ficam uma vez em tabelas próprias;
+            # cada feição guarda só as chaves inteiras
+            produto_id = obter_chave_produto(cur, metadata_id, escala, esquema, data_do_produto)
+            chaves_classes = {}
+
+            sql_insert = f"""
+                INSERT INTO {tabela_destino} (json, produto_id, classe_id, tipo_geometria, hash, wkb_geometry)
+                VALUES %s
+            """
+            template = "(%s, %s, %s, %s, %s::uuid, ST_GeomFromWKB(%s, 3857))"
+            lote = []
+
+            # Quantização: uma grade única por produto (vértices compartilhados
+            # entre feições vizinhas continuam coincidentes), aplicada pelo PostGIS.
+            # A grade vem do centro do produto (bbox do XML, senão o do catálogo), então
+            # é a mesma a cada reimportação; sem nenhum dos dois, da primeira feição.
+            tolerancia = tolerancia_escala(escala) if PRECISAO_MODO == "escala" else None
+            grade = None
+            bytes_originais = 0
+            if tolerancia:
+                if latitude_central is None:
+                    latitude_central = _latitude_catalogo(cur, metadata_id)
+                if latitude_central is not None:
+                    grade = _grade_latitude(tolerancia, latitude_central)
+                # ST_Multi: uma feição que colapsa vira EMPTY do mesmo tipo Multi* (CHECK da partição)
+                template = "(%s, %s, %s, %s, %s::uuid, ST_Multi(ST_ReducePrecision(ST_GeomFromWKB(%s, 3857), %s)))"
+                sql_insert += " RETURNING octet_length(ST_AsBinary(wkb_geometry))"
+                safe_print(f"📏 Quantizando em grade de {tolerancia} m (escala {escala}).")
+
+            # Cursor exclusivo da thread escritora (mesma conexão e transação)
+            cur_escrita = conn.cursor()
+
+            def gravar_lote(lote):
+                linhas = execute_values(cur_escrita, sql_insert, lote, template=template,
+                                        page_size=IMPORTACAO_LOTE, fetch=bool(tolerancia))
+                return sum(r[0] or 0 for r in linhas) if tolerancia else 0
+
+            escritor = _EscritorLotes(gravar_lote, IMPORTACAO_FILA)
+            escritor.start()
+
+            count = 0
+            contagem_classes = {}
+            extensao = None  # (minx, maxx, miny, maxy) acumulada em EPSG:3857
+            target_srs = osr.SpatialReference(); target_srs.ImportFromEPSG(3857)
+
+            etapas["preparacao"] = time.perf_counter() - inicio_importacao
+            inicio_etapa = time.perf_counter()
+            camadas = _camadas(primeiro, datasources)
+            primeiro = None
+            try:
+                for layer in camadas:
+                    nome_classe = layer.GetName()
+                    safe_print(f"🎯 Processando camada: '{nome_classe}'")
+                    classe_id = obter_chave_classe(cur, nome_classe, chaves_classes)
+
+                    campos = _campos_camada(layer.GetLayerDefn())
+                    source_srs = layer.GetSpatialRef()
+                    transform = None
+                    if source_srs and not source_srs.IsSame(target_srs):
+                        transform = osr.CoordinateTransformation(source_srs, target_srs)
+                    elif not source_srs:
+                        safe_print(f"⚠️ Camada '{nome_classe}' sem SRS; mantendo geometria.")
+
+                    for feat in layer:
+                        geom = feat.GetGeometryRef()
+                        if not geom:
+                            continue
+
+                        if transform:
+                            geom = geom.Clone()
+                            geom.Transform(transform)
+
+                        extensao = _acumular_extensao(extensao, geom.GetEnvelope())
+
+                        gt = geom.GetGeometryType()
+                        if gt in (ogr.wkbPoint, ogr.wkbPoint25D):
+                            geom = ogr.ForceToMultiPoint(geom)
+                        elif gt in (ogr.wkbLineString, ogr.wkbLineString25D):
+                            geom = ogr.ForceToMultiLineString(geom)
+                        elif gt in (ogr.wkbPolygon, ogr.wkbPolygon25D):
+                            geom = ogr.ForceToMultiPolygon(geom)
+
+                        tipo_geometria = _tipo_geometria(geom)
+
+                        if MODO_ATRIBUTOS == "texto":
+                            clean = atributos_texto(feat)
+                        else:
+                            clean = atributos_tipados(feat, campos)
+                        json_attr = json.dumps(clean, ensure_ascii=False, sort_keys=True)
+
+                        wkb = geom.ExportToWkb()
+                        if tolerancia:
+                            if grade is None:
+                                minx, maxx, miny, maxy = geom.GetEnvelope()
+                                grade = _grade_3857(tolerancia, (miny + maxy) / 2)
+                            bytes_originais += len(wkb)
+                        # O hash cobre a grade: mudou a grade, a feição gravada muda
+                        registro = (json_attr, produto_id, classe_id, tipo_geometria,
+                                    hash_feicao(nome_classe, wkb, json_attr, grade), psycopg2.Binary(wkb))
+                        if tolerancia:
+                            registro += (grade,)
+                        lote.append(registro)
+                        if len(lote) >= IMPORTACAO_LOTE:
+                            escritor.enviar(lote)
+                            lote = []
+                        count += 1
+                        contagem_classes[nome_classe] = contagem_classes.get(nome_classe, 0) + 1
+
+                if lote:
+                    escritor.enviar(lote)
+            finally:
+                # Sempre encerra o escritor; se ele falhou, o erro sobe daqui
+                escritor.concluir()
+            bytes_gravados = escritor.bytes_gravados
+            etapas["leitura_transformacao"] = time.perf_counter() - inicio_etapa - escritor.tempo_espera
+            etapas["espera_escrita"] = escritor.tempo_espera
+            etapas["escrita"] = escritor.tempo_escrita
+            inicio_etapa = time.perf_counter()
+            cur_escrita.close()
+
+            if diferencial:
+                removidas, inseridas = aplicar_diferenca(cur, produto_id, tabela_destino, ordem_sql)
+                etapas["diferenca"] = time.perf_counter() - inicio_etapa
+                inicio_etapa = time.perf_counter()
+                safe_print(f"🔀 Diferencial: {count - inseridas} inalteradas, "
+                           f"{removidas} removidas, {inseridas} inseridas.")
+            elif ordenacao:
+                # Sort do PostgreSQL: passa para disco (externo) quando o produto excede work_mem
+                cur.execute(f"""
+                    INSERT INTO {TABELA_FEICOES} (json, produto_id, classe_id, tipo_geometria, hash, wkb_geometry)
+                    SELECT json, produto_id, classe_id, tipo_geometria, hash, wkb_geometry
+                    FROM {tabela_destino}
+                    ORDER BY {ordem_sql};
+                """)
+                etapas["ordenacao"] = time.perf_counter() - inicio_etapa
+                inicio_etapa = time.perf_counter()
+                safe_print(f"🧭 {cur.rowcount} feições gravadas em ordem espacial ({ordenacao}).")
+
+            bytes_economizados = bytes_originais - bytes_gravados
+            if tolerancia and bytes_originais:
+                safe_print(f"📉 Quantização: {bytes_economizados} bytes de WKB economizados "
+                           f"({100 * bytes_economizados / bytes_originais:.1f}% de {bytes_originais}).")
+
+            # Grupos de representação, resumo por grupo e estatísticas só deste produto
+            mapear_grupos(cur, metadata_ids=[metadata_id])
+            atualizar_resumo_grupos(cur, [metadata_id])
+            atualizar_estatisticas(cur, [metadata_id])
+
+            # Catálogo gravado na mesma transação das feições
+            salvar_produto(cur, metadata_id, file_path, escala, data_do_produto, esquema,
+                           extensao, count, contagem_classes,
+                           precisao_grade=grade, bytes_economizados=bytes_economizados)
+            incrementar_geracao(cur)
+            etapas["grupos_catalogo"] = time.perf_counter() - inicio_etapa
+            inicio_etapa = time.perf_counter()
+            conn.commit()
+            etapas["commit"] = time.perf_counter() - inicio_etapa
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        duracao = time.perf_counter() - inicio_importacao
+        safe_print(f"✅ {count} feições importadas de '{os.path.basename(file_path)}' em {duracao:.1f}s.")
+        if estatisticas is not None:
+            estatisticas.update(
+                metadata_id=metadata_id,
+                quantidade_feicoes=count,
+                bytes=os.path.getsize(file_path),
+                duracao_s=round(duracao, 3),
+                feicoes_por_s=round(count / duracao, 1) if duracao else None,
+                tempos_etapas={k: round(v, 3) for k, v in etapas.items()},
+                worker=identificador_processo(),
+            )
+        return count
+    finally:
+        datasources.close()  # encerra a leitura (libera a reserva da pasta extraída)
+        primeiro = datasources = None
+        _liberar_manifesto(file_path)
+
+def _acumular_extensao(extensao, envelope):
+    """Une o envelope OGR (minx, maxx, miny, maxy) à extensão acumulada do produto."""
+    if extensao is None:
+        return envelope
+    return (
+        min(extensao[0], envelope[0]), max(extensao[1], envelope[1]),
+        min(extensao[2], envelope[2]), max(extensao[3], envelope[3]),
+    )
 
-    if check_product_exists(ds_out, table_name, metadata_id):
-        safe_print("🔁 Removendo feições antigas…")
-        remove_all_geometries_with_metadataid(ds_out, table_name, metadata_id)
+def _escala_inteira(escala):
+    """'1:25000' -> 25000; None se a escala não for numérica."""
+    m = re.match(r'^\s*1\s*:\s*(\d+)\s*$', escala or "")
+    return int(m.group(1)) if m else None
 
-    count = 0
-    target_srs = osr.SpatialReference(); target_srs.ImportFromEPSG(3857)
+def salvar_produto(cur, metadata_id, file_path, escala, data_do_produto, esquema,
+                   extensao, quantidade_feicoes, contagem_classes,
+                   precisao_grade=None, bytes_economizados=0):
+    """
+    Grava (ou atualiza) o produto no catálogo (importservice_produtogeoespacial)
+    usando o cursor da importação, para que catálogo e feições sejam confirmados
+    juntos. Guarda contagens total e por classe, a área mapeada e o bbox (EPSG:4326)
+    derivados da extensão acumulada. Quando o metadata_id é um UUID, também
+    alimenta importservice_productindex.
+    """
+    if extensao is None:
+        safe_print("⚠️ Produto sem geometrias; área mapeada não calculada.")
+        envelope_sql, envelope_params = "NULL::geometry", []
+    else:
+        minx, maxx, miny, maxy = extensao
+        envelope_sql = "ST_Transform(ST_MakeEnvelope(%s, %s, %s, %s, 3857), 4326)"
+        envelope_params = [minx, miny, maxx, maxy]
+
+    nome_arquivo = os.path.basename(file_path)
+    cur.execute(f"""
+        WITH area AS (SELECT {envelope_sql} AS g)
+        INSERT INTO {TABELA_CATALOGO}
+            (metadata_id, nome_arquivo, data_do_produto, data_importacao, esquema, escala,
+             area_mapeada, quantidade_feicoes, contagem_classes, precisao_grade, bytes_economizados, bbox)
+        SELECT %s, %s, %s, now(), %s, %s, area.g, %s, %s, %s, %s,
+               CASE WHEN area.g IS NULL THEN NULL
+                    ELSE jsonb_build_array(ST_XMin(area.g), ST_YMin(area.g), ST_XMax(area.g), ST_YMax(area.g)) END
+        FROM area
+        ON CONFLICT (metadata_id) DO UPDATE SET
+            nome_arquivo = EXCLUDED.nome_arquivo,
+            data_do_produto = EXCLUDED.data_do_produto,
+            data_importacao = EXCLUDED.data_importacao,
+            esquema = EXCLUDED.esquema,
+            escala = EXCLUDED.escala,
+            area_mapeada = EXCLUDED.area_mapeada,
+            quantidade_feicoes = EXCLUDED.quantidade_feicoes,
+            contagem_classes = EXCLUDED.contagem_classes,
+            precisao_grade = EXCLUDED.precisao_grade,
+            bytes_economizados = EXCLUDED.bytes_economizados,
+            bbox = EXCLUDED.bbox;
+    """, [*envelope_params, metadata_id, nome_arquivo[:256], data_do_produto, esquema, escala,
+          quantidade_feicoes, Json(contagem_classes), precisao_grade, bytes_economizados])
 
-    for ds in datasources:
-        for layer in ds:
-            nome_classe = layer.GetName()
-            safe_print(f"🎯 Processando camada: '{nome_classe}'")
-
-            source_srs = layer.GetSpatialRef()
-            transform = None
-            if source_srs and not source_srs.IsSame(target_srs):
-                transform = osr.CoordinateTransformation(source_srs, target_srs)
-            elif not source_srs:
-                safe_print(f"⚠️ Camada '{nome_classe}' sem SRS; mantendo geometria.")
-
-            for feat in layer:
-                geom = feat.GetGeometryRef()
-                if not geom:
-                    continue
+    try:
+        metadata_uuid = uuid.UUID(metadata_id)
+    except ValueError:
+        metadata_uuid = None
+    escala_int = _escala_inteira(escala)
 
-                if transform:
-                    geom = geom.Clone()
-                    geom.Transform(transform)
-
-                gt = geom.GetGeometryType()
-                if gt in (ogr.wkbPoint, ogr.wkbPoint25D):
-                    geom = ogr.ForceToMultiPoint(geom)
-                elif gt in (ogr.wkbLineString, ogr.wkbLineString25D):
-                    geom = ogr.ForceToMultiLineString(geom)
-                elif gt in (ogr.wkbPolygon, ogr.wkbPolygon25D):
-                    geom = ogr.ForceToMultiPolygon(geom)
-
-                props = json.loads(feat.ExportToJson())["properties"]
-                clean = {k: (str(v).encode("utf-8", errors="replace").decode("utf-8", errors="replace") if v is not None else None)
-                         for k, v in props.items()}
-                json_attr = json.dumps(clean, ensure_ascii=False)
-
-                fo = ogr.Feature(layer_out.GetLayerDefn())
-                fo.SetField("json", json_attr)
-                fo.SetField("classe", nome_classe)
-                fo.SetField("metadata_id", metadata_id)
-                fo.SetField("escala", escala)
-                fo.SetField("data_do_produto", data_do_produto)
-                fo.SetField("esquema", esquema)  # <-- 'EDGV 2.1.3' / 'EDGV 3.0' / 'EDGV'
-                fo.SetGeometry(geom)
-                layer_out.CreateFeature(fo)
-                count += 1
-        ds = None
-
-    ds_out = None
-    safe_print(f"✅ {count} feições importadas de '{os.path.basename(file_path)}'.")
+    if metadata_uuid and escala_int and data_do_produto and extensao is not None:
+        cur.execute(f"""
+            INSERT INTO importservice_productindex (metadataid, area, date, scale, file_path)
+            VALUES (%s, ST_Multi({envelope_sql}), %s, %s, %s)
+            ON CONFLICT (metadataid) DO UPDATE SET
+                area = EXCLUDED.area,
+                date = EXCLUDED.date,
+                scale = EXCLUDED.scale,
+                file_path = EXCLUDED.file_path;
+        """, [str(metadata_uuid), *envelope_params, data_do_produto, escala_int, nome_arquivo[:100]])
+
+    safe_print(f"🗂️ Produto '{metadata_id}' registrado no catálogo ({quantidade_feicoes} feições).")
 
 def find_xml_for_file(caminho_arquivo):
     """
@@ -399,22 +1496,13 @@ def find_xml_for_file(caminho_arquivo):
         safe_print(f"📄 XML encontrado (fs): {caminho_arquivo}")
         return ("fs", caminho_arquivo)
 
-    # Se for zip, procurar um XML lá dentro
+    # Se for zip, procurar um XML lá dentro (o manifesto já prioriza nomes típicos)
     if ext == ".zip" and os.path.exists(caminho_arquivo):
         try:
-            with zipfile.ZipFile(caminho_arquivo, "r") as zf:
-                xmls = [n for n in zf.namelist() if n.lower().endswith(".xml")]
-                if xmls:
-                    # prioriza nomes típicos
-                    def score(n):
-                        nlow = n.lower()
-                        return (
-                            0 if re.search(r'metad|metadata|metadado|ident|edgv|catalog|feature', nlow) else 1,
-                            len(n)
-                        )
-                    xmls.sort(key=score)
-                    safe_print(f"📄 XML encontrado (zip): {xmls[0]}")
-                    return ("zip", caminho_arquivo, xmls[0])
+            manifesto = obter_manifesto(caminho_arquivo)
+            if manifesto.xml_membro:
+                safe_print(f"📄 XML encontrado (zip): {manifesto.xml_membro}")
+                return ("zip", caminho_arquivo, manifesto.xml_membro)
         except Exception as e:
             safe_print(f"❌ Erro analisando ZIP: {e}")
 
@@ -428,56 +1516,300 @@ def find_xml_for_file(caminho_arquivo):
     safe_print(f"⚠️ XML não encontrado para: {caminho_arquivo}")
     return None
 
-def aplicar_mapeamento_via_sql(table_name):
+# ------------------------ MIGRAÇÃO DE ATRIBUTOS ------------------------
+def _lista_de_texto(valor):
+    """"['a', 'b']" (str de lista Python, modo legado) -> ['a', 'b']; devolve o texto se não for lista."""
+    try:
+        lista = ast.literal_eval(valor)
+    except (ValueError, SyntaxError):
+        return valor
+    return list(lista) if isinstance(lista, (list, tuple)) else valor
+
+_CONVERSORES_LEGADO = {
+    "booleano": lambda v: v == "True",
+    "inteiro": int,
+    "real": float,
+    "data": lambda v: v.replace("/", "-"),
+    "lista": _lista_de_texto,
+}
+
+def migrar_atributos_tipados(lote=5000):
+    """
+    Reescreve, em lotes confirmados um a um (paginação por ogc_fid), os atributos
+    gravados como texto pelo modo legado para tipos JSON nativos. Lê pela view
+    TABELA_GEOMETRIAS (que traz o nome da classe) e grava em TABELA_FEICOES. O tipo de cada
+    atributo é decidido por classe (inferir_tipos_atributos), de modo que um campo
+    só vira número se todos os seus valores na classe forem numéricos.
+    Pode ser interrompida e executada de novo: linhas já tipadas não mudam.
+    """
+    conn = psycopg2.connect(**CONFIG_BANCO)
     try:
-        conn = psycopg2.connect(**CONFIG_BANCO)
         cur = conn.cursor()
+        conversoes = {}
+        for classe, nome, tipo in inferir_tipos_atributos(cur, TABELA_GEOMETRIAS, "true", ()):
+            if tipo in _CONVERSORES_LEGADO:
+                conversoes.setdefault(classe, {})[nome] = _CONVERSORES_LEGADO[tipo]
+        conn.commit()
+        safe_print(f"🔎 {sum(len(c) for c in conversoes.values())} atributos a converter em {len(conversoes)} classes.")
+
+        ultimo, alteradas = 0, 0
+        while True:
+            cur.execute(f"""
+                SELECT ogc_fid, classe, json FROM {TABELA_GEOMETRIAS}
+                WHERE ogc_fid > %s
+                ORDER BY ogc_fid
+                LIMIT %s;
+            """, (ultimo, lote))
+            linhas = cur.fetchall()
+            if not linhas:
+                break
+            ultimo = linhas[-1][0]
+
+            atualizacoes = []
+            for fid, classe, atributos in linhas:
+                regras = conversoes.get(classe)
+                if not regras or not atributos:
+                    continue
+                novo, mudou = dict(atributos), False
+                for nome, conversor in regras.items():
+                    valor = novo.get(nome)
+                    if isinstance(valor, str):
+                        try:
+                            novo[nome] = conversor(valor)
+                            mudou = True
+                        except (TypeError, ValueError):
+                            pass
+                if mudou:
+                    atualizacoes.append((fid, json.dumps(novo, ensure_ascii=False)))
+
+            if atualizacoes:
+                execute_values(cur, f"""
+                    UPDATE {TABELA_FEICOES} t SET json = v.json::jsonb
+                    FROM (VALUES %s) AS v(ogc_fid, json)
+                    WHERE t.ogc_fid = v.ogc_fid;
+                """, atualizacoes, page_size=lote)
+            conn.commit()
+            alteradas += len(atualizacoes)
+            safe_print(f"🧬 Até ogc_fid {ultimo}: {alteradas} feições convertidas.")
 
-        # Índices para acelerar o join
-        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_classe_esquema ON {table_name} (classe, esquema);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_importservice_rep_classe_esquema ON importservice_representacaografica (classe, esquema);")
+        cur.close()
+        safe_print(f"✅ Migração concluída: {alteradas} feições com atributos tipados.")
+        return alteradas
+    finally:
+        conn.close()
 
-        # 1) Join por classe+esquema (ambos normalizados em lower)
-        cur.execute(f"""
-            WITH rep AS (
-              SELECT lower(trim(classe))   AS classe_norm,
-                     lower(trim(esquema))  AS esquema_norm,
-                     trim(coalesce(grupo_representacao,'OUTRO')) AS grupo
-              FROM importservice_representacaografica
-            )
-            UPDATE {table_name} g
-            SET graphic_representation_group = r.grupo
-            FROM rep r
-            WHERE lower(g.classe)  = r.classe_norm
-              AND lower(g.esquema) = r.esquema_norm;
-        """)
+# ------------------------ EXPORTAÇÃO ------------------------
+EXPORTACAO_LOTE = 2000
 
-        # 2) Fallback: onde não casou, usar só a classe (independente de esquema)
-        cur.execute(f"""
-            UPDATE {table_name} g
-            SET graphic_representation_group = r.grupo
-            FROM (
-              SELECT lower(trim(classe)) AS classe_norm,
-                     min(trim(coalesce(grupo_representacao,'OUTRO'))) AS grupo
-              FROM importservice_representacaografica
-              GROUP BY 1
-            ) r
-            WHERE (g.graphic_representation_group IS NULL OR g.graphic_representation_group = '' OR g.graphic_representation_group = 'OUTRO')
-              AND lower(g.classe) = r.classe_norm;
-        """)
+_TIPOS_CAMPO_OGR = {
+    "booleano": (ogr.OFTInteger, ogr.OFSTBoolean),
+    "inteiro": (ogr.OFTInteger64, ogr.OFSTNone),
+    "real": (ogr.OFTReal, ogr.OFSTNone),
+    "data": (ogr.OFTDate, ogr.OFSTNone),
+    "lista": (ogr.OFTStringList, ogr.OFSTNone),
+    "texto": (ogr.OFTString, ogr.OFSTNone),
+}
+
+_TIPOS_GEOMETRIA_OGR = {
+    "MULTIPOINT": ogr.wkbMultiPoint,
+    "MULTILINESTRING": ogr.wkbMultiLineString,
+    "MULTIPOLYGON": ogr.wkbMultiPolygon,
+    "POINT": ogr.wkbPoint,
+    "LINESTRING": ogr.wkbLineString,
+    "POLYGON": ogr.wkbPolygon,
+}
+
+def inferir_tipos_atributos(cur, table_name, where_sql, params):
+    """
+    Deduz, numa única agregação sobre o JSONB, o tipo de cada atributo por classe:
+    'booleano', 'inteiro', 'real', 'data', 'lista' ou 'texto'. Valores gravados
+    como texto (modo antigo, str(v)) contam como numéricos/datas/listas quando
+    todos os valores do atributo na classe têm esse formato.
+    Retorna [(classe, atributo, tipo)] na ordem das chaves do JSONB.
+    """
+    cur.execute(rf"""
+        SELECT g.classe, a.key,
+               array_remove(array_agg(DISTINCT jsonb_typeof(a.value)), 'null') AS tipos,
+               bool_and(CASE jsonb_typeof(a.value)
+                   WHEN 'string' THEN (a.value #>> '{{}}') IN ('True', 'False')
+                   ELSE true END) AS booleano,
+               bool_and(CASE jsonb_typeof(a.value)
+                   WHEN 'number' THEN trunc((a.value #>> '{{}}')::numeric) = (a.value #>> '{{}}')::numeric
+                   WHEN 'string' THEN (a.value #>> '{{}}') ~ '^-?(0|[1-9][0-9]{{0,17}})$'
+                   ELSE true END) AS inteiro,
+               bool_and(CASE jsonb_typeof(a.value)
+                   WHEN 'string' THEN (a.value #>> '{{}}') ~ '^-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?$'
+                   ELSE true END) AS real,
+               bool_and(CASE jsonb_typeof(a.value)
+                   WHEN 'string' THEN (a.value #>> '{{}}') ~ '^[0-9]{{4}}[-/][0-9]{{2}}[-/][0-9]{{2}}$'
+                   ELSE true END) AS data,
+               bool_and(CASE jsonb_typeof(a.value)
+                   WHEN 'string' THEN (a.value #>> '{{}}') ~ '^\[.*\]$'
+                   ELSE true END) AS lista,
+               min(a.ordem) AS ordem
+        FROM {table_name} g
+        CROSS JOIN LATERAL jsonb_each(g.json) WITH ORDINALITY AS a(key, value, ordem)
+        WHERE {where_sql}
+        GROUP BY g.classe, a.key
+        ORDER BY g.classe, ordem;
+    """, params)
+    resultado = []
+    for classe, nome, tipos, booleano, inteiro, real, data, lista, _ in cur.fetchall():
+        tipos = set(tipos or [])
+        if tipos and tipos <= {"boolean", "string"} and booleano:
+            tipo = "booleano"
+        elif tipos and tipos <= {"number", "string"} and inteiro:
+            tipo = "inteiro"
+        elif tipos and tipos <= {"number", "string"} and real:
+            tipo = "real"
+        elif tipos == {"string"} and data:
+            tipo = "data"
+        elif tipos and tipos <= {"array", "string"} and lista:
+            tipo = "lista"
+        else:
+            tipo = "texto"
+        resultado.append((classe, nome, tipo))
+    return resultado
+
+def _esquema_exportacao(cur, table_name, metadata_id):
+    """
+    Reconstrói, a partir do JSONB, os campos de cada classe do produto e o tipo
+    OGR de cada um. Valores gravados como texto (importações antigas) voltam a ser
+    numéricos/datas quando todos os valores do campo têm esse formato.
+    Retorna {classe: {"geometria": tipo_ogr, "campos": [(nome, tipo, subtipo)]}}.
+    """
+    cur.execute(f"""
+        SELECT classe, array_agg(DISTINCT GeometryType(wkb_geometry))
+        FROM {table_name} g
+        WHERE g.metadata_id = %s AND {filtro_visivel("g")}
+        GROUP BY classe
+        ORDER BY classe;
+    """, (metadata_id,))
+    classes = {}
+    for classe, tipos in cur.fetchall():
+        tipos = [t for t in tipos if t]
+        geometria = _TIPOS_GEOMETRIA_OGR.get(tipos[0], ogr.wkbUnknown) if len(tipos) == 1 else ogr.wkbUnknown
+        classes[classe] = {"geometria": geometria, "campos": []}
+
+    for classe, nome, tipo_json in inferir_tipos_atributos(
+            cur, table_name, f"g.metadata_id = %s AND {filtro_visivel('g')}", (metadata_id,)):
+        tipo, subtipo = _TIPOS_CAMPO_OGR[tipo_json]
+        classes.setdefault(classe, {"geometria": ogr.wkbUnknown, "campos": []})["campos"].append((nome, tipo, subtipo))
+    return classes
+
+def _preencher_campo(feat, idx, tipo, valor):
+    if valor is None:
+        feat.SetFieldNull(idx)
+    elif tipo == ogr.OFTInteger:
+        feat.SetField(idx, 1 if valor in (True, 1, "True", "true", "1") else 0)
+    elif tipo == ogr.OFTInteger64:
+        feat.SetField(idx, int(valor))
+    elif tipo == ogr.OFTReal:
+        feat.SetField(idx, float(valor))
+    elif tipo == ogr.OFTStringList:
+        if isinstance(valor, str):
+            valor = _lista_de_texto(valor)
+        feat.SetFieldStringList(idx, [v if isinstance(v, str) else json.dumps(v, ensure_ascii=False) for v in valor])
+    elif tipo == ogr.OFTDate:
+        feat.SetField(idx, str(valor).replace("-", "/"))
+    else:
+        feat.SetField(idx, valor if isinstance(valor, str) else json.dumps(valor, ensure_ascii=False))
 
-        # 3) Garante valor
+def exportar_produto(metadata_id, formato, pasta_destino, table_name=TABELA_GEOMETRIAS):
+    """
+    Exporta um produto para GeoPackage (uma camada por classe) ou FlatGeobuf (um
+    .fgb por classe, empacotados num ZIP sem compressão) dentro de pasta_destino.
+    As feições são lidas por cursor do lado do servidor, em lotes, ordenadas por
+    classe; a memória usada não depende do tamanho do produto.
+    Retorna o caminho do arquivo gerado ou None se o produto não existir.
+    """
+    driver_nome, extensao, um_por_classe = FORMATOS_EXPORTACAO[formato]
+    driver = ogr.GetDriverByName(driver_nome)
+    srs = osr.SpatialReference(); srs.ImportFromEPSG(3857)
+    nome_base = re.sub(r'[^\w.-]+', '_', metadata_id)
+
+    conn = conectar_leitura()
+    try:
+        cur = conn.cursor()
+        classes = _esquema_exportacao(cur, table_name, metadata_id)
+        cur.close()
+        if not classes:
+            return None
+
+        if um_por_classe:
+            pasta_camadas = os.path.join(pasta_destino, nome_base)
+            os.makedirs(pasta_camadas, exist_ok=True)
+            ds_out = None
+        else:
+            caminho = os.path.join(pasta_destino, nome_base + extensao)
+            ds_out = driver.CreateDataSource(caminho)
+
+        cur = conn.cursor(name="exportacao_produto")
+        cur.itersize = EXPORTACAO_LOTE
         cur.execute(f"""
-            UPDATE {table_name}
-            SET graphic_representation_group = 'OUTRO'
-            WHERE graphic_representation_group IS NULL OR graphic_representation_group = '';
-        """)
+            SELECT classe, json, ST_AsBinary(wkb_geometry)
+            FROM {table_name} g
+            WHERE g.metadata_id = %s AND {filtro_visivel("g")}
+            ORDER BY classe, ogc_fid;
+        """, (metadata_id,))
+
+        classe_atual, layer, campos, ds_classe = None, None, None, None
+        transacional, pendentes, count = False, 0, 0
+        for classe, atributos, wkb in cur:
+            if classe != classe_atual:
+                if transacional:
+                    layer.CommitTransaction()
+                ds_classe = None
+                if um_por_classe:
+                    ds_classe = driver.CreateDataSource(os.path.join(pasta_camadas, re.sub(r'[^\w.-]+', '_', classe) + extensao))
+                alvo = ds_classe or ds_out
+                info = classes[classe]
+                layer = alvo.CreateLayer(classe, srs, geom_type=info["geometria"])
+                for nome, tipo, subtipo in info["campos"]:
+                    defn = ogr.FieldDefn(nome, tipo)
+                    defn.SetSubType(subtipo)
+                    layer.CreateField(defn)
+                defn_layer = layer.GetLayerDefn()
+                campos = [(defn_layer.GetFieldIndex(nome), nome, tipo) for nome, tipo, _ in info["campos"]]
+                transacional = bool(layer.TestCapability(ogr.OLCTransactions))
+                if transacional:
+                    layer.StartTransaction()
+                classe_atual, pendentes = classe, 0
+                safe_print(f"📤 Exportando camada '{classe}'")
+
+            feat = ogr.Feature(defn_layer)
+            atributos = atributos or {}
+            for idx, nome, tipo in campos:
+                try:
+                    _preencher_campo(feat, idx, tipo, atributos.get(nome))
+                except (TypeError, ValueError):
+                    feat.SetFieldNull(idx)
+            if wkb is not None:
+                feat.SetGeometry(ogr.CreateGeometryFromWkb(bytes(wkb)))
+            layer.CreateFeature(feat)
+            count += 1
+            pendentes += 1
+            if transacional and pendentes >= EXPORTACAO_LOTE:
+                layer.CommitTransaction()
+                layer.StartTransaction()
+                pendentes = 0
+
+        if transacional:
+            layer.CommitTransaction()
+        layer, ds_classe, ds_out = None, None, None
+        cur.close()
 
-        conn.commit()
-        cur.close(); conn.close()
-        safe_print("✅ Esquema gravado como 'EDGV X.Y.Z' e grupos atualizados via SQL.")
-    except Exception as e:
-        print(f"❌ Erro ao atualizar grupos via SQL: {e}")
+        if um_por_classe:
+            caminho = os.path.join(pasta_destino, nome_base + extensao + ".zip")
+            with zipfile.ZipFile(caminho, "w", zipfile.ZIP_STORED) as zf:
+                for nome in sorted(os.listdir(pasta_camadas)):
+                    zf.write(os.path.join(pasta_camadas, nome), nome)
+            shutil.rmtree(pasta_camadas, ignore_errors=True)
+
+        safe_print(f"✅ {count} feições de '{metadata_id}' exportadas para {os.path.basename(caminho)}.")
+        return caminho
+    finally:
+        conn.close()
 
 # Execução principal
 if __name__ == "__main__":
@@ -487,9 +1819,8 @@ if __name__ == "__main__":
     criar_banco_postgis(nome_banco)
     # Ativa PostGIS no banco
     ativar_postgis(nome_banco)
-    # Monta string de conexão GDAL
-    conn_str = "PG: " + ' '.join(f"{k}={v}" for k, v in CONFIG_BANCO.items())
-    verificar_ou_criar_tabela(TABELA_GEOMETRIAS, conn_str)
+    # Cria/atualiza tabelas, índices e views
+    aplicar_migracoes()
 
     importar_todos = []
     for root, dirs, files in os.walk(PASTA_ARQUIVOS):
@@ -504,7 +1835,7 @@ if __name__ == "__main__":
         except Exception as e:
             safe_print(f"❌ Erro ao processar '{caminho}': {e}")
 
-    # Atualiza os grupos com base no Django Admin:
+    # Reaplica os grupos do Django Admin em tudo (cada importação já mapeou o seu produto):
     aplicar_mapeamento_via_sql(TABELA_GEOMETRIAS)
 
     safe_print("🚀 Processo finalizado.")
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""
+Perfilamento do importador (usado por manage.py import_folder).
+
+Três coletores independentes, ligados por arquivo importado:
+- cProfile da thread principal (leitura/transformação) -> .pstats e top em texto;
+- tracemalloc -> pico e maiores alocadores por linha;
+- amostragem de pilhas de todas as threads (inclui a escritora) em intervalo
+  fixo -> pilhas colapsadas no formato do flamegraph.pl / speedscope.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+PERFIS_DISPONIVEIS = ("cprofile", "tracemalloc", "amostragem")
+
+
+class AmostradorPilhas(threading.Thread):
+    """Amostra as pilhas de todas as threads (exceto a própria) a cada 'intervalo' segundos."""
+
+    def __init__(self, intervalo=0.005):
+        super().__init__(name="perfil-amostrador", daemon=True)
+        self.intervalo = intervalo
+        self.pilhas = Counter()
+        self.amostras = 0
+        self._parar = threading.Event()
+
+    def run(self):
+        proprio = threading.get_ident()
+        while not self._parar.wait(self.intervalo):
+            nomes = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == proprio:
+                    continue
+                quadros = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    quadros.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                    frame = frame.f_back
+                quadros.append(nomes.get(ident, str(ident)))
+                self.pilhas[";".join(reversed(quadros))] += 1
+            self.amostras += 1
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+    def gravar(self, caminho):
+        with open(caminho, "w", encoding="utf-8") as f:
+            for pilha, quantidade in self.pilhas.most_common():
+                f.write(f"{pilha} {quantidade}\n")
+
+
+def perfilar(funcao, pasta, prefixo, perfis=(), intervalo=0.005, top=30):
+    """
+    Executa funcao() com os coletores pedidos e grava os artefatos em
+    '<pasta>/<prefixo>.*'. Devolve (resultado, resumo); se funcao() falhar,
+    os artefatos são gravados mesmo assim e a exceção sobe.
+    """
+    perfis = set(perfis)
+    os.makedirs(pasta, exist_ok=True)
+    base = os.path.join(pasta, prefixo)
+    resumo = {"artefatos": {}}
+
+    perfilador = cProfile.Profile() if "cprofile" in perfis else None
+    amostrador = AmostradorPilhas(intervalo) if "amostragem" in perfis else None
+    if "tracemalloc" in perfis:
+        tracemalloc.start(25)
+    if amostrador:
+        amostrador.start()
+
+    inicio = time.perf_counter()
+    try:
+        if perfilador:
+            perfilador.enable()
+        try:
+            resultado = funcao()
+        finally:
+            if perfilador:
+                perfilador.disable()
+    finally:
+        resumo["duracao_s"] = round(time.perf_counter() - inicio, 3)
+
+        if amostrador:
+            amostrador.parar()
+            amostrador.gravar(f"{base}.collapsed")
+            resumo["amostras"] = amostrador.amostras
+            resumo["artefatos"]["pilhas"] = f"{base}.collapsed"
+
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(f"{base}.alocacoes.txt", "w", encoding="utf-8") as f:
+                f.write(f"Pico: {pico / 1024 / 1024:.1f} MiB\n\n")
+                for estatistica in snapshot.statistics("lineno")[:top]:
+                    f.write(f"{estatistica}\n")
+            resumo["pico_memoria_bytes"] = pico
+            resumo["artefatos"]["alocacoes"] = f"{base}.alocacoes.txt"
+
+        if perfilador:
+            perfilador.dump_stats(f"{base}.pstats")
+            texto = io.StringIO()
+            pstats.Stats(perfilador, stream=texto).sort_stats("cumulative").print_stats(top)
+            with open(f"{base}.top.txt", "w", encoding="utf-8") as f:
+                f.write(texto.getvalue())
+            resumo["artefatos"]["pstats"] = f"{base}.pstats"
+            resumo["artefatos"]["top"] = f"{base}.top.txt"
+
+    return resultado, resumo
@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+
+import psycopg2
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import HistoricoImportacaoExclusao, RemocaoProduto
+from . import banco
+
+# Expurgo em lotes: quantas feições por DELETE e pausa entre lotes (segundos)
+REMOCAO_LOTE = int(os.getenv("REMOCAO_LOTE", "5000"))
+REMOCAO_PAUSA = float(os.getenv("REMOCAO_PAUSA", "0.2"))
+
+# Lápides que ainda escondem o produto (uma remoção com erro continua escondida até ser retomada)
+STATUS_ATIVOS = ['pendente', 'removendo', 'erro']
+
+CHAVE_EXPURGO = "remocao_expurgo"  # lock de cada lápide em expurgo (classe do lock de dois inteiros)
+
+
+def solicitar_remocao(metadata_id, classe=None, usuario=None, total=0):
+    """
+    Registra a lápide (a partir daqui o produto/classe some das listagens e do
+    mapa) e dispara o expurgo em segundo plano. Se já houver uma remoção em
+    andamento para o mesmo alvo, devolve a existente (retomando-a se parou com erro).
+    """
+    em_andamento = RemocaoProduto.objects.filter(
+        metadata_id=metadata_id, classe=classe, status__in=STATUS_ATIVOS
+    ).first()
+    if em_andamento:
+        if em_andamento.status == 'erro':
+            RemocaoProduto.objects.filter(pk=em_andamento.pk).update(status='pendente', erro=None)
+            iniciar_expurgo(em_andamento.pk)
+        return em_andamento, False
+
+    remocao = RemocaoProduto.objects.create(
+        metadata_id=metadata_id, classe=classe, usuario=usuario, total=total
+    )
+    iniciar_expurgo(remocao.pk)
+    return remocao, True
+
+
+def iniciar_expurgo(remocao_id):
+    """Expurga em uma thread deste processo; com PROCESSAMENTO_FILA=worker, fica para o processar_fila."""
+    if banco.processamento_em_thread():
+        _thread_expurgo(remocao_id)
+
+
+def retomar_expurgos():
+    """
+    Inicia o expurgo das lápides pendentes ou interrompidas (o processo que as
+    expurgava caiu) que não têm thread neste processo. Uma lápide que outro
+    processo ainda expurga tem o lock dele e a nova tentativa sai sem fazer nada.
+    """
+    ativas = {t.name for t in threading.enumerate()}
+    pendentes = RemocaoProduto.objects.using("default").filter(
+        status__in=['pendente', 'removendo']
+    ).order_by("solicitado_em").values_list("pk", flat=True)
+    for remocao_id in pendentes:
+        if f"expurgo-{remocao_id}" not in ativas:
+            _thread_expurgo(remocao_id)
+
+
+def _thread_expurgo(remocao_id):
+    threading.Thread(
+        target=_expurgo_thread, args=(remocao_id,),
+        name=f"expurgo-{remocao_id}", daemon=True
+    ).start()
+
+
+def _expurgo_thread(remocao_id):
+    try:
+        expurgar(remocao_id)
+    except Exception:
+        pass  # já registrado na lápide (status 'erro'); retomável por expurgar_remocoes
+    finally:
+        close_old_connections()
+
+
+def expurgar(remocao_id, lote=REMOCAO_LOTE, pausa=REMOCAO_PAUSA):
+    """
+    Apaga as feições da lápide em lotes limitados, junto com as linhas delas
+    no resumo por grupo, confirmando cada lote e pausando entre eles para não
+    segurar locks nem gerar rajadas de WAL. O progresso fica em RemocaoProduto.removidas. Ao final, atualiza o
+    catálogo, fecha a lápide e grava o histórico.
+    """
+    remocao = RemocaoProduto.objects.get(pk=remocao_id)
+    if remocao.status == 'concluido':
+        return remocao
+
+    inicio = time.perf_counter()
+    tempo_delete = 0.0
+    tabela = banco.TABELA_FEICOES
+    filtro = f"produto_id = (SELECT id FROM {banco.TABELA_PRODUTOS} WHERE metadata_id = %s)"
+    params = [remocao.metadata_id]
+    if remocao.classe:
+        filtro += f" AND classe_id = (SELECT id FROM {banco.TABELA_CLASSES} WHERE nome = %s)"
+        params.append(remocao.classe)
+
+    try:
+        conn = psycopg2.connect(**banco.CONFIG_BANCO)
+        try:
+            cursor = conn.cursor()
+            # Lock de sessão durante todo o expurgo: outro processo não pega a mesma lápide e,
+            # se este cair, o lock cai com a conexão e processar_fila a retoma
+            cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s), %s)", (CHAVE_EXPURGO, remocao_id))
+            if not cursor.fetchone()[0]:
+                return None
+            conn.commit()
+            remocao.refresh_from_db()
+            if remocao.status == 'concluido':
+                return remocao
+            RemocaoProduto.objects.filter(pk=remocao_id).update(status='removendo')
+            removidas = remocao.removidas
+            while True:
+                inicio_lote = time.perf_counter()
+                cursor.execute(f"""
+                    WITH apagadas AS (
+                        DELETE FROM {tabela}
+                        WHERE ogc_fid IN (
+                            SELECT ogc_fid FROM {tabela} WHERE {filtro} LIMIT %s
+                        )
+                        RETURNING ogc_fid
+                    ), resumo AS (
+                        DELETE FROM {banco.TABELA_GRUPOS} s
+                        USING apagadas a WHERE s.ogc_fid = a.ogc_fid
+                    )
+                    SELECT count(*) FROM apagadas;
+                """, [*params, lote])
+                apagadas = cursor.fetchone()[0]
+                conn.commit()
+                tempo_delete += time.perf_counter() - inicio_lote
+
+                if apagadas:
+                    removidas += apagadas
+                    RemocaoProduto.objects.filter(pk=remocao_id).update(removidas=F('removidas') + apagadas)
+                    banco.safe_print(f"🧹 {remocao.metadata_id}: {removidas}/{remocao.total} feições removidas.")
+                if apagadas < lote:
+                    break
+                time.sleep(pausa)
+
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (remocao.metadata_id,))
+            banco.remover_do_catalogo(cursor, remocao.metadata_id, remocao.classe, removidas)
+            banco.atualizar_estatisticas(
+                cursor, [remocao.metadata_id], [remocao.classe] if remocao.classe else None
+            )
+            banco.remover_chave_produto(cursor, remocao.metadata_id)
+            banco.incrementar_geracao(cursor)
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+    except Exception as e:
+        banco.safe_print(f"❌ Erro no expurgo de {remocao.metadata_id}: {e}")
+        RemocaoProduto.objects.filter(pk=remocao_id).update(status='erro', erro=str(e))
+        raise
+
+    msg = f"Feições com metadata_id '{remocao.metadata_id}'"
+    if remocao.classe:
+        msg += f" e classe '{remocao.classe}'"
+    msg += f" removidas com sucesso ({removidas} feições)."
+
+    duracao = time.perf_counter() - inicio
+    RemocaoProduto.objects.filter(pk=remocao_id).update(status='concluido', concluido_em=timezone.now())
+    HistoricoImportacaoExclusao.objects.create(
+        metadata_id=remocao.metadata_id,
+        classe=remocao.classe,
+        acao='removido',
+        usuario=remocao.usuario,
+        detalhes=msg,
+        quantidade_feicoes=removidas,
+        duracao_s=round(duracao, 3),
+        feicoes_por_s=round(removidas / duracao, 1) if duracao else None,
+        tempos_etapas={"delete": round(tempo_delete, 3), "pausas": round(duracao - tempo_delete, 3)},
+        worker=banco.identificador_processo()
+    )
+    banco.safe_print(f"✅ {msg}")
+    return RemocaoProduto.objects.get(pk=remocao_id)
@@ -0,0 +1,78 @@
+"""
+Leituras da API na réplica somente leitura (settings.DATABASES['replica']).
+
+O middleware marca as requisições GET/HEAD/OPTIONS de /api/ e o roteador só
+manda para a réplica as leituras dessas requisições; escritas, importações,
+remoções, admin e comandos continuam no primário, sem atraso de replicação.
+Se a réplica não responder, as leituras voltam ao primário por
+DB_REPLICA_ESPERA segundos (o mesmo controle de banco.conectar_leitura).
+"""
+import contextvars
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import DatabaseError, connections
+
+from . import banco
+
+REPLICA = "replica"
+METODOS_LEITURA = ("GET", "HEAD", "OPTIONS")
+
+_leitura_api = contextvars.ContextVar("leitura_api", default=False)
+
+
+class LeituraReplicaMiddleware:
+    # Síncrono e assíncrono: as views de views_async não pagam a troca de thread
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _leitura(request):
+        return request.method in METODOS_LEITURA and request.path.startswith("/api/")
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _leitura_api.set(self._leitura(request))
+        try:
+            return self.get_response(request)
+        finally:
+            _leitura_api.reset(token)
+
+    async def __acall__(self, request):
+        token = _leitura_api.set(self._leitura(request))
+        try:
+            return await self.get_response(request)
+        finally:
+            _leitura_api.reset(token)
+
+
+def _replica_no_ar():
+    if REPLICA not in connections.settings or not banco.replica_disponivel():
+        return False
+    try:
+        connections[REPLICA].ensure_connection()
+        return True
+    except DatabaseError as e:
+        banco.marcar_replica_indisponivel(e)
+        return False
+
+
+class RoteadorReplica:
+    def db_for_read(self, model, **hints):
+        if _leitura_api.get() and _replica_no_ar():
+            return REPLICA
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
@@ -0,0 +1,44 @@
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import HistoricoImportacaoExclusao, RemapeamentoGrupo, RepresentacaoGrafica
+from . import banco
+
+
+@receiver(post_save, sender=RepresentacaoGrafica)
+@receiver(post_delete, sender=RepresentacaoGrafica)
+def atualizar_grupos_representacao(sender, instance, using, **kwargs):
+    """
+    Remapeia as classes alteradas (e o resumo dos produtos que as contêm) uma
+    vez por transação, após o commit. Com PROCESSAMENTO_FILA=worker, só
+    registra o pedido, na mesma transação, para o processar_fila.
+    """
+    if not banco.processamento_em_thread():
+        RemapeamentoGrupo.objects.using(using).create(classe=instance.classe)
+        return
+    conexao = transaction.get_connection(using)
+    if not hasattr(conexao, "classes_remapear"):
+        conexao.classes_remapear = set()
+    conexao.classes_remapear.add(instance.classe)
+    # Um callback por linha salva, mas só o primeiro a rodar encontra classes pendentes
+    transaction.on_commit(lambda: _atualizar_classes(conexao), using=using)
+
+
+@receiver(post_save, sender=RepresentacaoGrafica)
+@receiver(post_delete, sender=RepresentacaoGrafica)
+@receiver(post_save, sender=HistoricoImportacaoExclusao)
+def avancar_geracao(sender, **kwargs):
+    """Invalida as respostas em cache das listagens, na mesma transação da alteração."""
+    with connection.cursor() as cur:
+        banco.incrementar_geracao(cur)
+
+
+def _atualizar_classes(conexao):
+    classes, conexao.classes_remapear = conexao.classes_remapear, set()
+    if not classes:
+        return
+    try:
+        banco.atualizar_grupos_das_classes(sorted(classes))
+    except Exception as e:
+        banco.safe_print(f"❌ Erro ao atualizar grupos das classes {sorted(classes)}: {e}")
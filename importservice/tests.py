@@ -1,9 +1,14 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
 
 # Create your tests here.
-from importservice.models import RepresentacaoGrafica
-from importservice import ogr_importer
+from importservice.models import FilaImportacao, HistoricoImportacaoExclusao, RepresentacaoGrafica
+from importservice import ogr_importer, observador
+import math
 import os
+import shutil
+import tempfile
+import zipfile
+from unittest import mock
 
 
 class RepresentacaoGraficaTestCase(TestCase):
@@ -44,4 +49,693 @@ class RepresentacaoGraficaTestCase(TestCase):
             except Exception as e:
                 ogr_importer.safe_print(f"❌ Erro ao processar '{caminho}': {e}")
 
-        ogr_importer.safe_print("🚀 Processo finalizado.")
\ No newline at end of file
+        ogr_importer.safe_print("🚀 Processo finalizado.")
+
+class ManifestoArquivoTestCase(SimpleTestCase):
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.caminho = os.path.join(self.pasta, "folha.zip")
+        with zipfile.ZipFile(self.caminho, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("folha/leiame.xml", "<a/>")
+            zf.writestr("folha/metadados.xml", "<MD_Metadata/>")
+            zf.writestr("folha/TRA_Trecho_Rodoviario_L.shp", b"\0" * 100)
+            zf.writestr("folha/TRA_Trecho_Rodoviario_L.dbf", b"\0" * 100)
+
+    def tearDown(self):
+        ogr_importer._liberar_manifesto(self.caminho)
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def test_manifesto_compartilhado(self):
+        manifesto = ogr_importer.obter_manifesto(self.caminho)
+        self.assertIs(manifesto, ogr_importer.obter_manifesto(self.caminho))
+        self.assertEqual(manifesto.shps, ["folha/TRA_Trecho_Rodoviario_L.shp"])
+        self.assertEqual(
+            ogr_importer.find_xml_for_file(self.caminho),
+            ("zip", self.caminho, "folha/metadados.xml")
+        )
+        tree = ogr_importer._parse_xml_from_locator(("zip", self.caminho, "folha/metadados.xml"))
+        self.assertEqual(tree.getroot().tag, "MD_Metadata")
+        self.assertTrue(manifesto.uri_shapefile(manifesto.shps[0]).startswith("/vsizip/"))
+
+    def test_extracao_so_some_depois_da_ultima_leitura(self):
+        manifesto = ogr_importer.obter_manifesto(self.caminho)
+        manifesto.pasta_extraida = pasta = tempfile.mkdtemp()
+        manifesto.reservar()
+        manifesto.limpar()  # descartado com uma leitura em andamento
+        self.assertTrue(os.path.isdir(pasta))
+        self.assertIsNot(manifesto, ogr_importer.obter_manifesto(self.caminho))
+        manifesto.liberar()
+        self.assertFalse(os.path.isdir(pasta))
+
+class ToleranciaEscalaTestCase(SimpleTestCase):
+    def test_tolerancia_pela_escala(self):
+        tabela = ogr_importer._tabela_tolerancias("50000:2.5, 25000:1.25")
+        self.assertEqual(tabela, [(25000, 1.25), (50000, 2.5)])
+        self.assertEqual(ogr_importer.tolerancia_escala("1:25000", tabela), 1.25)
+        self.assertEqual(ogr_importer.tolerancia_escala("1:100000", tabela), 2.5)
+        self.assertIsNone(ogr_importer.tolerancia_escala("1:10000", tabela))
+        self.assertIsNone(ogr_importer.tolerancia_escala("Não informado", tabela))
+
+    def test_grade_pela_latitude_central(self):
+        y = 6378137.0 * math.log(math.tan(math.pi / 4 + math.radians(-15) / 2))  # -15° em EPSG:3857
+        self.assertAlmostEqual(ogr_importer._grade_3857(1.25, y), ogr_importer._grade_latitude(1.25, -15))
+        self.assertAlmostEqual(ogr_importer._grade_latitude(1.25, 60), 2.5)
+
+class RespostaCondicionalTestCase(TestCase):
+    def test_etag_e_304_ate_nova_geracao(self):
+        resposta = self.client.get("/api/representacoes/")
+        self.assertEqual(resposta.status_code, 200)
+        etag = resposta["ETag"]
+        self.assertEqual(self.client.get("/api/representacoes/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        RepresentacaoGrafica.objects.create(classe="TRA_Trecho_Ferroviario_L", grupo_representacao="Ferrovia")
+        resposta = self.client.get("/api/representacoes/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta["ETag"], etag)
+        self.assertEqual(len(resposta.json()), 1)
+
+    def test_historico_em_lista_com_cursor_no_cabecalho(self):
+        for i in range(3):
+            HistoricoImportacaoExclusao.objects.create(metadata_id=f"produto-{i}", acao="adicionado")
+        resposta = self.client.get("/api/historico/", {"limite": 2})
+        self.assertEqual([e["metadata_id"] for e in resposta.json()], ["produto-2", "produto-1"])
+        self.assertIn('rel="next"', resposta["Link"])
+        # A mesma página vinda do cache mantém o cursor
+        self.assertEqual(self.client.get("/api/historico/", {"limite": 2})["X-Proximo"], resposta["X-Proximo"])
+
+        resposta = self.client.get("/api/historico/", {"limite": 2, "cursor": resposta["X-Proximo"]})
+        self.assertEqual([e["metadata_id"] for e in resposta.json()], ["produto-0"])
+        self.assertFalse(resposta.has_header("X-Proximo"))
+
+
+class ObservadorTestCase(SimpleTestCase):
+    def test_importa_so_depois_de_estavel(self):
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta, True)
+        with open(os.path.join(pasta, "existente.zip"), "w") as f:
+            f.write("x")
+        importados = []
+        obs = observador.Observador(pasta, lambda c, x: importados.append((c, x)), estabilidade=0, varredura=True)
+        obs.backend = observador._Varredura()
+        obs._indexar_diretorio(pasta, novos=False)
+
+        caminho = os.path.join(pasta, "folha.gpkg")
+        with open(caminho, "w") as f:
+            f.write("gpkg")
+        with open(os.path.join(pasta, "folha.xml"), "w") as f:
+            f.write("<a/>")
+        for nome, tipo in obs.backend.ler(0):
+            obs._tratar(nome, tipo)
+
+        obs._verificar_pendentes()  # primeira leitura de tamanho/mtime: ainda não importa
+        self.assertEqual(importados, [])
+        obs._verificar_pendentes()
+        self.assertEqual(importados, [(caminho, ("fs", os.path.join(pasta, "folha.xml")))])
+        obs._verificar_pendentes()
+        self.assertEqual(len(importados), 1)
+
+class RoteadorReplicaTestCase(SimpleTestCase):
+    def test_leitura_volta_ao_primario_sem_replica(self):
+        from importservice import roteamento
+        roteador = roteamento.RoteadorReplica()
+        token = roteamento._leitura_api.set(True)
+        try:
+            self.assertEqual(roteador.db_for_read(RepresentacaoGrafica), "default")
+        finally:
+            roteamento._leitura_api.reset(token)
+        self.assertEqual(roteador.db_for_write(RepresentacaoGrafica), "default")
+        self.assertFalse(roteador.allow_migrate("replica", "importservice"))
+
+
+class AdmissaoTestCase(TestCase):
+    def test_fila_cheia_recusa_com_retry_after(self):
+        from importservice import admissao
+        arquivo = {"nome": "a.gpkg", "arquivo": "/tmp/a.gpkg", "xml": None,
+                   "metadata_id": "a.gpkg", "modo": None, "bytes": 10}
+        with mock.patch.object(admissao, "ADMISSAO_MAX_IMPORTACOES", 0), \
+                mock.patch.object(admissao, "ADMISSAO_MAX_FILA", 0):
+            with self.assertRaises(admissao.FilaCheia) as erro:
+                admissao.enfileirar([arquivo])
+        self.assertGreaterEqual(erro.exception.retry_after, 5)
+        self.assertFalse(FilaImportacao.objects.exists())
+
+    def test_estimativas_seguem_ordem_de_chegada(self):
+        from importservice import admissao
+        vazao = admissao.ADMISSAO_VAZAO_PADRAO
+        primeiro = FilaImportacao.objects.create(nome="a", arquivo="a", metadata_id="a", bytes=int(vazao * 10))
+        segundo = FilaImportacao.objects.create(nome="b", arquivo="b", metadata_id="b", bytes=1)
+        with mock.patch.object(admissao, "ADMISSAO_MAX_IMPORTACOES", 1):
+            posicoes = admissao.estimativas()
+        self.assertEqual(posicoes[primeiro.pk], (1, 0))
+        self.assertEqual(posicoes[segundo.pk], (2, 10))
+
+
+class _FeicaoFalsa:
+    """Imita a leitura de campos de uma ogr.Feature a partir de uma lista de valores."""
+
+    def __init__(self, valores):
+        self.valores = valores
+
+    def IsFieldSetAndNotNull(self, i):
+        return self.valores[i] is not None
+
+    def _valor(self, i):
+        return self.valores[i]
+
+    GetFieldAsInteger = GetFieldAsInteger64 = GetFieldAsDouble = GetFieldAsDateTime = _valor
+    GetFieldAsIntegerList = GetFieldAsString = GetFieldAsBinary = _valor
+
+
+class AtributosTipadosTestCase(SimpleTestCase):
+    def test_tipos_json_nativos(self):
+        ogr = ogr_importer.ogr
+        campos = [
+            (0, "id", ogr.OFTInteger, ogr.OFSTNone),
+            (1, "ativo", ogr.OFTInteger, ogr.OFSTBoolean),
+            (2, "area", ogr.OFTReal, ogr.OFSTNone),
+            (3, "invalido", ogr.OFTReal, ogr.OFSTNone),
+            (4, "data", ogr.OFTDate, ogr.OFSTNone),
+            (5, "quando", ogr.OFTDateTime, ogr.OFSTNone),
+            (6, "nome", ogr.OFTString, ogr.OFSTNone),
+            (7, "vazio", ogr.OFTString, ogr.OFSTNone),
+            (8, "faixas", ogr.OFTIntegerList, ogr.OFSTNone),
+            (9, "bruto", ogr.OFTBinary, ogr.OFSTNone),
+        ]
+        feicao = _FeicaoFalsa([
+            7, 1, 2.5, float("nan"), (2024, 3, 5, 0, 0, 0, 0), (2024, 3, 5, 14, 7, 9.5, 100),
+            "Rio", None, [1, 2], b"\x01\xff",
+        ])
+        self.assertEqual(ogr_importer.atributos_tipados(feicao, campos), {
+            "id": 7, "ativo": True, "area": 2.5, "invalido": None, "data": "2024-03-05",
+            "quando": "2024-03-05T14:07:09.5Z", "nome": "Rio", "vazio": None,
+            "faixas": [1, 2], "bruto": "01ff",
+        })
+
+    def test_data_hora_iso_com_fuso(self):
+        ogr = ogr_importer.ogr
+        feicao = _FeicaoFalsa([(2024, 12, 31, 23, 59, 0, 92), (0, 0, 0, 8, 30, 0, 0), (2024, 1, 2, 3, 4, 5, 104)])
+        self.assertEqual(ogr_importer._data_hora_iso(feicao, 0, ogr.OFTDateTime), "2024-12-31T23:59:00-02:00")
+        self.assertEqual(ogr_importer._data_hora_iso(feicao, 1, ogr.OFTTime), "08:30:00")
+        self.assertEqual(ogr_importer._data_hora_iso(feicao, 2, ogr.OFTDateTime), "2024-01-02T03:04:05+01:00")
+
+
+class EscritorLotesTestCase(SimpleTestCase):
+    def test_grava_lotes_em_ordem(self):
+        gravados = []
+
+        def gravar(lote):
+            gravados.append(lote)
+            return 10
+
+        escritor = ogr_importer._EscritorLotes(gravar, tamanho_fila=2)
+        escritor.start()
+        for lote in range(5):
+            escritor.enviar(lote)
+        escritor.concluir()
+        self.assertEqual(gravados, [0, 1, 2, 3, 4])
+        self.assertEqual(escritor.bytes_gravados, 50)
+
+    def test_erro_na_gravacao_chega_ao_produtor_sem_bloquear(self):
+        gravados = []
+
+        def gravar(lote):
+            if lote == 2:
+                raise ValueError("falha no lote 2")
+            gravados.append(lote)
+            return 1
+
+        escritor = ogr_importer._EscritorLotes(gravar, tamanho_fila=1)
+        escritor.start()
+        with self.assertRaisesMessage(ValueError, "falha no lote 2"):
+            try:
+                for lote in range(1, 50):  # fila de 1: o produtor só segue se o escritor drenar
+                    escritor.enviar(lote)
+            finally:
+                escritor.concluir()
+        self.assertFalse(escritor.is_alive())
+        self.assertEqual(gravados, [1])
+
+
+class HashFeicaoTestCase(SimpleTestCase):
+    def test_hash_estavel_e_sensivel_a_mudancas(self):
+        base = ogr_importer.hash_feicao("HID_Trecho_Drenagem_L", b"\x01\x02", '{"nome": "Rio"}')
+        self.assertEqual(base, ogr_importer.hash_feicao("HID_Trecho_Drenagem_L", b"\x01\x02", '{"nome": "Rio"}'))
+        self.assertNotEqual(base, ogr_importer.hash_feicao("HID_Trecho_Drenagem_L", b"\x01\x03", '{"nome": "Rio"}'))
+        self.assertNotEqual(base, ogr_importer.hash_feicao("HID_Trecho_Drenagem_L", b"\x01\x02", '{"nome": "Riacho"}'))
+        self.assertNotEqual(base, ogr_importer.hash_feicao("TRA_Trecho_Rodoviario_L", b"\x01\x02", '{"nome": "Rio"}'))
+
+    def test_hash_inclui_a_grade(self):
+        sem_grade = ogr_importer.hash_feicao("HID_Trecho_Drenagem_L", b"\x01\x02", '{"nome": "Rio"}')
+        grade = ogr_importer.hash_feicao("HID_Trecho_Drenagem_L", b"\x01\x02", '{"nome": "Rio"}', 1.3)
+        self.assertNotEqual(sem_grade, grade)
+        self.assertNotEqual(grade, ogr_importer.hash_feicao("HID_Trecho_Drenagem_L", b"\x01\x02", '{"nome": "Rio"}', 2.6))
+
+
+class AplicarDiferencaTestCase(TestCase):
+    def test_aplica_so_a_diferenca(self):
+        from django.db import connection
+
+        def h(nome):
+            return ogr_importer.hash_feicao("HID_Trecho_Drenagem_L", b"\x01", f'{{"nome": "{nome}"}}')
+
+        with connection.cursor() as cur, mock.patch.object(ogr_importer, "TABELA_FEICOES", "teste_feicoes"):
+            cur.execute("""
+                CREATE TEMP TABLE teste_feicoes (
+                    ogc_fid serial, tipo_geometria varchar(8), produto_id integer, classe_id smallint,
+                    json jsonb, hash uuid, wkb_geometry geometry
+                );
+                CREATE TEMP TABLE teste_novas (
+                    json jsonb, produto_id integer, classe_id smallint,
+                    tipo_geometria varchar(8), hash uuid, wkb_geometry geometry
+                );
+            """)
+            # Produto 1 gravado com A, B e C; produto 2 também tem A e não pode ser tocado
+            for produto_id, nome in [(1, "A"), (1, "B"), (1, "C"), (2, "A")]:
+                cur.execute("INSERT INTO teste_feicoes (tipo_geometria, produto_id, classe_id, hash) VALUES ('linha', %s, 1, %s)",
+                            [produto_id, h(nome)])
+            cur.execute("SELECT ogc_fid FROM teste_feicoes WHERE produto_id = 1 AND hash = %s", [h("A")])
+            fid_inalterada = cur.fetchone()[0]
+
+            # Reimportação: A inalterada, B alterada (B2), C removida
+            for nome in ("A", "B2"):
+                cur.execute("INSERT INTO teste_novas (tipo_geometria, produto_id, classe_id, hash) VALUES ('linha', 1, 1, %s)",
+                            [h(nome)])
+
+            self.assertEqual(ogr_importer.aplicar_diferenca(cur, 1, "teste_novas"), (2, 1))
+
+            cur.execute("SELECT ogc_fid, hash::text FROM teste_feicoes WHERE produto_id = 1 ORDER BY ogc_fid")
+            linhas = cur.fetchall()
+            self.assertEqual(sorted(hash_ for _, hash_ in linhas), sorted([h("A"), h("B2")]))
+            self.assertIn((fid_inalterada, h("A")), linhas)
+            cur.execute("SELECT count(*) FROM teste_feicoes WHERE produto_id = 2")
+            self.assertEqual(cur.fetchone()[0], 1)
+
+
+class OrdenacaoEspacialTestCase(TestCase):
+    def test_chave_espacial_sql(self):
+        from importservice import banco
+        self.assertEqual(banco.chave_espacial_sql("hilbert", "g.wkb_geometry"), "importacao_hilbert(g.wkb_geometry)")
+        self.assertIn("ST_GeoHash(", banco.chave_espacial_sql("geohash"))
+        with self.assertRaises(ValueError):
+            banco.chave_espacial_sql("zorder")
+
+    def test_ordem_de_hilbert_dos_quadrantes(self):
+        from django.db import connection
+        with connection.cursor() as cur:
+            ogr_importer._migracao_funcao_hilbert(cur)
+            # Curva de Hilbert: sudoeste -> noroeste -> nordeste -> sudeste
+            pontos = {"SO": (-1e6, -1e6), "NO": (-1e6, 1e6), "NE": (1e6, 1e6), "SE": (1e6, -1e6)}
+            chaves = {}
+            for nome, (x, y) in pontos.items():
+                cur.execute("SELECT importacao_hilbert(ST_SetSRID(ST_MakePoint(%s, %s), 3857))", [x, y])
+                chaves[nome] = cur.fetchone()[0]
+            cur.execute("SELECT importacao_hilbert('POINT EMPTY'::geometry)")
+            vazia = cur.fetchone()[0]
+        self.assertEqual(sorted(chaves, key=chaves.get), ["SO", "NO", "NE", "SE"])
+        self.assertIsNone(vazia)
+
+
+class _EsquemaDeTeste:
+    """
+    Aponta as conexões psycopg2 (CONFIG_BANCO) para o banco de teste e aplica
+    nele as migrações do esquema de geometrias. Com TransactionTestCase, o que
+    o Django grava fica visível para essas conexões.
+    """
+    def setUp(self):
+        from django.db import connection
+        from importservice import banco
+        super().setUp()
+        for alvo in (mock.patch.dict(banco.CONFIG_BANCO, dbname=connection.settings_dict["NAME"]),
+                     mock.patch.object(banco, "PROCESSAMENTO_FILA", "worker")):  # sem threads nos testes
+            alvo.start()
+            self.addCleanup(alvo.stop)
+        ogr_importer.aplicar_migracoes()
+        self.addCleanup(self._sql, f"""
+            TRUNCATE {banco.TABELA_FEICOES}, {banco.TABELA_GRUPOS}, {banco.TABELA_ESTATISTICAS},
+                     {banco.TABELA_PRODUTOS}, {banco.TABELA_CLASSES} CASCADE;
+        """)
+
+    def _sql(self, sql, params=None):
+        import psycopg2
+        from importservice import banco
+        conn = psycopg2.connect(**banco.CONFIG_BANCO)
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute(sql, params)
+                return cur.fetchall() if cur.description else None
+        finally:
+            conn.close()
+
+    def _produto(self, metadata_id, classes):
+        """Grava um produto com pontos em (i, i) EPSG:3857 por classe ({classe: [i, ...]}), como o importador."""
+        import psycopg2
+        from importservice import banco
+        conn = psycopg2.connect(**banco.CONFIG_BANCO)
+        try:
+            with conn, conn.cursor() as cur:
+                produto_id = ogr_importer.obter_chave_produto(cur, metadata_id, "1:25000", "EDGV 3.0", None)
+                coordenadas = []
+                for classe, posicoes in classes.items():
+                    classe_id = ogr_importer.obter_chave_classe(cur, classe, {})
+                    cur.execute(f"""
+                        INSERT INTO {banco.TABELA_FEICOES} (json, produto_id, classe_id, tipo_geometria, wkb_geometry)
+                        SELECT '{{}}'::jsonb, %s, %s, 'ponto', ST_Multi(ST_SetSRID(ST_MakePoint(i, i), 3857))
+                        FROM unnest(%s::int[]) i;
+                    """, (produto_id, classe_id, list(posicoes)))
+                    coordenadas += list(posicoes)
+                banco.mapear_grupos(cur, metadata_ids=[metadata_id])
+                banco.atualizar_resumo_grupos(cur, [metadata_id])
+                banco.atualizar_estatisticas(cur, [metadata_id])
+                ogr_importer.salvar_produto(
+                    cur, metadata_id, f"{metadata_id}.gpkg", "1:25000", None, "EDGV 3.0",
+                    (min(coordenadas), max(coordenadas), min(coordenadas), max(coordenadas)),
+                    len(coordenadas), {classe: len(posicoes) for classe, posicoes in classes.items()}
+                )
+        finally:
+            conn.close()
+
+    def _contar(self, tabela, metadata_id):
+        return self._sql(f"SELECT count(*) FROM {tabela} WHERE metadata_id = %s", (metadata_id,))[0][0]
+
+
+class RemocaoTestCase(_EsquemaDeTeste, TransactionTestCase):
+    def test_lapide_esconde_antes_do_expurgo(self):
+        from importservice import banco, remocao
+        self._produto("p1", {"HID_Trecho_Drenagem_L": [1, 2], "TRA_Trecho_Rodoviario_L": [3, 4, 5]})
+
+        lapide, criada = remocao.solicitar_remocao("p1", classe="HID_Trecho_Drenagem_L", total=2)
+        self.assertTrue(criada)
+        self.assertEqual(lapide.status, "pendente")
+        # Nada foi apagado ainda; só as camadas filtradas deixam de mostrar a classe
+        self.assertEqual(self._contar(banco.TABELA_GEOMETRIAS, "p1"), 5)
+        self.assertEqual(self._contar(f"{banco.TABELA_GEOMETRIAS}_visiveis", "p1"), 3)
+        self.assertEqual(self._contar(f"{banco.TABELA_GRUPOS}_outro", "p1"), 5)
+        self.assertEqual(self._contar(f"{banco.TABELA_GRUPOS}_outro_visiveis", "p1"), 3)
+
+        # Uma segunda solicitação devolve a lápide em andamento
+        self.assertEqual(remocao.solicitar_remocao("p1", classe="HID_Trecho_Drenagem_L"), (lapide, False))
+
+    def test_expurgo_em_lotes_registra_progresso(self):
+        from importservice import banco, remocao
+        self._produto("p1", {"HID_Trecho_Drenagem_L": [1, 2, 3, 4, 5]})
+        lapide, _ = remocao.solicitar_remocao("p1", total=5)
+
+        with mock.patch.object(remocao.time, "sleep") as pausa:
+            resultado = remocao.expurgar(lapide.pk, lote=2, pausa=0)
+
+        self.assertEqual(pausa.call_count, 2)  # lotes de 2, 2 e 1
+        self.assertEqual((resultado.status, resultado.removidas), ("concluido", 5))
+        self.assertEqual(self._contar(banco.TABELA_GEOMETRIAS, "p1"), 0)
+        self.assertEqual(self._contar(banco.TABELA_GRUPOS, "p1"), 0)
+        historico = HistoricoImportacaoExclusao.objects.get(metadata_id="p1", acao="removido")
+        self.assertEqual(historico.quantidade_feicoes, 5)
+
+    def test_retoma_apos_erro(self):
+        from importservice import banco, remocao
+        from importservice.models import RemocaoProduto
+        self._produto("p1", {"HID_Trecho_Drenagem_L": [1, 2, 3, 4]})
+        lapide, _ = remocao.solicitar_remocao("p1", total=4)
+
+        # O processo cai depois do primeiro lote confirmado
+        with mock.patch.object(remocao.time, "sleep", side_effect=RuntimeError("queda")):
+            with self.assertRaises(RuntimeError):
+                remocao.expurgar(lapide.pk, lote=2, pausa=0)
+        lapide.refresh_from_db()
+        self.assertEqual((lapide.status, lapide.removidas), ("erro", 2))
+        # Com erro, a lápide continua escondendo o que sobrou
+        self.assertEqual(self._contar(banco.TABELA_GEOMETRIAS, "p1"), 2)
+        self.assertEqual(self._contar(f"{banco.TABELA_GEOMETRIAS}_visiveis", "p1"), 0)
+
+        self.assertEqual(remocao.solicitar_remocao("p1")[1], False)
+        self.assertEqual(RemocaoProduto.objects.get(pk=lapide.pk).status, "pendente")
+        resultado = remocao.expurgar(lapide.pk, lote=2, pausa=0)
+        self.assertEqual((resultado.status, resultado.removidas), ("concluido", 4))
+        self.assertEqual(self._contar(banco.TABELA_GEOMETRIAS, "p1"), 0)
+
+    def test_um_expurgador_por_lapide(self):
+        import psycopg2
+        from importservice import banco, remocao
+        self._produto("p1", {"HID_Trecho_Drenagem_L": [1, 2]})
+        lapide, _ = remocao.solicitar_remocao("p1", total=2)
+
+        outro = psycopg2.connect(**banco.CONFIG_BANCO)
+        try:
+            with outro.cursor() as cur:
+                cur.execute("SELECT pg_advisory_lock(hashtext(%s), %s)", (remocao.CHAVE_EXPURGO, lapide.pk))
+            self.assertIsNone(remocao.expurgar(lapide.pk, pausa=0))
+            self.assertEqual(self._contar(banco.TABELA_GEOMETRIAS, "p1"), 2)
+        finally:
+            outro.close()  # o lock cai com a conexão
+
+        self.assertEqual(remocao.expurgar(lapide.pk, pausa=0).status, "concluido")
+
+    def test_catalogo_e_estatisticas_apos_remover_classe(self):
+        from importservice import banco, remocao
+        from importservice.models import ProdutoGeoespacial
+        self._produto("p1", {"HID_Trecho_Drenagem_L": [1, 2], "TRA_Trecho_Rodoviario_L": [10, 11, 12]})
+        lapide, _ = remocao.solicitar_remocao("p1", classe="HID_Trecho_Drenagem_L", total=2)
+        remocao.expurgar(lapide.pk, pausa=0)
+
+        produto = ProdutoGeoespacial.objects.get(metadata_id="p1")
+        self.assertEqual(produto.quantidade_feicoes, 3)
+        self.assertEqual(produto.contagem_classes, {"TRA_Trecho_Rodoviario_L": 3})
+        # bbox recalculado só com as feições restantes (10..12 em EPSG:3857)
+        (x10, y10, x12, y12), = self._sql("""
+            SELECT ST_X(a), ST_Y(a), ST_X(b), ST_Y(b) FROM (
+                SELECT ST_Transform(ST_SetSRID(ST_MakePoint(10, 10), 3857), 4326) a,
+                       ST_Transform(ST_SetSRID(ST_MakePoint(12, 12), 3857), 4326) b) t
+        """)
+        for obtido, esperado in zip(produto.bbox, (x10, y10, x12, y12)):
+            self.assertAlmostEqual(obtido, esperado)
+
+        estatisticas = self._sql(f"""
+            SELECT c.nome, e.quantidade FROM {banco.TABELA_ESTATISTICAS} e
+            JOIN {banco.TABELA_CLASSES} c ON c.id = e.classe_id
+        """)
+        self.assertEqual(estatisticas, [("TRA_Trecho_Rodoviario_L", 3)])
+
+        # Remoção do produto inteiro: sai do catálogo e das tabelas de produto
+        lapide, _ = remocao.solicitar_remocao("p1", total=3)
+        remocao.expurgar(lapide.pk, pausa=0)
+        self.assertFalse(ProdutoGeoespacial.objects.filter(metadata_id="p1").exists())
+        self.assertEqual(self._sql(f"SELECT count(*) FROM {banco.TABELA_PRODUTOS}")[0][0], 0)
+        self.assertEqual(self._sql(f"SELECT count(*) FROM {banco.TABELA_ESTATISTICAS}")[0][0], 0)
+
+
+class MigracoesEsquemaTestCase(_EsquemaDeTeste, TransactionTestCase):
+    def _versoes(self):
+        return [v for v, in self._sql(f"SELECT versao FROM {ogr_importer.TABELA_VERSAO_ESQUEMA} ORDER BY versao")]
+
+    def test_versoes_registradas(self):
+        self.assertEqual(self._versoes(), [versao for versao, _, _ in ogr_importer.MIGRACOES])
+        self.assertEqual(self._versoes()[-1], ogr_importer.VERSAO_ESQUEMA)
+
+    def test_so_aplica_versoes_novas(self):
+        nova_versao = ogr_importer.VERSAO_ESQUEMA + 1
+        self.addCleanup(self._sql, f"DELETE FROM {ogr_importer.TABELA_VERSAO_ESQUEMA} WHERE versao >= %s",
+                        (nova_versao,))
+        publicadas = [(versao, descricao, mock.Mock()) for versao, descricao, _ in ogr_importer.MIGRACOES]
+        falha = mock.Mock(side_effect=RuntimeError("DDL inválido"))
+        nova = mock.Mock()
+
+        # Uma migração que falha não é registrada e interrompe as seguintes
+        migracoes = publicadas + [(nova_versao, "falha", falha), (nova_versao + 1, "nova", nova)]
+        with mock.patch.object(ogr_importer, "MIGRACOES", migracoes):
+            with self.assertRaises(RuntimeError):
+                ogr_importer.aplicar_migracoes()
+        self.assertNotIn(nova_versao, self._versoes())
+        nova.assert_not_called()
+
+        migracoes = publicadas + [(nova_versao, "nova", nova)]
+        with mock.patch.object(ogr_importer, "MIGRACOES", migracoes):
+            self.assertEqual(ogr_importer.aplicar_migracoes(), nova_versao)
+            self.assertEqual(ogr_importer.aplicar_migracoes(), nova_versao)
+        nova.assert_called_once()
+        for _, _, migracao in publicadas:
+            migracao.assert_not_called()
+
+    def test_upload_recusado_com_esquema_atrasado(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        versao = ogr_importer.VERSAO_ESQUEMA
+        self._sql(f"DELETE FROM {ogr_importer.TABELA_VERSAO_ESQUEMA} WHERE versao = %s", (versao,))
+        self.addCleanup(self._sql, f"INSERT INTO {ogr_importer.TABELA_VERSAO_ESQUEMA} (versao) VALUES (%s)", (versao,))
+
+        with mock.patch.object(ogr_importer, "_esquema_pronto", False):
+            with self.assertRaises(RuntimeError):
+                ogr_importer.garantir_esquema()
+            resposta = self.client.post("/api/importar/", {"arquivos": SimpleUploadedFile("a.gpkg", b"x")})
+            self.assertEqual(resposta.status_code, 503)
+            self.assertIn("migrar_esquema", resposta.json()["erro"])
+            self.assertFalse(FilaImportacao.objects.exists())
+
+            # De volta à versão esperada: a verificação passa e fica em cache no processo
+            self._sql(f"INSERT INTO {ogr_importer.TABELA_VERSAO_ESQUEMA} (versao) VALUES (%s)", (versao,))
+            ogr_importer.garantir_esquema()
+            self.assertTrue(ogr_importer._esquema_pronto)
+            self._sql(f"DELETE FROM {ogr_importer.TABELA_VERSAO_ESQUEMA} WHERE versao = %s", (versao,))
+            ogr_importer.garantir_esquema()  # sem ir ao banco
+
+
+class CatalogoTestCase(_EsquemaDeTeste, TransactionTestCase):
+    def _gpkg(self, pontos):
+        """GPKG temporário com uma camada de pontos em EPSG:3857."""
+        ogr, osr = ogr_importer.ogr, ogr_importer.osr
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta, True)
+        caminho = os.path.join(pasta, "produto.gpkg")
+        ds = ogr.GetDriverByName("GPKG").CreateDataSource(caminho)
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(3857)
+        camada = ds.CreateLayer("HID_Trecho_Drenagem_L", srs, ogr.wkbPoint)
+        camada.CreateField(ogr.FieldDefn("nome", ogr.OFTString))
+        for x, y in pontos:
+            feicao = ogr.Feature(camada.GetLayerDefn())
+            feicao.SetField("nome", "Rio")
+            feicao.SetGeometry(ogr.CreateGeometryFromWkt(f"POINT ({x} {y})"))
+            camada.CreateFeature(feicao)
+        ds = None
+        return caminho
+
+    def test_catalogo_gravado_com_as_feicoes(self):
+        from importservice import banco
+        from importservice.models import ProdutoGeoespacial
+        caminho = self._gpkg([(1000, 2000), (3000, 4000)])
+
+        # Falha depois de gravar o catálogo: nada é confirmado
+        with mock.patch.object(ogr_importer, "incrementar_geracao", side_effect=RuntimeError("queda")):
+            with self.assertRaises(RuntimeError):
+                ogr_importer.importar_para_tabela(caminho, banco.TABELA_GEOMETRIAS)
+        self.assertFalse(ProdutoGeoespacial.objects.exists())
+        self.assertEqual(self._contar(banco.TABELA_GEOMETRIAS, "produto.gpkg"), 0)
+
+        self.assertEqual(ogr_importer.importar_para_tabela(caminho, banco.TABELA_GEOMETRIAS), 2)
+        produto = ProdutoGeoespacial.objects.get(metadata_id="produto.gpkg")
+        self.assertEqual(produto.quantidade_feicoes, 2)
+        self.assertEqual(produto.contagem_classes, {"HID_Trecho_Drenagem_L": 2})
+        (x1, y1, x2, y2), = self._sql("""
+            SELECT ST_X(a), ST_Y(a), ST_X(b), ST_Y(b) FROM (
+                SELECT ST_Transform(ST_SetSRID(ST_MakePoint(1000, 2000), 3857), 4326) a,
+                       ST_Transform(ST_SetSRID(ST_MakePoint(3000, 4000), 3857), 4326) b) t
+        """)
+        for obtido, esperado in zip(produto.bbox, (x1, y1, x2, y2)):
+            self.assertAlmostEqual(obtido, esperado)
+        self.assertEqual(self._contar(banco.TABELA_GEOMETRIAS, "produto.gpkg"), 2)
+
+    def test_backfill_dos_produtos_legados(self):
+        import psycopg2
+        from importservice import banco
+        from importservice.models import ProdutoGeoespacial
+        self._produto("legado", {"HID_Trecho_Drenagem_L": [1, 2], "TRA_Trecho_Rodoviario_L": [3]})
+        self._produto("catalogado", {"HID_Trecho_Drenagem_L": [5]})
+        # 'legado' foi importado antes do catálogo; 'catalogado' já tem a sua linha
+        ProdutoGeoespacial.objects.filter(metadata_id="legado").delete()
+        ProdutoGeoespacial.objects.filter(metadata_id="catalogado").update(nome_arquivo="manual.gpkg")
+
+        conn = psycopg2.connect(**banco.CONFIG_BANCO)
+        try:
+            with conn, conn.cursor() as cur:
+                ogr_importer._migracao_catalogo_legado(cur)
+        finally:
+            conn.close()
+
+        legado = ProdutoGeoespacial.objects.get(metadata_id="legado")
+        self.assertEqual(legado.quantidade_feicoes, 3)
+        self.assertEqual(legado.contagem_classes, {"HID_Trecho_Drenagem_L": 2, "TRA_Trecho_Rodoviario_L": 1})
+        self.assertEqual(len(legado.bbox), 4)
+        self.assertIsNotNone(legado.area_mapeada)
+        self.assertEqual(ProdutoGeoespacial.objects.get(metadata_id="catalogado").nome_arquivo, "manual.gpkg")
+
+
+class ParticaoTipoGeometriaTestCase(_EsquemaDeTeste, TransactionTestCase):
+    def test_tipo_geometria_da_feicao(self):
+        ogr = ogr_importer.ogr
+        casos = {
+            "MULTIPOINT ((1 1))": "ponto",
+            "MULTILINESTRING ((0 0, 1 1))": "linha",
+            "MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)))": "area",
+            "MULTIPOINT Z ((1 1 5))": "ponto",
+            "MULTIPOINT M ((1 1 5))": "outros",
+            "GEOMETRYCOLLECTION (POINT (1 1))": "outros",
+        }
+        for wkt, tipo in casos.items():
+            self.assertEqual(ogr_importer._tipo_geometria(ogr.CreateGeometryFromWkt(wkt)), tipo, wkt)
+
+    def test_roteamento_e_check_das_particoes(self):
+        import psycopg2
+        from importservice import banco
+        self._produto("p1", {"HID_Trecho_Drenagem_L": [1]})
+        produto_id, classe_id = self._sql(f"SELECT produto_id, classe_id FROM {banco.TABELA_FEICOES}")[0]
+        inserir = f"""
+            INSERT INTO {banco.TABELA_FEICOES} (produto_id, classe_id, tipo_geometria, wkb_geometry)
+            VALUES (%s, %s, %s, ST_GeomFromText(%s, 3857))
+            RETURNING tableoid::regclass::text;
+        """
+        for wkt, tipo in (("MULTILINESTRING ((0 0, 1 1))", "linha"),
+                          ("MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)))", "area"),
+                          ("GEOMETRYCOLLECTION (POINT (1 1))", "outros")):
+            particao, = self._sql(inserir, (produto_id, classe_id, tipo, wkt))[0]
+            self.assertEqual(particao, f"{banco.TABELA_FEICOES}_{tipo}")
+
+        # O CHECK de cada partição recusa geometrias de outro tipo
+        with self.assertRaises(psycopg2.errors.CheckViolation):
+            self._sql(inserir, (produto_id, classe_id, "ponto", "MULTILINESTRING ((0 0, 1 1))"))
+
+        # Camadas tipadas do QGIS: uma view por partição, já com a geometria certa
+        self.assertEqual(self._contar(f"{banco.TABELA_GEOMETRIAS}_ponto", "p1"), 1)
+        self.assertEqual(self._contar(f"{banco.TABELA_GEOMETRIAS}_linha", "p1"), 1)
+
+
+class ResumoGruposTestCase(_EsquemaDeTeste, TransactionTestCase):
+    def _grupos(self, metadata_id):
+        from importservice import banco
+        return self._sql(f"""
+            SELECT graphic_representation_group, count(*) FROM {banco.TABELA_GRUPOS}
+            WHERE metadata_id = %s GROUP BY 1 ORDER BY 1
+        """, (metadata_id,))
+
+    def test_resumo_atualizado_so_nos_produtos_informados(self):
+        import psycopg2
+        from importservice import banco
+        self._produto("p1", {"HID_Trecho_Drenagem_L": [1, 2]})
+        self._produto("p2", {"HID_Trecho_Drenagem_L": [3]})
+        self._sql(f"UPDATE {banco.TABELA_FEICOES} SET graphic_representation_group = 'Hidrografia'")
+
+        conn = psycopg2.connect(**banco.CONFIG_BANCO)
+        try:
+            with conn, conn.cursor() as cur:
+                inseridas = banco.atualizar_resumo_grupos(cur, ["p1"])
+        finally:
+            conn.close()
+
+        self.assertEqual(inseridas, 2)
+        self.assertEqual(self._grupos("p1"), [("Hidrografia", 2)])
+        self.assertEqual(self._grupos("p2"), [("OUTRO", 1)])  # fora do escopo: intocado
+        # Partição e view criadas sob demanda para o grupo novo
+        self.assertEqual(self._contar(f"{banco.TABELA_GRUPOS}_hidrografia_visiveis", "p1"), 2)
+
+    def test_worker_remapeia_as_classes_pendentes(self):
+        from importservice import banco
+        from importservice.models import RemapeamentoGrupo
+        self._produto("p1", {"HID_Trecho_Drenagem_L": [1, 2], "TRA_Trecho_Rodoviario_L": [3]})
+
+        RepresentacaoGrafica.objects.create(esquema="EDGV 3.0", classe="HID_Trecho_Drenagem_L",
+                                            grupo_representacao="Hidrografia")
+        self.assertEqual(list(RemapeamentoGrupo.objects.values_list("classe", flat=True)), ["HID_Trecho_Drenagem_L"])
+        self.assertEqual(self._grupos("p1"), [("OUTRO", 3)])  # nada remapeado na requisição
+
+        self.assertEqual(banco.remapear_pendentes(), ["HID_Trecho_Drenagem_L"])
+        self.assertFalse(RemapeamentoGrupo.objects.exists())
+        self.assertEqual(self._grupos("p1"), [("Hidrografia", 2), ("OUTRO", 1)])
+
+    def test_um_remapeamento_por_transacao(self):
+        from django.db import transaction
+        from importservice import banco
+        with mock.patch.object(banco, "PROCESSAMENTO_FILA", "thread"), \
+                mock.patch.object(banco, "atualizar_grupos_das_classes") as atualizar:
+            with transaction.atomic():
+                for classe in ("TRA_Trecho_Rodoviario_L", "HID_Trecho_Drenagem_L", "TRA_Trecho_Rodoviario_L"):
+                    RepresentacaoGrafica.objects.update_or_create(
+                        esquema="EDGV 3.0", classe=classe, defaults={"grupo_representacao": "Hidrografia"}
+                    )
+                atualizar.assert_not_called()
+        atualizar.assert_called_once_with(["HID_Trecho_Drenagem_L", "TRA_Trecho_Rodoviario_L"])
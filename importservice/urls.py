@@ -1,9 +1,16 @@
 from django.urls import path
+from . import views_async
 from .views import (
     ApiRootView,
     ListarHistoricoView,
     ListarProdutosView,
+    ResumoProdutosView,
+    BuscarProdutosView,
+    ExportarProdutoView,
+    ConsultarFeicoesView,
+    ConsultarFeicoesAtributosView,
     UploadArquivoView,
+    FilaImportacaoView,
     RemoverProdutoView,
     RepresentacaoGraficaBulkUpdateView,
     ListarGruposRepresentacaoView
@@ -13,8 +20,20 @@ urlpatterns = [
     path("", ApiRootView.as_view(), name="api-root"),
     path("historico/", ListarHistoricoView.as_view(), name="historico"),
     path("produtos/", ListarProdutosView.as_view(), name="produtos"),
+    path("produtos/resumo/", ResumoProdutosView.as_view(), name="produtos_resumo"),
+    path("produtos/busca/", BuscarProdutosView.as_view(), name="produtos_busca"),
+    path("produtos/<str:metadata_id>/export/", ExportarProdutoView.as_view(), name="produtos_exportar"),
+    path("feicoes/", ConsultarFeicoesView.as_view(), name="feicoes"),
+    path("feicoes/atributos/", ConsultarFeicoesAtributosView.as_view(), name="feicoes_atributos"),
     path("importar/", UploadArquivoView.as_view(), name="importar"),
+    path("importacoes/", FilaImportacaoView.as_view(), name="importacoes"),
+    path("importacoes/<int:importacao_id>/", FilaImportacaoView.as_view(), name="importacoes_item"),
     path("remover/<str:metadata_id>/", RemoverProdutoView.as_view(), name="remover"),
     path("representacoes/update/", RepresentacaoGraficaBulkUpdateView.as_view(), name="representacoes_update"),
-    path('representacoes/', ListarGruposRepresentacaoView.as_view(), name='listar_representacoes')
+    path('representacoes/', ListarGruposRepresentacaoView.as_view(), name='listar_representacoes'),
+    # Variantes assíncronas das leituras (psycopg 3 + pool próprio; use com SERVIDOR=asgi)
+    path("async/produtos/", views_async.listar_produtos, name="async_produtos"),
+    path("async/historico/", views_async.listar_historico, name="async_historico"),
+    path("async/representacoes/", views_async.listar_representacoes, name="async_representacoes"),
+    path("async/feicoes/", views_async.consultar_feicoes, name="async_feicoes"),
 ]
@@ -6,13 +6,24 @@ from rest_framework.response import Response
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.http import StreamingHttpResponse
+import functools
+import hashlib
+import json
 import os
+import shutil
+import tempfile
 import psycopg2
-from urllib.parse import unquote_plus
+from urllib.parse import unquote_plus, urlencode
+from django.core.cache import cache
 from django.db import transaction
-from .models import HistoricoImportacaoExclusao, ProdutoGeoespacial, RepresentacaoGrafica
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from .models import FilaImportacao, GeracaoCatalogo, HistoricoImportacaoExclusao, ProdutoGeoespacial, RemocaoProduto, RepresentacaoGrafica
 from .serializers import HistoricoImportacaoExclusaoSerializer, ProdutoGeoespacialSerializer, RepresentacaoGraficaSerializer
-from . import ogr_importer
+from . import admissao, banco, remocao
 
 
 # ------------------------ API ROOT ------------------------
@@ -22,23 +33,171 @@ class ApiRootView(APIView):
             "mensagem": "API Geodataimporter funcionando.",
             "endpoints": {
                 "importar": "/api/importar/",
+                "importacoes": "/api/importacoes/{id}/",
                 "remover": "/api/remover/{metadata_id}/",
-                "produtos": "/api/produtos/",
+                "produtos": "/api/produtos/?metadata_id=&classe=&atributos=0|1",
+                "produtos-resumo": "/api/produtos/resumo/?metadata_id=&classe=",
+                "produtos-busca": "/api/produtos/busca/?bbox={minx},{miny},{maxx},{maxy}",
+                "produtos-exportar": "/api/produtos/{metadata_id}/export/?format=gpkg|fgb",
+                "feicoes": "/api/feicoes/?bbox={minx},{miny},{maxx},{maxy}&classe=&grupo=&srid=",
+                "feicoes-atributos": "/api/feicoes/atributos/?classe=&contem={json}&jsonpath=",
                 "historico": "/api/historico/",
-                "representacoes-bulk": "/api/representacoes/bulk-update/"
+                "representacoes": "/api/representacoes/",
+                "representacoes-bulk": "/api/representacoes/update/",
+                "async": "/api/async/produtos/ | historico/ | representacoes/ | feicoes/ (ASGI)"
             }
         })
 
 
+# ------------------------ CACHE CONDICIONAL ------------------------
+def _geracao_catalogo():
+    """(geração, alterado_em) atuais do catálogo; (0, None) antes da primeira alteração."""
+    return GeracaoCatalogo.objects.filter(pk=1).values_list("geracao", "alterado_em").first() or (0, None)
+
+
+CABECALHOS_PAGINACAO = ("X-Proximo", "Link")
+
+
+def resposta_condicional(get):
+    """
+    GET condicional para listagens: ETag/Last-Modified derivados da geração do
+    catálogo, 304 quando o cliente já tem a versão atual e cache compartilhado
+    (CACHES) das respostas por view, parâmetros de consulta e geração.
+    """
+    @functools.wraps(get)
+    def wrapper(self, request, *args, **kwargs):
+        try:
+            geracao, alterado_em = _geracao_catalogo()
+        except Exception as e:
+            banco.safe_print(f"⚠️ Geração do catálogo indisponível, respondendo sem cache: {e}")
+            return get(self, request, *args, **kwargs)
+
+        consulta = urlencode(sorted(request.query_params.lists()), doseq=True)
+        assinatura = hashlib.md5(consulta.encode()).hexdigest()[:16]
+        view = type(self).__name__
+        etag = f'W/"{view}-{geracao}-{assinatura}"'
+        ultima_alteracao = int(alterado_em.timestamp()) if alterado_em else None
+
+        def _cabecalhos(resposta):
+            resposta["ETag"] = etag
+            if ultima_alteracao is not None:
+                resposta["Last-Modified"] = http_date(ultima_alteracao)
+            resposta["Cache-Control"] = "no-cache"
+            return resposta
+
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            if "*" in etags or etag in etags:
+                return _cabecalhos(Response(status=status.HTTP_304_NOT_MODIFIED))
+        else:
+            desde = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+            if desde is not None and ultima_alteracao is not None and ultima_alteracao <= desde:
+                return _cabecalhos(Response(status=status.HTTP_304_NOT_MODIFIED))
+
+        # Guarda o corpo e os cabeçalhos de paginação ('v2': antes só o corpo)
+        chave = f"resposta:v2:{view}:{geracao}:{assinatura}"
+        em_cache = cache.get(chave)
+        if em_cache is not None:
+            dados, extras = em_cache
+            return _cabecalhos(Response(dados, headers=extras))
+
+        resposta = get(self, request, *args, **kwargs)
+        if resposta.status_code != status.HTTP_200_OK:
+            return resposta
+        extras = {nome: resposta[nome] for nome in CABECALHOS_PAGINACAO if resposta.has_header(nome)}
+        cache.set(chave, (resposta.data, extras))
+        return _cabecalhos(resposta)
+
+    return wrapper
+
+
 # ------------------------ HISTÓRICO ------------------------
+HISTORICO_LIMITE_PADRAO = 200
+HISTORICO_LIMITE_MAXIMO = 1000
+
+
+def _cursor_historico(evento):
+    return f"{evento.data_evento.isoformat()}|{evento.pk}"
+
+
+def _cabecalhos_paginacao(request, proximo):
+    """Cursor da próxima página em X-Proximo e Link rel="next" (o corpo continua sendo a lista)."""
+    if not proximo:
+        return {}
+    params = request.GET.copy()
+    params["cursor"] = proximo
+    url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+    return {"X-Proximo": proximo, "Link": f'<{url}>; rel="next"'}
+
+
+def _parse_historico(params):
+    """
+    Valida os parâmetros da listagem do histórico (também usados pela variante
+    assíncrona). Devolve (limite, campos, intervalo, cursor); ValueError se inválidos.
+    """
+    limite = min(int(params.get("limite", HISTORICO_LIMITE_PADRAO)), HISTORICO_LIMITE_MAXIMO)
+    if limite < 1:
+        raise ValueError("limite deve ser positivo")
+    campos = {campo: params[campo] for campo in ("acao", "metadata_id", "classe") if params.get(campo)}
+    intervalo = {}
+    for nome in ("desde", "ate"):
+        if params.get(nome):
+            valor = parse_datetime(params[nome]) or parse_date(params[nome])
+            if valor is None:
+                raise ValueError(f"{nome} inválido: {params[nome]}")
+            intervalo[nome] = valor
+    cursor = None
+    if params.get("cursor"):
+        # '+' do fuso vira espaço quando o cliente não codifica a URL
+        data, _, pk = params["cursor"].replace(" ", "+").rpartition("|")
+        data = parse_datetime(data)
+        if data is None:
+            raise ValueError("cursor inválido")
+        cursor = (data, int(pk))
+    return limite, campos, intervalo, cursor
+
+
 class ListarHistoricoView(APIView):
+    @swagger_auto_schema(
+        operation_description=(
+            "Histórico de importações/remoções (mais recentes primeiro) com estatísticas de desempenho. "
+            "Paginação por chave: passe o cabeçalho X-Proximo da resposta em 'cursor' (ou siga o Link rel=\"next\")."
+        ),
+        manual_parameters=[
+            openapi.Parameter("limite", openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description=f"Eventos por página (padrão {HISTORICO_LIMITE_PADRAO}, máx. {HISTORICO_LIMITE_MAXIMO})"),
+            openapi.Parameter("cursor", openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Valor do cabeçalho X-Proximo da página anterior"),
+            openapi.Parameter("acao", openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=["adicionado", "removido"]),
+            openapi.Parameter("metadata_id", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+            openapi.Parameter("classe", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+            openapi.Parameter("desde", openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Data/hora ISO (inclusive)"),
+            openapi.Parameter("ate", openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Data/hora ISO (exclusive)"),
+        ]
+    )
+    @resposta_condicional
     def get(self, request):
         try:
-            historico = HistoricoImportacaoExclusao.objects.all().order_by('-data_evento')[:200]
-            serializer = HistoricoImportacaoExclusaoSerializer(historico, many=True)
-            return Response(serializer.data)
+            limite, campos, intervalo, cursor = _parse_historico(request.query_params)
+            historico = HistoricoImportacaoExclusao.objects.filter(**campos)
+            if "desde" in intervalo:
+                historico = historico.filter(data_evento__gte=intervalo["desde"])
+            if "ate" in intervalo:
+                historico = historico.filter(data_evento__lt=intervalo["ate"])
+            if cursor:
+                data, pk = cursor
+                historico = historico.filter(Q(data_evento__lt=data) | Q(data_evento=data, pk__lt=pk))
+        except ValueError as e:
+            return Response({"erro": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            pagina = list(historico.select_related("usuario").order_by('-data_evento', '-id')[:limite + 1])
+            proximo = _cursor_historico(pagina[limite - 1]) if len(pagina) > limite else None
+            serializer = HistoricoImportacaoExclusaoSerializer(pagina[:limite], many=True)
+            return Response(serializer.data, headers=_cabecalhos_paginacao(request, proximo))
         except Exception as e:
-            ogr_importer.safe_print(f"Erro ao listar histórico: {e}")
+            banco.safe_print(f"Erro ao listar histórico: {e}")
             return Response({"erro": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
@@ -47,7 +206,10 @@ class UploadArquivoView(APIView):
     parser_classes = [MultiPartParser]
 
     @swagger_auto_schema(
-        operation_description="Upload de múltiplos arquivos GPKG, ZIP, SHP ou XML para importação via OGR.",
+        operation_description=(
+            "Upload de múltiplos arquivos GPKG, ZIP, SHP ou XML para importação via OGR. As importações "
+            "entram na fila de admissão e rodam em segundo plano; acompanhe em /api/importacoes/{id}/."
+        ),
         manual_parameters=[
             openapi.Parameter(
                 name="arquivos",
@@ -56,53 +218,82 @@ class UploadArquivoView(APIView):
                 description="Envie múltiplos arquivos vetoriais (GPKG, ZIP, SHP ou XML)",
                 required=True,
                 multiple=True
+            ),
+            openapi.Parameter(
+                name="modo",
+                in_=openapi.IN_FORM,
+                type=openapi.TYPE_STRING,
+                enum=["diferencial"],
+                description="diferencial: reimporta produtos existentes aplicando só as feições alteradas",
+                required=False
             )
         ],
-        responses={200: "Arquivos importados ou ignorados com aviso"}
+        responses={
+            202: "Arquivos na fila de importação (posição e estimativa)",
+            200: "Arquivos ignorados com aviso",
+            429: "Fila cheia (ver Retry-After)"
+        }
     )
     def post(self, request, format=None):
+        from . import ogr_importer  # GDAL só é carregado nas rotas que o usam
+
         arquivos = request.FILES.getlist("arquivos")
         if not arquivos:
             return Response({"erro": "Nenhum arquivo enviado"}, status=status.HTTP_400_BAD_REQUEST)
 
+        modo = request.data.get("modo") or None
+        if modo not in (None, "diferencial"):
+            return Response({"erro": f"Modo inválido: {modo}"}, status=status.HTTP_400_BAD_REQUEST)
+
         pasta_destino = os.path.join(settings.MEDIA_ROOT, "uploads")
         os.makedirs(pasta_destino, exist_ok=True)
 
-        conn_str = "PG: " + ' '.join(f"{k}={v}" for k, v in ogr_importer.CONFIG_BANCO.items())
-        ogr_importer.verificar_ou_criar_tabela(ogr_importer.TABELA_GLOBAL, conn_str)
-
-        resultados = []
+        # O esquema é migrado no deploy (manage.py migrar_esquema); aqui só a checagem em cache
+        try:
+            ogr_importer.garantir_esquema()
+        except RuntimeError as e:
+            return Response({"erro": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
+        # Recusa antes de gravar qualquer arquivo; enfileirar() confere de novo sob o lock
         try:
-            conn = psycopg2.connect(
-                dbname=ogr_importer.CONFIG_BANCO["dbname"],
-                user=ogr_importer.CONFIG_BANCO["user"],
-                password=ogr_importer.CONFIG_BANCO["password"],
-                host=ogr_importer.CONFIG_BANCO["host"],
-                port=ogr_importer.CONFIG_BANCO["port"],
-            )
-            cursor = conn.cursor()
-        except Exception as e:
-            return Response({"erro": f"Erro ao conectar no banco para pré-verificação: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            admissao.verificar_capacidade(len(arquivos))
+        except admissao.FilaCheia as e:
+            return _fila_cheia(e, [])
+
+        resultados = []
+        admitidos = []
+        salvos = []
 
         for arquivo in arquivos:
             nome = arquivo.name
             caminho_salvo = os.path.join(pasta_destino, nome)
 
+            # Não sobrescreve o arquivo de um item que ainda está na fila
+            if FilaImportacao.objects.using("default").filter(
+                nome=nome, status__in=admissao.STATUS_ATIVOS
+            ).exclude(arquivo="").exists():
+                resultados.append({
+                    "arquivo": nome,
+                    "status": "aviso",
+                    "detalhes": f"Arquivo '{nome}' já está na fila de importação."
+                })
+                continue
+
             with open(caminho_salvo, "wb+") as destino:
                 for chunk in arquivo.chunks():
                     destino.write(chunk)
+            salvos.append(caminho_salvo)
 
             xml_path = ogr_importer.find_xml_for_file(caminho_salvo)
             escala, data_do_produto, esquema, metadata_id = ogr_importer.extract_metadata_from_xml(xml_path)
 
-            if not metadata_id:
-                metadata_id = os.path.splitext(nome)[0]
+            # Mesma regra do importador para produtos sem fileIdentifier
+            if not metadata_id or metadata_id == "Não informado":
+                metadata_id = os.path.basename(caminho_salvo)
 
-            # Verifica se já existe feições com esse metadata_id
+            # Verifica no catálogo (índice único em metadata_id) se o produto já existe
             try:
-                cursor.execute(f"SELECT COUNT(*) FROM {ogr_importer.TABELA_GLOBAL} WHERE metadata_id = %s", (metadata_id,))
-                count = cursor.fetchone()[0]
+                existe = ProdutoGeoespacial.objects.filter(metadata_id=metadata_id).exists()
             except Exception as e:
                 resultados.append({
                     "arquivo": nome,
@@ -111,54 +302,133 @@ class UploadArquivoView(APIView):
                 })
                 continue
 
-            if count > 0:
+            if RemocaoProduto.objects.filter(metadata_id=metadata_id, status__in=remocao.STATUS_ATIVOS).exists():
                 resultados.append({
                     "arquivo": nome,
                     "status": "aviso",
-                    "detalhes": f"Arquivo com metadata_id '{metadata_id}' já existe no banco. Importação ignorada."
+                    "detalhes": f"Remoção do metadata_id '{metadata_id}' em andamento. Envie novamente ao final."
                 })
-                continue  # Não importa, nem registra histórico
-
-            # Importa só se não existir
-            try:
-                ogr_importer.importar_para_tabela(
-                    caminho_salvo,
-                    ogr_importer.TABELA_GLOBAL,
-                    xml=xml_path
-                )
-
-                HistoricoImportacaoExclusao.objects.create(
-                    metadata_id=metadata_id,
-                    classe=None,
-                    acao='adicionado',
-                    usuario=request.user if request.user.is_authenticated else None,
-                    detalhes=f"Arquivo {nome} importado com sucesso."
-                )
+                continue
 
+            if existe and modo != "diferencial":
                 resultados.append({
                     "arquivo": nome,
-                    "status": "sucesso",
-                    "metadata_id": metadata_id
+                    "status": "aviso",
+                    "detalhes": f"Arquivo com metadata_id '{metadata_id}' já existe no banco. Importação ignorada."
                 })
+                continue  # Não importa, nem registra histórico
+
+            admitidos.append({
+                "nome": nome,
+                "arquivo": caminho_salvo,
+                "xml": xml_path,
+                "metadata_id": metadata_id,
+                "modo": modo,
+                "bytes": os.path.getsize(caminho_salvo),
+            })
+
+        # Só ficam em disco os arquivos dos itens admitidos (e os XML laterais deles)
+        em_uso = set()
+        for dados in admitidos:
+            em_uso.add(dados["arquivo"])
+            if dados["xml"] and dados["xml"][0] == "fs":
+                em_uso.add(dados["xml"][1])
+        if not admitidos:
+            _descartar_uploads(salvos)
+            return Response(resultados)
 
+        # A importação roda em segundo plano, quando a fila de admissão liberar vaga
+        try:
+            itens = admissao.enfileirar(
+                admitidos, usuario=request.user if request.user.is_authenticated else None
+            )
+        except admissao.FilaCheia as e:
+            _descartar_uploads(salvos)
+            return _fila_cheia(e, resultados)
+        except Exception as e:
+            banco.safe_print(f"Erro ao enfileirar importações: {e}")
+            _descartar_uploads(salvos)
+            return Response({"erro": str(e), "resultados": resultados}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        _descartar_uploads([caminho for caminho in salvos if caminho not in em_uso])
+
+        resultados += _situacao_fila(FilaImportacao.objects.using("default").filter(pk__in=[i.pk for i in itens]))
+        return Response(resultados, status=status.HTTP_202_ACCEPTED)
+
+
+def _fila_cheia(erro, resultados):
+    return Response(
+        {"erro": str(erro), "retry_after": erro.retry_after, "resultados": resultados},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(erro.retry_after)}
+    )
+
+
+def _descartar_uploads(caminhos):
+    """Apaga os arquivos gravados para itens recusados ou ignorados."""
+    for caminho in caminhos:
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+
+# ------------------------ FILA DE IMPORTAÇÃO ------------------------
+def _situacao_fila(itens):
+    """Itens da fila com a posição e a estimativa (s) de início dos que aguardam."""
+    posicoes = admissao.estimativas()
+    situacao = []
+    for item in itens.order_by("solicitado_em", "id"):
+        posicao, eta = posicoes.get(item.pk, (None, None))
+        situacao.append({
+            "arquivo": item.nome,
+            "importacao_id": item.pk,
+            "metadata_id": item.metadata_id,
+            "status": item.status,
+            "posicao": posicao,
+            "eta_s": eta,
+            "bytes": item.bytes,
+            "solicitado_em": item.solicitado_em,
+            "iniciado_em": item.iniciado_em,
+            "concluido_em": item.concluido_em,
+            "quantidade_feicoes": item.quantidade_feicoes,
+            "detalhes": item.erro,
+        })
+    return situacao
+
+
+class FilaImportacaoView(APIView):
+    @swagger_auto_schema(
+        operation_description=(
+            "Fila de importação: itens aguardando (com posição e estimativa de início em segundos) "
+            "e em andamento, ou um item pelo id devolvido no upload."
+        ),
+        responses={200: "Situação da fila", 404: "Item não encontrado"}
+    )
+    def get(self, request, importacao_id=None):
+        # Também devolve à fila importações de processos que caíram e inicia as próximas
+        if banco.processamento_em_thread():
+            try:
+                admissao.despachar()
             except Exception as e:
-                ogr_importer.safe_print(f"Erro ao importar {nome}: {e}")
-                resultados.append({
-                    "arquivo": nome,
-                    "status": "erro",
-                    "detalhes": str(e)
-                })
+                banco.safe_print(f"⚠️ Erro ao despachar a fila de importação: {e}")
 
-        cursor.close()
-        conn.close()
+        fila = FilaImportacao.objects.using("default")
+        if importacao_id is None:
+            return Response(_situacao_fila(fila.filter(status__in=admissao.STATUS_ATIVOS)))
 
-        return Response(resultados)
+        itens = _situacao_fila(fila.filter(pk=importacao_id))
+        if not itens:
+            return Response({"erro": f"Importação {importacao_id} não encontrada"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(itens[0])
 
 
 # ------------------------ REMOVER ------------------------
 class RemoverProdutoView(APIView):
     @swagger_auto_schema(
-        operation_description="Remove feições por metadata_id. Opcionalmente, filtra por classe.",
+        operation_description=(
+            "Remove feições por metadata_id. Opcionalmente, filtra por classe. O produto some "
+            "imediatamente das listagens e do mapa; as feições são apagadas em lotes em segundo plano."
+        ),
         manual_parameters=[
             openapi.Parameter(
                 "classe",
@@ -166,148 +436,560 @@ class RemoverProdutoView(APIView):
                 description="Classe específica para remoção dentro do metadata_id",
                 type=openapi.TYPE_STRING
             )
-        ]
+        ],
+        responses={202: "Remoção agendada", 404: "Produto/classe não encontrado"}
     )
     def delete(self, request, metadata_id):
         classe = request.query_params.get("classe", None)
 
-        try:
-            conn = psycopg2.connect(
-                dbname=ogr_importer.CONFIG_BANCO["dbname"],
-                user=ogr_importer.CONFIG_BANCO["user"],
-                password=ogr_importer.CONFIG_BANCO["password"],
-                host=ogr_importer.CONFIG_BANCO["host"],
-                port=ogr_importer.CONFIG_BANCO["port"],
-            )
-            cursor = conn.cursor()
-
-            if classe:
-                sql = f"DELETE FROM {ogr_importer.TABELA_GLOBAL} WHERE metadata_id = %s AND classe = %s"
-                cursor.execute(sql, (metadata_id, classe))
-            else:
-                sql = f"DELETE FROM {ogr_importer.TABELA_GLOBAL} WHERE metadata_id = %s"
-                cursor.execute(sql, (metadata_id,))
-
-            conn.commit()
-
-            if cursor.rowcount == 0:
-                msg = f"Nenhuma feição encontrada para metadata_id '{metadata_id}'"
-                if classe:
-                    msg += f" e classe '{classe}'"
-                cursor.close()
-                conn.close()
-                return Response({"mensagem": msg}, status=status.HTTP_404_NOT_FOUND)
-
-            msg = f"Feições com metadata_id '{metadata_id}'"
+        # Existência vem do catálogo, sem tocar na tabela de geometrias
+        produto = ProdutoGeoespacial.objects.filter(metadata_id=metadata_id).first()
+        if produto is None or (classe and classe not in (produto.contagem_classes or {})):
+            msg = f"Nenhuma feição encontrada para metadata_id '{metadata_id}'"
             if classe:
                 msg += f" e classe '{classe}'"
-            msg += " removidas com sucesso."
+            return Response({"mensagem": msg}, status=status.HTTP_404_NOT_FOUND)
 
-            # só registra histórico se realmente removeu
-            HistoricoImportacaoExclusao.objects.create(
-                metadata_id=metadata_id,
+        try:
+            total = (produto.contagem_classes or {}).get(classe, 0) if classe else produto.quantidade_feicoes
+            item, criada = remocao.solicitar_remocao(
+                metadata_id,
                 classe=classe,
-                acao='removido',
                 usuario=request.user if request.user.is_authenticated else None,
-                detalhes=msg
+                total=total
             )
 
-            cursor.close()
-            conn.close()
+            msg = f"Remoção de metadata_id '{metadata_id}'"
+            if classe:
+                msg += f" e classe '{classe}'"
+            msg += " agendada." if criada else " já está em andamento."
 
-            return Response({"mensagem": msg})
+            return Response({
+                "mensagem": msg,
+                "remocao_id": item.pk,
+                "status": item.status,
+                "total": item.total,
+                "removidas": item.removidas,
+            }, status=status.HTTP_202_ACCEPTED)
 
         except Exception as e:
-            ogr_importer.safe_print(f"Erro ao remover {metadata_id}: {e}")
+            banco.safe_print(f"Erro ao remover {metadata_id}: {e}")
             return Response({"erro": f"Erro ao remover: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @swagger_auto_schema(operation_description="Progresso das remoções do metadata_id (mais recentes primeiro).")
+    def get(self, request, metadata_id):
+        remocoes = RemocaoProduto.objects.filter(metadata_id=metadata_id).order_by("-solicitado_em")[:20]
+        return Response([{
+            "remocao_id": r.pk,
+            "classe": r.classe,
+            "status": r.status,
+            "total": r.total,
+            "removidas": r.removidas,
+            "solicitado_em": r.solicitado_em,
+            "concluido_em": r.concluido_em,
+            "erro": r.erro,
+        } for r in remocoes])
+
 
 # ------------------------ LISTAR PRODUTOS ------------------------
+def _remocoes_ativas():
+    """Pares (metadata_id, classe) com lápide ativa; classe None = produto inteiro."""
+    return set(
+        RemocaoProduto.objects
+        .filter(status__in=remocao.STATUS_ATIVOS)
+        .values_list("metadata_id", "classe")
+    )
+
+
+def _incluir_atributos(params):
+    """Parâmetro atributos da listagem de produtos: só '0'/'false' omite os jsons."""
+    return (params.get("atributos") or "1").strip().lower() not in ("0", "false")
+
+
 class ListarProdutosView(APIView):
     @swagger_auto_schema(
-        operation_description="Lista produtos importados. Filtra opcionalmente por metadata_id e classe.",
+        operation_description=(
+            "Lista produtos importados, uma linha por produto e classe, a partir do catálogo. "
+            "Filtra opcionalmente por metadata_id e classe. Cada linha traz os atributos das "
+            "feições (jsons); atributos=0 os omite e evita ler a tabela de geometrias."
+        ),
         manual_parameters=[
             openapi.Parameter("metadata_id", openapi.IN_QUERY, description="Filtra por metadata_id", type=openapi.TYPE_STRING),
             openapi.Parameter("classe", openapi.IN_QUERY, description="Filtra por classe", type=openapi.TYPE_STRING),
+            openapi.Parameter("atributos", openapi.IN_QUERY, description="0 omite os atributos (jsons); padrão 1",
+                              type=openapi.TYPE_STRING, enum=["0", "1"]),
         ]
     )
+    @resposta_condicional
     def get(self, request):
         filtro_metadata = request.query_params.get("metadata_id", None)
         filtro_classe = request.query_params.get("classe", None)
+        if filtro_metadata:
+            filtro_metadata = unquote_plus(filtro_metadata)
+        if filtro_classe:
+            filtro_classe = unquote_plus(filtro_classe)
+        incluir_atributos = _incluir_atributos(request.query_params)
 
         try:
-            conn = psycopg2.connect(
-                dbname=ogr_importer.CONFIG_BANCO["dbname"],
-                user=ogr_importer.CONFIG_BANCO["user"],
-                password=ogr_importer.CONFIG_BANCO["password"],
-                host=ogr_importer.CONFIG_BANCO["host"],
-                port=ogr_importer.CONFIG_BANCO["port"],
+            ocultos = _remocoes_ativas()
+            catalogo = (
+                ProdutoGeoespacial.objects
+                .exclude(metadata_id__in=[m for m, c in ocultos if c is None])
+                .order_by("metadata_id")
             )
-            cursor = conn.cursor()
-
-            sql = f"""
-                SELECT metadata_id, classe, escala, data_do_produto, esquema,
-                       json_agg(json::json) AS jsons
-                FROM {ogr_importer.TABELA_GLOBAL}
-                WHERE 1=1
-            """
-            params = []
-
             if filtro_metadata:
-                sql += " AND metadata_id = %s"
-                params.append(unquote_plus(filtro_metadata))
+                catalogo = catalogo.filter(metadata_id=filtro_metadata)
             if filtro_classe:
-                sql += " AND classe = %s"
-                params.append(unquote_plus(filtro_classe))
-
-            sql += " GROUP BY metadata_id, classe, escala, data_do_produto, esquema ORDER BY metadata_id;"
-
-            cursor.execute(sql, params)
-            rows = cursor.fetchall()
+                catalogo = catalogo.filter(contagem_classes__has_key=filtro_classe)
 
             produtos = []
-            for row in rows:
-                produtos.append({
-                    "metadata_id": row[0],
-                    "classe": row[1],
-                    "escala": row[2],
-                    "data_do_produto": row[3],
-                    "esquema": row[4],
-                    "jsons": row[5]
-                })
+            for produto in catalogo:
+                for classe, quantidade in sorted((produto.contagem_classes or {}).items()):
+                    if filtro_classe and classe != filtro_classe:
+                        continue
+                    if (produto.metadata_id, classe) in ocultos:
+                        continue
+                    produtos.append({
+                        "metadata_id": produto.metadata_id,
+                        "classe": classe,
+                        "escala": produto.escala,
+                        "data_do_produto": produto.data_do_produto,
+                        "esquema": produto.esquema,
+                        "quantidade": quantidade,
+                    })
 
-            cursor.close()
-            conn.close()
+            if incluir_atributos and produtos:
+                conn = banco.conectar_leitura()
+                cursor = conn.cursor()
+                sql = f"""
+                    SELECT metadata_id, classe, jsonb_agg(json) AS jsons
+                    FROM {banco.TABELA_GEOMETRIAS}
+                    WHERE metadata_id = ANY(%s)
+                """
+                params = [sorted({produto["metadata_id"] for produto in produtos})]
+                if filtro_classe:
+                    sql += " AND classe = %s"
+                    params.append(filtro_classe)
+                sql += " GROUP BY metadata_id, classe;"
+                cursor.execute(sql, params)
+                jsons = {(metadata_id, classe): atributos for metadata_id, classe, atributos in cursor.fetchall()}
+                cursor.close()
+                conn.close()
+
+                for produto in produtos:
+                    produto["jsons"] = jsons.get((produto["metadata_id"], produto["classe"]), [])
 
             return Response(produtos)
 
         except Exception as e:
-            ogr_importer.safe_print(f"Erro ao listar produtos: {e}")
+            banco.safe_print(f"Erro ao listar produtos: {e}")
             return Response({"erro": f"Erro ao listar produtos: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-# ------------------------ LISTAR HISTÓRICO ------------------------
-class ListarHistoricoView(APIView):
+
+# ------------------------ RESUMO DE PRODUTOS ------------------------
+def _unir_bbox(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+
+
+class ResumoProdutosView(APIView):
+    @swagger_auto_schema(
+        operation_description=(
+            "Estatísticas pré-calculadas por produto: quantidade de feições, vértices, bytes "
+            "e bbox (EPSG:4326), no total e por classe e tipo de geometria. Lê apenas a "
+            "tabela de estatísticas mantida pelo importador e pelas remoções."
+        ),
+        manual_parameters=[
+            openapi.Parameter("metadata_id", openapi.IN_QUERY, description="Filtra por metadata_id", type=openapi.TYPE_STRING),
+            openapi.Parameter("classe", openapi.IN_QUERY, description="Filtra por classe", type=openapi.TYPE_STRING),
+        ]
+    )
+    @resposta_condicional
     def get(self, request):
+        sql = f"""
+            SELECT p.metadata_id, c.nome, e.tipo_geometria, e.quantidade, e.vertices, e.bytes,
+                   e.xmin, e.ymin, e.xmax, e.ymax
+            FROM {banco.TABELA_ESTATISTICAS} e
+            JOIN {banco.TABELA_PRODUTOS} p ON p.id = e.produto_id
+            JOIN {banco.TABELA_CLASSES} c ON c.id = e.classe_id
+            WHERE {banco.filtro_visivel("p", "c.nome")}
+        """
+        params = []
+        for campo, coluna in (("metadata_id", "p.metadata_id"), ("classe", "c.nome")):
+            if request.query_params.get(campo):
+                sql += f" AND {coluna} = %s"
+                params.append(unquote_plus(request.query_params[campo]))
+        sql += " ORDER BY p.metadata_id, c.nome, e.tipo_geometria;"
+
         try:
-            historico = HistoricoImportacaoExclusao.objects.all().order_by('-data_evento')[:200]
-            serializer = HistoricoImportacaoExclusaoSerializer(historico, many=True)
-            return Response(serializer.data)
+            conn = banco.conectar_leitura()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(sql, params)
+                linhas = cursor.fetchall()
+                cursor.close()
+            finally:
+                conn.close()
+
+            produtos = {}
+            for metadata_id, classe, tipo, quantidade, vertices, tamanho, *extensao in linhas:
+                bbox = None if extensao[0] is None else extensao
+                produto = produtos.setdefault(metadata_id, {
+                    "metadata_id": metadata_id, "quantidade": 0, "vertices": 0,
+                    "bytes": 0, "bbox": None, "classes": [],
+                })
+                produto["quantidade"] += quantidade
+                produto["vertices"] += vertices
+                produto["bytes"] += tamanho
+                produto["bbox"] = _unir_bbox(produto["bbox"], bbox)
+                produto["classes"].append({
+                    "classe": classe, "tipo_geometria": tipo, "quantidade": quantidade,
+                    "vertices": vertices, "bytes": tamanho, "bbox": bbox,
+                })
+            return Response(list(produtos.values()))
+
         except Exception as e:
-            ogr_importer.safe_print(f"Erro ao listar histórico: {e}")
-            return Response({"erro": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            banco.safe_print(f"Erro ao resumir produtos: {e}")
+            return Response({"erro": f"Erro ao resumir produtos: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class ApiRootView(APIView):
+# ------------------------ BUSCA ESPACIAL DE PRODUTOS ------------------------
+def _parse_bbox(valor):
+    """'minx,miny,maxx,maxy' -> tupla de floats; ValueError se inválido."""
+    partes = [float(p) for p in (valor or "").split(",")]
+    if len(partes) != 4:
+        raise ValueError("bbox deve ter 4 valores: minx,miny,maxx,maxy")
+    minx, miny, maxx, maxy = partes
+    if minx > maxx or miny > maxy:
+        raise ValueError("bbox com mínimo maior que máximo")
+    return minx, miny, maxx, maxy
+
+
+class BuscarProdutosView(APIView):
+    @swagger_auto_schema(
+        operation_description="Busca produtos cuja área mapeada intersecta o bbox informado (índice GiST de area_mapeada).",
+        manual_parameters=[
+            openapi.Parameter("bbox", openapi.IN_QUERY, description="minx,miny,maxx,maxy", type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter("srid", openapi.IN_QUERY, description="SRID do bbox (padrão 4326)", type=openapi.TYPE_INTEGER),
+        ]
+    )
     def get(self, request):
-        return Response({
-            "mensagem": "API Geodataimporter funcionando.",
-            "endpoints": {
-                "importar": "/api/importar/",
-                "remover": "/api/remover/{metadata_id}/",
-                "produtos": "/api/produtos/",
-                "historico-importacoes": "/api/historico-importacoes/"
-            }
+        try:
+            bbox = _parse_bbox(request.query_params.get("bbox"))
+            srid = int(request.query_params.get("srid", 4326))
+        except ValueError as e:
+            return Response({"erro": f"Parâmetros inválidos: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            area = Polygon.from_bbox(bbox)
+            area.srid = srid
+            if srid != 4326:
+                area.transform(4326)
+
+            produtos = (
+                ProdutoGeoespacial.objects
+                .filter(area_mapeada__intersects=area)
+                .exclude(metadata_id__in=[m for m, c in _remocoes_ativas() if c is None])
+                .order_by("metadata_id")
+            )
+            resultado = [{
+                "metadata_id": p.metadata_id,
+                "nome_arquivo": p.nome_arquivo,
+                "data_do_produto": p.data_do_produto,
+                "data_importacao": p.data_importacao,
+                "esquema": p.esquema,
+                "escala": p.escala,
+                "bbox": p.area_mapeada.extent if p.area_mapeada else None,
+            } for p in produtos]
+            return Response(resultado)
+        except Exception as e:
+            banco.safe_print(f"Erro na busca espacial de produtos: {e}")
+            return Response({"erro": f"Erro na busca espacial: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# ------------------------ EXPORTAR PRODUTO ------------------------
+EXPORTACAO_CHUNK = 1024 * 1024
+
+
+def _stream_arquivo_temporario(caminho, pasta_temporaria):
+    """Lê o arquivo em blocos fixos e apaga a pasta temporária ao final (ou se o cliente desistir)."""
+    try:
+        with open(caminho, "rb") as fh:
+            while True:
+                bloco = fh.read(EXPORTACAO_CHUNK)
+                if not bloco:
+                    break
+                yield bloco
+    finally:
+        shutil.rmtree(pasta_temporaria, ignore_errors=True)
+
+
+class ExportarProdutoView(APIView):
+    @swagger_auto_schema(
+        operation_description=(
+            "Exporta um produto com suas camadas originais (uma por classe) e atributos tipados. "
+            "gpkg: GeoPackage único; fgb: ZIP com um FlatGeobuf por classe."
+        ),
+        manual_parameters=[
+            openapi.Parameter("format", openapi.IN_QUERY, description="gpkg (padrão) ou fgb",
+                              type=openapi.TYPE_STRING, enum=list(banco.FORMATOS_EXPORTACAO)),
+        ]
+    )
+    def get(self, request, metadata_id):
+        formato = request.query_params.get("format", "gpkg").lower()
+        if formato not in banco.FORMATOS_EXPORTACAO:
+            return Response({"erro": f"Formato inválido: {formato}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if (not ProdutoGeoespacial.objects.filter(metadata_id=metadata_id).exists()
+                or (metadata_id, None) in _remocoes_ativas()):
+            return Response({"mensagem": f"Nenhuma feição encontrada para metadata_id '{metadata_id}'"},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        from . import ogr_importer  # GDAL só é carregado nas rotas que o usam
+
+        pasta_temporaria = tempfile.mkdtemp(prefix="exportacao_")
+        try:
+            caminho = ogr_importer.exportar_produto(metadata_id, formato, pasta_temporaria)
+        except Exception as e:
+            shutil.rmtree(pasta_temporaria, ignore_errors=True)
+            banco.safe_print(f"Erro ao exportar {metadata_id}: {e}")
+            return Response({"erro": f"Erro ao exportar: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if caminho is None:
+            shutil.rmtree(pasta_temporaria, ignore_errors=True)
+            return Response({"mensagem": f"Nenhuma feição encontrada para metadata_id '{metadata_id}'"},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        resposta = StreamingHttpResponse(
+            _stream_arquivo_temporario(caminho, pasta_temporaria),
+            content_type="application/zip" if caminho.endswith(".zip") else "application/geopackage+sqlite3",
+        )
+        resposta["Content-Length"] = str(os.path.getsize(caminho))
+        resposta["Content-Disposition"] = f'attachment; filename="{os.path.basename(caminho)}"'
+        return resposta
+
+# ------------------------ CONSULTA ESPACIAL DE FEIÇÕES ------------------------
+FEICOES_LIMITE_PADRAO = 1000
+FEICOES_LIMITE_MAXIMO = 10000
+
+
+def _parse_paginacao(request):
+    """Lê 'limite' e 'apos' (último ogc_fid da página anterior) da query string."""
+    limite = int(request.GET.get("limite", FEICOES_LIMITE_PADRAO))
+    if limite < 1:
+        raise ValueError("limite deve ser positivo")
+    apos = int(request.GET.get("apos", 0))
+    return min(limite, FEICOES_LIMITE_MAXIMO), apos
+
+
+def _filtros_feicoes(request):
+    """
+    Filtros de /api/feicoes/ (bbox, classe, grupo, metadata_id) já paginados:
+    devolve (limite, srid_saida, where, params); ValueError se inválidos.
+    """
+    limite, apos = _parse_paginacao(request)
+    srid_saida = int(request.GET.get("srid", 4326))
+    where, params = ["g.ogc_fid > %s", banco.filtro_visivel("g")], [apos]
+
+    bbox = request.GET.get("bbox")
+    if bbox:
+        minx, miny, maxx, maxy = _parse_bbox(bbox)
+        bbox_srid = int(request.GET.get("bbox_srid", 4326))
+        area = "ST_Transform(ST_MakeEnvelope(%s, %s, %s, %s, %s), 3857)"
+        where.append(f"g.wkb_geometry && {area} AND ST_Intersects(g.wkb_geometry, {area})")
+        params += [minx, miny, maxx, maxy, bbox_srid] * 2
+
+    for parametro, coluna in (("classe", "g.classe"),
+                              ("grupo", "g.graphic_representation_group"),
+                              ("metadata_id", "g.metadata_id")):
+        valor = request.GET.get(parametro)
+        if valor:
+            where.append(f"{coluna} = %s")
+            params.append(unquote_plus(valor))
+    return limite, srid_saida, where, params
+
+
+def _sql_feicoes_geojson(where):
+    """Consulta paginada por chave (ogc_fid > apos ORDER BY ogc_fid LIMIT n); parâmetros: srid, filtros, limite."""
+    return f"""
+        SELECT g.ogc_fid, g.classe, g.metadata_id, g.graphic_representation_group,
+               g.json::text, ST_AsGeoJSON(ST_Transform(g.wkb_geometry, %s))
+        FROM {banco.TABELA_GEOMETRIAS} g
+        WHERE {" AND ".join(where)}
+        ORDER BY g.ogc_fid
+        LIMIT %s
+    """
+
+
+def _feicao_geojson(linha, primeira):
+    """Uma Feature da FeatureCollection, montada como texto (atributos e geometria já vêm em JSON)."""
+    fid, classe, metadata_id, grupo, atributos, geometria = linha
+    propriedades = (
+        f'{{"classe":{json.dumps(classe, ensure_ascii=False)},'
+        f'"metadata_id":{json.dumps(metadata_id, ensure_ascii=False)},'
+        f'"graphic_representation_group":{json.dumps(grupo, ensure_ascii=False)},'
+        f'"atributos":{atributos or "null"}}}'
+    )
+    return (
+        f'{"" if primeira else ","}{{"type":"Feature","id":{fid},'
+        f'"geometry":{geometria or "null"},"properties":{propriedades}}}'
+    ).encode("utf-8")
+
+
+def _rodape_geojson(request, total, limite, ultimo):
+    """Fecha a FeatureCollection com numberReturned e o link da próxima página."""
+    rodape = {"numberReturned": total, "proximo": None, "links": []}
+    if total == limite:
+        query = request.GET.copy()
+        query["apos"] = ultimo
+        rodape["proximo"] = ultimo
+        rodape["links"].append({
+            "rel": "next",
+            "type": "application/geo+json",
+            "href": request.build_absolute_uri(f"{request.path}?{query.urlencode()}"),
         })
+    return ("]," + json.dumps(rodape)[1:]).encode("utf-8")
+
+
+def _stream_feicoes_geojson(request, where, params, limite, srid_saida):
+    """
+    Executa a consulta paginada por chave (ogc_fid > apos ORDER BY ogc_fid LIMIT n)
+    num cursor do lado do servidor e devolve um StreamingHttpResponse com a
+    FeatureCollection montada linha a linha, sem materializar a página em memória.
+    Os atributos JSONB e a geometria (ST_AsGeoJSON) são copiados como texto.
+    """
+    conn = banco.conectar_leitura()
+    cursor = conn.cursor(name="feicoes_geojson")
+    cursor.itersize = 1000
+    try:
+        cursor.execute(_sql_feicoes_geojson(where), [srid_saida, *params, limite])
+    except Exception:
+        conn.close()
+        raise
+
+    def gerar():
+        ultimo = None
+        total = 0
+        try:
+            yield '{"type":"FeatureCollection","features":['.encode("utf-8")
+            for linha in cursor:
+                yield _feicao_geojson(linha, primeira=not total)
+                ultimo = linha[0]
+                total += 1
+            yield _rodape_geojson(request, total, limite, ultimo)
+        except Exception as e:
+            banco.safe_print(f"Erro no streaming de feições: {e}")
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    return StreamingHttpResponse(gerar(), content_type="application/geo+json")
+
+
+class ConsultarFeicoesView(APIView):
+    @swagger_auto_schema(
+        operation_description=(
+            "Consulta feições por bbox (&& + ST_Intersects sobre o índice GiST), classe e grupo de "
+            "representação. Paginação por chave: use o 'proximo' da resposta como 'apos'."
+        ),
+        manual_parameters=[
+            openapi.Parameter("bbox", openapi.IN_QUERY, description="minx,miny,maxx,maxy", type=openapi.TYPE_STRING),
+            openapi.Parameter("bbox_srid", openapi.IN_QUERY, description="SRID do bbox (padrão 4326)", type=openapi.TYPE_INTEGER),
+            openapi.Parameter("classe", openapi.IN_QUERY, description="Filtra por classe", type=openapi.TYPE_STRING),
+            openapi.Parameter("grupo", openapi.IN_QUERY, description="Filtra por graphic_representation_group", type=openapi.TYPE_STRING),
+            openapi.Parameter("metadata_id", openapi.IN_QUERY, description="Filtra por metadata_id", type=openapi.TYPE_STRING),
+            openapi.Parameter("srid", openapi.IN_QUERY, description="SRID da geometria de saída (padrão 4326)", type=openapi.TYPE_INTEGER),
+            openapi.Parameter("limite", openapi.IN_QUERY, description=f"Feições por página (máx. {FEICOES_LIMITE_MAXIMO})", type=openapi.TYPE_INTEGER),
+            openapi.Parameter("apos", openapi.IN_QUERY, description="ogc_fid da última feição da página anterior", type=openapi.TYPE_INTEGER),
+        ]
+    )
+    def get(self, request):
+        try:
+            limite, srid_saida, where, params = _filtros_feicoes(request)
+        except ValueError as e:
+            return Response({"erro": f"Parâmetros inválidos: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            return _stream_feicoes_geojson(request, where, params, limite, srid_saida)
+        except Exception as e:
+            banco.safe_print(f"Erro ao consultar feições: {e}")
+            return Response({"erro": f"Erro ao consultar feições: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# ------------------------ CONSULTA POR ATRIBUTOS ------------------------
+class ConsultarFeicoesAtributosView(APIView):
+    @swagger_auto_schema(
+        operation_description=(
+            "Consulta feições pelos atributos JSONB usando o índice GIN (jsonb_path_ops). "
+            "'contem' usa json @> (ex.: {\"revestimento\": \"Pavimentado\"}); 'jsonpath' usa json @@ "
+            "(ex.: $.nrfaixas > 2). Paginação por chave como em /api/feicoes/. "
+            "Com explicar=1, devolve o plano da consulta em vez das feições."
+        ),
+        manual_parameters=[
+            openapi.Parameter("contem", openapi.IN_QUERY, description="Objeto JSON que as feições devem conter", type=openapi.TYPE_STRING),
+            openapi.Parameter("jsonpath", openapi.IN_QUERY, description="Predicado SQL/JSON path", type=openapi.TYPE_STRING),
+            openapi.Parameter("classe", openapi.IN_QUERY, description="Filtra por classe", type=openapi.TYPE_STRING),
+            openapi.Parameter("metadata_id", openapi.IN_QUERY, description="Filtra por metadata_id", type=openapi.TYPE_STRING),
+            openapi.Parameter("srid", openapi.IN_QUERY, description="SRID da geometria de saída (padrão 4326)", type=openapi.TYPE_INTEGER),
+            openapi.Parameter("limite", openapi.IN_QUERY, description=f"Feições por página (máx. {FEICOES_LIMITE_MAXIMO})", type=openapi.TYPE_INTEGER),
+            openapi.Parameter("apos", openapi.IN_QUERY, description="ogc_fid da última feição da página anterior", type=openapi.TYPE_INTEGER),
+            openapi.Parameter("explicar", openapi.IN_QUERY, description="1 para retornar o EXPLAIN da consulta", type=openapi.TYPE_BOOLEAN),
+        ]
+    )
+    def get(self, request):
+        contem = request.query_params.get("contem")
+        jsonpath = request.query_params.get("jsonpath")
+        if not contem and not jsonpath:
+            return Response({"erro": "Informe 'contem' e/ou 'jsonpath'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limite, apos = _parse_paginacao(request)
+            srid_saida = int(request.query_params.get("srid", 4326))
+            where, params = ["g.ogc_fid > %s", banco.filtro_visivel("g")], [apos]
+
+            if contem:
+                filtro = json.loads(contem)
+                if not isinstance(filtro, dict):
+                    raise ValueError("'contem' deve ser um objeto JSON")
+                where.append("g.json @> %s::jsonb")
+                params.append(json.dumps(filtro, ensure_ascii=False))
+            if jsonpath:
+                where.append("g.json @@ %s::jsonpath")
+                params.append(jsonpath)
+        except ValueError as e:
+            return Response({"erro": f"Parâmetros inválidos: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        for parametro, coluna in (("classe", "g.classe"), ("metadata_id", "g.metadata_id")):
+            valor = request.query_params.get(parametro)
+            if valor:
+                where.append(f"{coluna} = %s")
+                params.append(unquote_plus(valor))
+
+        try:
+            if request.query_params.get("explicar") in ("1", "true", "True"):
+                conn = banco.conectar_leitura()
+                cursor = conn.cursor()
+                cursor.execute(f"""
+                    EXPLAIN (FORMAT JSON)
+                    SELECT g.ogc_fid FROM {banco.TABELA_GEOMETRIAS} g
+                    WHERE {" AND ".join(where)}
+                    ORDER BY g.ogc_fid
+                    LIMIT %s
+                """, [*params, limite])
+                plano = cursor.fetchone()[0]
+                cursor.close()
+                conn.close()
+                return Response(plano)
+
+            return _stream_feicoes_geojson(request, where, params, limite, srid_saida)
+        except (psycopg2.DataError, psycopg2.ProgrammingError) as e:
+            return Response({"erro": f"Filtro inválido: {str(e).strip()}"}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            banco.safe_print(f"Erro ao consultar atributos: {e}")
+            return Response({"erro": f"Erro ao consultar atributos: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 
 # ------------------------ BULK UPDATE REPRESENTAÇÕES ------------------------
 class RepresentacaoGraficaBulkUpdateView(APIView):
@@ -376,6 +1058,7 @@ class ListarGruposRepresentacaoView(APIView):
         operation_description="Lista todos os grupos de representação gráfica cadastrados",
         responses={200: "Lista de grupos de representação"}
     )
+    @resposta_condicional
     def get(self, request):
         try:
             registros = RepresentacaoGrafica.objects.all().values(
@@ -383,5 +1066,5 @@ class ListarGruposRepresentacaoView(APIView):
             )
             return Response(list(registros))
         except Exception as e:
-            ogr_importer.safe_print(f"Erro ao listar grupos de representação: {e}")
+            banco.safe_print(f"Erro ao listar grupos de representação: {e}")
             return Response({"erro": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,249 @@
+"""
+Variantes assíncronas (ASGI) das rotas de leitura, em /api/async/.
+
+Usam o psycopg 3 com um AsyncConnectionPool próprio (réplica de leitura quando
+configurada, com fallback para o primário, como banco.conectar_leitura) e
+devolvem as respostas em streaming a partir de cursores do lado do servidor:
+sob uvicorn (SERVIDOR=asgi), uma listagem lenta só ocupa o event loop enquanto
+há linhas para enviar, e um único processo atende muitas ao mesmo tempo.
+Os parâmetros e o formato das respostas são os das rotas síncronas.
+"""
+import asyncio
+import json
+import os
+from contextlib import AsyncExitStack, asynccontextmanager
+from urllib.parse import unquote_plus
+
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+
+from . import banco
+from .views import (
+    _cabecalhos_paginacao, _feicao_geojson, _filtros_feicoes, _incluir_atributos, _parse_historico,
+    _rodape_geojson, _sql_feicoes_geojson,
+)
+
+ASYNC_POOL_MIN = int(os.getenv("ASYNC_POOL_MIN", "1"))
+ASYNC_POOL_MAX = int(os.getenv("ASYNC_POOL_MAX", "20"))
+# Linhas trazidas do cursor do servidor por ida ao banco
+ASYNC_LOTE = int(os.getenv("ASYNC_LOTE", "1000"))
+
+_pools = {}  # "primario" | "replica" -> (event loop, pool)
+
+
+# ------------------------ CONEXÕES ------------------------
+def _conninfo(config):
+    # Datas no mesmo fuso das rotas síncronas (USE_TZ, UTC)
+    return make_conninfo(options="-c TimeZone=UTC", **{chave: valor for chave, valor in config.items() if valor})
+
+
+async def _somente_leitura(conn):
+    await conn.set_read_only(True)
+
+
+async def _pool(nome):
+    """
+    Pool do event loop atual, aberto na primeira requisição. Fora do loop em que
+    foi criado (runserver/WSGI roda cada view assíncrona num loop novo) devolve
+    None e a requisição usa uma conexão avulsa.
+    """
+    loop = asyncio.get_running_loop()
+    item = _pools.get(nome)
+    if item is None:
+        config = banco.CONFIG_REPLICA if nome == "replica" else banco.CONFIG_BANCO
+        pool = AsyncConnectionPool(
+            _conninfo(config), min_size=ASYNC_POOL_MIN, max_size=ASYNC_POOL_MAX,
+            configure=_somente_leitura, name=f"leitura-{nome}", open=False,
+            kwargs={"connect_timeout": banco.REPLICA_TIMEOUT} if nome == "replica" else None,
+        )
+        _pools[nome] = item = (loop, pool)
+        await pool.open(wait=False)
+    return item[1] if item[0] is loop else None
+
+
+@asynccontextmanager
+async def _conexao_avulsa(config, **kwargs):
+    conn = await psycopg.AsyncConnection.connect(_conninfo(config), **kwargs)
+    try:
+        await conn.set_read_only(True)
+        yield conn
+    finally:
+        await conn.close()
+
+
+async def _abrir(nome):
+    """Contexto que entrega uma conexão do pool (ou avulsa) do primário ou da réplica."""
+    pool = await _pool(nome)
+    if nome == "replica":
+        if pool is None:
+            return _conexao_avulsa(banco.CONFIG_REPLICA, connect_timeout=banco.REPLICA_TIMEOUT)
+        return pool.connection(timeout=banco.REPLICA_TIMEOUT)
+    return _conexao_avulsa(banco.CONFIG_BANCO) if pool is None else pool.connection()
+
+
+@asynccontextmanager
+async def conexao_leitura():
+    """Conexão somente leitura: réplica quando no ar, senão o primário."""
+    async with AsyncExitStack() as pilha:
+        conn = None
+        if banco.replica_disponivel():
+            try:
+                conn = await pilha.enter_async_context(await _abrir("replica"))
+            except (PoolTimeout, psycopg.OperationalError) as e:
+                banco.marcar_replica_indisponivel(e)
+        if conn is None:
+            conn = await pilha.enter_async_context(await _abrir("primario"))
+        yield conn
+
+
+async def _linhas(sql, params, nome):
+    """Gerador assíncrono das linhas de um cursor do lado do servidor."""
+    async with conexao_leitura() as conn:
+        async with conn.transaction():
+            async with conn.cursor(name=nome) as cursor:
+                cursor.itersize = ASYNC_LOTE
+                await cursor.execute(sql, params)
+                async for linha in cursor:
+                    yield linha
+
+
+def _erro(mensagem, status=400):
+    return JsonResponse({"erro": mensagem}, status=status)
+
+
+# ------------------------ LISTAR PRODUTOS ------------------------
+async def listar_produtos(request):
+    """Mesma resposta de /api/produtos/ (uma linha por produto e classe), em streaming."""
+    filtros, params = [banco.filtro_visivel("c", "k.classe")], []
+    metadata_id = request.GET.get("metadata_id")
+    classe = request.GET.get("classe")
+    if metadata_id:
+        filtros.append("c.metadata_id = %s")
+        params.append(unquote_plus(metadata_id))
+    if classe:
+        filtros.append("k.classe = %s")
+        params.append(unquote_plus(classe))
+
+    # Atributos por padrão; atributos=0 os omite, como na rota síncrona
+    jsons = "NULL"
+    if _incluir_atributos(request.GET):
+        jsons = f"""(
+            SELECT coalesce(jsonb_agg(g.json), '[]'::jsonb)::text FROM {banco.TABELA_GEOMETRIAS} g
+            WHERE g.metadata_id = c.metadata_id AND g.classe = k.classe
+        )"""
+    sql = f"""
+        SELECT c.metadata_id, k.classe, c.escala, c.data_do_produto, c.esquema, k.quantidade::bigint,
+               {jsons}
+        FROM {banco.TABELA_CATALOGO} c
+        CROSS JOIN LATERAL jsonb_each_text(c.contagem_classes) AS k(classe, quantidade)
+        WHERE {" AND ".join(filtros)}
+        ORDER BY c.metadata_id, k.classe
+    """
+
+    async def gerar():
+        yield b"["
+        primeira = True
+        try:
+            async for metadata_id, classe, escala, data, esquema, quantidade, atributos in _linhas(sql, params, "produtos_async"):
+                produto = json.dumps({
+                    "metadata_id": metadata_id, "classe": classe, "escala": escala,
+                    "data_do_produto": data, "esquema": esquema, "quantidade": quantidade,
+                }, cls=DjangoJSONEncoder, ensure_ascii=False)
+                if atributos is not None:
+                    produto = f'{produto[:-1]},"jsons":{atributos}}}'
+                yield ("" if primeira else ",").encode("utf-8") + produto.encode("utf-8")
+                primeira = False
+        except Exception as e:
+            banco.safe_print(f"Erro ao listar produtos (async): {e}")
+            raise
+        yield b"]"
+
+    return StreamingHttpResponse(gerar(), content_type="application/json")
+
+
+# ------------------------ HISTÓRICO ------------------------
+async def listar_historico(request):
+    """Mesma resposta e paginação por chave de /api/historico/."""
+    try:
+        limite, campos, intervalo, cursor = _parse_historico(request.GET)
+    except ValueError as e:
+        return _erro(str(e))
+
+    filtros, params = ["true"], []
+    for campo, valor in campos.items():
+        filtros.append(f"h.{campo} = %s")
+        params.append(valor)
+    if "desde" in intervalo:
+        filtros.append("h.data_evento >= %s")
+        params.append(intervalo["desde"])
+    if "ate" in intervalo:
+        filtros.append("h.data_evento < %s")
+        params.append(intervalo["ate"])
+    if cursor:
+        filtros.append("(h.data_evento, h.id) < (%s, %s)")
+        params += list(cursor)
+
+    sql = f"""
+        SELECT h.id, h.metadata_id, h.classe, h.acao, h.data_evento, u.username, h.detalhes,
+               h.quantidade_feicoes, h.bytes, h.duracao_s, h.feicoes_por_s, h.tempos_etapas, h.worker
+        FROM importservice_historicoimportacaoexclusao h
+        LEFT JOIN auth_user u ON u.id = h.usuario_id
+        WHERE {" AND ".join(filtros)}
+        ORDER BY h.data_evento DESC, h.id DESC
+        LIMIT %s
+    """
+    try:
+        campos_saida = ("id", "metadata_id", "classe", "acao", "data_evento", "usuario", "detalhes",
+                        "quantidade_feicoes", "bytes", "duracao_s", "feicoes_por_s", "tempos_etapas", "worker")
+        pagina = [dict(zip(campos_saida, linha))
+                  async for linha in _linhas(sql, [*params, limite + 1], "historico_async")]
+    except Exception as e:
+        banco.safe_print(f"Erro ao listar histórico (async): {e}")
+        return _erro(str(e), status=500)
+
+    proximo = None
+    if len(pagina) > limite:
+        ultimo = pagina[limite - 1]
+        proximo = f"{ultimo['data_evento'].isoformat()}|{ultimo['id']}"
+    return JsonResponse(pagina[:limite], safe=False, encoder=DjangoJSONEncoder,
+                        headers=_cabecalhos_paginacao(request, proximo))
+
+
+# ------------------------ LISTAR GRUPOS DE REPRESENTAÇÃO ------------------------
+async def listar_representacoes(request):
+    sql = "SELECT esquema, classe, grupo_representacao FROM importservice_representacaografica ORDER BY id"
+    try:
+        registros = [{"esquema": e, "classe": c, "grupo_representacao": g}
+                     async for e, c, g in _linhas(sql, [], "representacoes_async")]
+    except Exception as e:
+        banco.safe_print(f"Erro ao listar grupos de representação (async): {e}")
+        return _erro(str(e), status=500)
+    return JsonResponse(registros, safe=False)
+
+
+# ------------------------ CONSULTA ESPACIAL DE FEIÇÕES ------------------------
+async def consultar_feicoes(request):
+    """Mesma FeatureCollection paginada de /api/feicoes/, em streaming."""
+    try:
+        limite, srid_saida, where, params = _filtros_feicoes(request)
+    except ValueError as e:
+        return _erro(f"Parâmetros inválidos: {e}")
+
+    async def gerar():
+        ultimo = None
+        total = 0
+        try:
+            yield b'{"type":"FeatureCollection","features":['
+            async for linha in _linhas(_sql_feicoes_geojson(where), [srid_saida, *params, limite], "feicoes_async"):
+                yield _feicao_geojson(linha, primeira=not total)
+                ultimo = linha[0]
+                total += 1
+            yield _rodape_geojson(request, total, limite, ultimo)
+        except Exception as e:
+            banco.safe_print(f"Erro no streaming de feições (async): {e}")
+            raise
+
+    return StreamingHttpResponse(gerar(), content_type="application/geo+json")